@@ -0,0 +1,310 @@
+# benchmarks/microbench.py
+"""Offline, in-process microbenchmarks for the hot paths, with a regression gate.
+
+Unlike evaluation.py (HTTP round trips against a running server), this calls
+the functions directly against synthetic ledgers in a temp directory. No
+network is needed: the embedding model is replaced by a deterministic
+hashing stub, so classify_intent measures everything around the forward pass.
+
+    python -m benchmarks.microbench                      # run, write results.json
+    python -m benchmarks.microbench --save-baseline      # ...and store it as the baseline
+    python -m benchmarks.microbench --sizes 1000,10000 --tolerance 0.3
+
+Each benchmark is timed in `repeat` samples of enough loops to last at least
+MIN_SAMPLE_S; the median per-call time is compared with the baseline and the
+run exits 1 if any benchmark is more than `tolerance` slower.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Before any tools import: no model download, no background embedding worker
+os.environ.setdefault("EMBEDDING_SERVICE_SOCKET", os.path.join(tempfile.gettempdir(), "pfc-bench-unused.sock"))
+os.environ["SEMANTIC_INDEX"] = "0"
+os.environ["COLUMNAR_BACKEND"] = "0"
+
+import numpy as np
+
+from utils import db_utils
+
+BENCH_DIR = Path(__file__).parent
+RESULTS_PATH = BENCH_DIR / "results.json"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_TOLERANCE = 0.25
+MIN_SAMPLE_S = 0.02
+
+CATEGORIES = ["Food", "Transport", "Shopping", "Rent", "Travel", "Bills", "Other"]
+MERCHANTS = ["Zomato order", "Swiggy dinner", "Uber trip", "Ola ride", "Amazon purchase", "Flipkart order",
+             "Monthly rent", "Flight to Goa", "Electricity bill", "Grocery run", "Coffee"]
+QUERIES = [
+    "Show top 3 expense categories this month",
+    "Compare this month and last month's expenses",
+    "How much did I spend in September 2025?",
+    "Show my savings summary",
+    "Predict my next month's expenses",
+    "Show my total income this month",
+    "What did I spend on food in 2025-03",
+    "last 10 transactions",
+]
+
+
+class StubModel:
+    """Deterministic bag-of-words hashing encoder with MiniLM's output shape."""
+
+    dim = 384
+
+    def encode(self, texts):
+        single = isinstance(texts, str)
+        out = np.zeros((1 if single else len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate([texts] if single else texts):
+            for word in text.lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                out[i, h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        return out[0] if single else out
+
+
+# --- Synthetic data ---
+def build_ledger(n_expenses, directory, seed=7):
+    """Fresh DB in `directory` with `n_expenses` expenses spread over ~2 years, monthly income and budgets."""
+    rng = random.Random(seed)
+    db_utils.DB_PATH = os.path.join(directory, "finance.db")
+    db_utils.init_schema()
+    first = date.today() - timedelta(days=730)
+    batch = []
+    for i in range(n_expenses):
+        batch.append((rng.choice(CATEGORIES), round(rng.uniform(20, 4000), 2),
+                      (first + timedelta(days=rng.randrange(731))).isoformat(), f"{rng.choice(MERCHANTS)} {i}"))
+        if len(batch) == 5000:
+            db_utils.insert_expenses_batch(batch)
+            batch = []
+    if batch:
+        db_utils.insert_expenses_batch(batch)
+    db_utils.insert_income_batch([
+        ("Salary", 95000.0, (first + timedelta(days=30 * m)).isoformat(), f"salary {m}") for m in range(25)
+    ])
+    conn = db_utils.get_connection()
+    conn.executemany("INSERT INTO budgets (category, limit_amount, period, start_date) VALUES (?, ?, 'monthly', ?)",
+                     [(c, 20000.0, first.isoformat()) for c in CATEGORIES])
+    conn.commit()
+    conn.close()
+    return db_utils.DB_PATH
+
+
+# --- Timing ---
+def time_call(fn, repeat):
+    """Median and min seconds per call over `repeat` auto-sized samples."""
+    fn()   # warm caches and lazy imports
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= MIN_SAMPLE_S or loops >= 1 << 16:
+            break
+        loops *= 2 if elapsed * 4 >= MIN_SAMPLE_S else 8
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - t0) / loops)
+    return {"median_us": round(statistics.median(samples) * 1e6, 2),
+            "min_us": round(min(samples) * 1e6, 2), "loops": loops, "repeat": repeat}
+
+
+def _size_label(n):
+    return f"{n // 1000}k" if n >= 1000 else str(n)
+
+
+# --- Benchmark definitions ---
+def parser_benchmarks():
+    from tools import nlq_manager as nlq
+    from tools.expense_manager import categorize
+
+    descriptions = [f"{m} #{i}" for i, m in enumerate(MERCHANTS * 10)]
+    return {
+        "categorize": lambda: [categorize(d) for d in descriptions],
+        "detect_limit": lambda: [nlq._detect_limit(q) for q in QUERIES],
+        "detect_month": lambda: [nlq._detect_month(q) for q in QUERIES],
+        "detect_category": lambda: [nlq._detect_category(q) for q in QUERIES],
+        "detect_income_or_expense": lambda: [nlq._detect_income_or_expense(q) for q in QUERIES],
+        "classify_intent[stub]": lambda: [nlq.classify_intent(q) for q in QUERIES],
+    }
+
+
+HANDLER_NAMES = [
+    "_top_expense_categories", "_monthly_expense_summary", "_income_vs_expense", "_budget_vs_actual",
+    "_recent_transactions", "_savings_summary", "_expense_breakdown", "_monthly_income_summary",
+    "_compare_monthly_expenses", "_predict_future_expenses",
+]
+
+
+def handler_benchmarks(size):
+    from tools import nlq_manager as nlq
+
+    today = date.today()
+    month_start = today.replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    params = {"limit": 5, "date_range": (month_start.isoformat(), month_end.isoformat()),
+              "category": "Food", "type": "expense"}
+    benches = {}
+    for name in HANDLER_NAMES:
+        handler = getattr(nlq, name, None)
+        # A renamed or removed handler is reported as missing rather than silently dropped
+        benches[f"nlq.{name}[{_size_label(size)}]"] = (lambda h=handler: h(dict(params))) if handler else None
+    return benches
+
+
+def db_benchmarks(size):
+    rng = random.Random(size)
+    counter = [0]
+
+    def insert_batch(n):
+        def run():
+            counter[0] += 1
+            day = (date.today() - timedelta(days=rng.randrange(365))).isoformat()
+            db_utils.insert_expenses_batch([
+                (rng.choice(CATEGORIES), round(rng.uniform(20, 4000), 2), day, f"bench {counter[0]}-{i}")
+                for i in range(n)
+            ])
+        return run
+
+    label = _size_label(size)
+    return {
+        f"db.insert_expenses_batch[1 row, {label}]": insert_batch(1),
+        f"db.insert_expenses_batch[100 rows, {label}]": insert_batch(100),
+        f"db.fetch_expenses[50, {label}]": lambda: db_utils.fetch_expenses(50),
+        f"db.fetch_expenses[1000 columns, {label}]": lambda: db_utils.fetch_expenses(1000, as_columns=True),
+        f"db.fetch_income[50, {label}]": lambda: db_utils.fetch_income(50),
+        f"db.get_top_categories[{label}]": lambda: db_utils.get_top_categories(5),
+        f"db.get_expense_trends[{label}]": lambda: db_utils.get_expense_trends(),
+    }
+
+
+def run_suite(sizes=DEFAULT_SIZES, repeat=7, only=None, log=print):
+    from tools import nlq_manager as nlq
+
+    nlq._model = StubModel()
+    nlq._intent_embeddings = None
+
+    results, missing = {}, []
+
+    def run(benches, size=None):
+        for name, fn in benches.items():
+            if only and only not in name:
+                continue
+            if fn is None:
+                missing.append(name)
+                log(f"{name:55s} {'MISSING':>15s}")
+                continue
+            results[name] = {**time_call(fn, repeat), "size": size}
+            log(f"{name:55s} {results[name]['median_us']:>12.1f} us")
+
+    run(parser_benchmarks())
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="pfc-bench-") as tmp:
+            t0 = time.perf_counter()
+            build_ledger(size, tmp)
+            log(f"-- ledger with {size} expenses built in {time.perf_counter() - t0:.1f}s")
+            # Read paths first: the insert benchmarks grow the ledger
+            run(handler_benchmarks(size), size)
+            run(db_benchmarks(size), size)
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": list(sizes),
+        "only": only,
+        "benchmarks": results,
+        "missing": missing,
+    }
+
+
+# --- Regression gate ---
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Per-benchmark ratio against the baseline; regressions are ratio > 1 + tolerance.
+
+    Baseline benchmarks that this run selected (same --only filter and ledger size) but did not
+    produce, and handlers the suite could not find, are reported as missing and fail the gate too.
+    """
+    rows, regressions = [], []
+    only = results.get("only")
+    missing = list(results.get("missing", []))
+    for name, base in baseline.get("benchmarks", {}).items():
+        selected = (not only or only in name) and base.get("size") in (None, *results["sizes"])
+        if selected and name not in results["benchmarks"] and name not in missing:
+            missing.append(name)
+    for name in missing:
+        rows.append({"name": name, "status": "missing"})
+    for name, current in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new"})
+            continue
+        ratio = current["median_us"] / base["median_us"] if base["median_us"] else 1.0
+        status = "regressed" if ratio > 1 + tolerance else ("improved" if ratio < 1 - tolerance else "ok")
+        rows.append({"name": name, "baseline_us": base["median_us"], "current_us": current["median_us"],
+                     "ratio": round(ratio, 3), "status": status})
+        if status == "regressed":
+            regressions.append(name)
+    return {"tolerance": tolerance, "regressions": regressions, "missing": missing, "comparison": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks with a regression gate")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated ledger sizes (expense rows)")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--only", default=None, help="run benchmarks whose name contains this")
+    parser.add_argument("--output", default=str(RESULTS_PATH))
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown before failing, as a fraction (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run_suite(sizes, args.repeat, args.only)
+
+    baseline_path = Path(args.baseline)
+    exit_code = 0
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {baseline_path}")
+    elif baseline_path.exists():
+        gate = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+        results["gate"] = gate
+        for row in gate["comparison"]:
+            if row["status"] != "ok":
+                print(f"{row['status'].upper():10s} {row['name']}"
+                      + (f"  {row['baseline_us']} -> {row['current_us']} us (x{row['ratio']})" if "ratio" in row else ""))
+        if gate["regressions"]:
+            print(f"{len(gate['regressions'])} benchmark(s) regressed by more than {args.tolerance:.0%}")
+            exit_code = 1
+        if gate["missing"]:
+            print(f"{len(gate['missing'])} benchmark(s) missing from this run")
+            exit_code = 1
+    else:
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+    if results["missing"] and "gate" not in results:
+        print(f"{len(results['missing'])} benchmark(s) missing from this run: {', '.join(results['missing'])}")
+        exit_code = 1
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@
 import streamlit as st
 import requests
 import pandas as pd
+import threading
+import time
 from urllib.parse import urljoin
 
 BASE_URL = "http://127.0.0.1:8000"
@@ -48,6 +50,74 @@ for item in reversed(st.session_state.chat_history[-10:]):
 
 # rest of dashboard content...
 
+# --- Live panels ---
+# A background thread follows /events/stream and bumps a version per panel;
+# each panel's fetch is cached on its version, so a rerun only refetches the
+# panels whose data actually changed.
+PANEL_EVENTS = {
+    "transaction": ["recent"],
+    "aggregates": ["month_to_date"],
+    "budget_alert": ["alerts"],
+    "resync": ["recent", "month_to_date", "alerts"],
+}
+
+@st.cache_resource
+def _panel_versions():
+    versions = {"recent": 0, "month_to_date": 0, "alerts": 0}
+
+    def follow():
+        while True:
+            try:
+                with requests.get(urljoin(BASE_URL, "events/stream"), stream=True, timeout=(5, 60)) as resp:
+                    event = None
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if line and line.startswith("event:"):
+                            event = line.split(":", 1)[1].strip()
+                        elif not line and event:
+                            for panel in PANEL_EVENTS.get(event, []):
+                                versions[panel] += 1
+                            event = None
+            except Exception:
+                time.sleep(5)
+
+    threading.Thread(target=follow, daemon=True).start()
+    return versions
+
+@st.cache_data(max_entries=32)
+def _fetch_panel(path, version):
+    resp = requests.get(urljoin(BASE_URL, path), timeout=10)
+    return resp.json() if resp.status_code == 200 else None
+
+def _render_live_panels():
+    versions = _panel_versions()
+    today = pd.Timestamp.today()
+    month_start = today.replace(day=1).strftime("%Y-%m-%d")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Month to date")
+        mtd = _fetch_panel(f"ledger/range?start={month_start}&end={today:%Y-%m-%d}", versions["month_to_date"])
+        if mtd:
+            st.metric("Expenses", f"₹{mtd['expenses']:.2f}")
+            st.metric("Income", f"₹{mtd['income']:.2f}")
+    with col2:
+        st.subheader("Budget alerts")
+        alerts = _fetch_panel("budget/alerts?limit=5", versions["alerts"])
+        for alert in alerts or []:
+            st.warning(f"{alert['category']}: ₹{alert['spent']:.2f} of ₹{alert['limit_amount']:.2f} "
+                       f"({alert['threshold'] * 100:.0f}%)")
+
+    st.subheader("Recent Expenses")
+    recent = _fetch_panel("expenses/list?limit=10", versions["recent"])
+    if recent:
+        st.table(recent)
+
+if hasattr(st, "fragment"):
+    # Re-run just this block every few seconds; unchanged panels hit the cache
+    st.fragment(run_every=3)(_render_live_panels)()
+else:
+    _render_live_panels()
+
 
 
 
@@ -1,7 +1,16 @@
-from fastapi import FastAPI, HTTPException
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from datetime import datetime, timedelta
+import tempfile
+import tarfile
 import sqlite3
+import os
 
 from tools.expense_manager import (
     get_total_spent,
@@ -13,26 +22,68 @@ from tools.expense_manager import (
 )
 from tools.market_data import get_crypto_price
 from tools.income_manager import add_income, list_income
-from tools.budget_manager import add_budget, list_budgets, check_budget_usage
+from tools.budget_manager import add_budget, list_budgets, check_budget_usage, list_budget_alerts
 from tools.savings_manager import get_savings_summary
-from utils.db_utils import init_db, load_mock_data, DB_PATH, init_budget_table, init_income_table
-
-app = FastAPI(title="Personal Finance Copilot - MCP Server")
+from tools.savings_projection import project_savings
+from tools.snapshot_manager import iter_snapshot_archive, import_snapshot_archive
+from tools.statement_importer import start_import, get_import_status, get_profile
+from tools.transaction_search import search_transactions, search_natural, is_search_query
+from tools.answer_cache import answer_cache
+from tools.admission import inference_admission, Overloaded
+from tools.ledger_export import export_transactions
+from tools.report_jobs import (submit_report, get_report_status, cancel_report, report_file, list_reports,
+                               shutdown_reports, ReportQueueFull)
+from tools.vector_index import semantic_search, index_stats, sync_index
+from tools.fx_manager import load_fx_rates, rates_file, list_fx_rates, start_rerate, get_rerate_status
+from tools.response_format import check_format, encode_response
+from tools.cashflow import RESOLUTIONS as CASHFLOW_RESOLUTIONS, stream_cashflow_json
+from tools.event_stream import broker as event_broker
+from tools.recurring_detector import list_recurring, rebuild_recurring
+from tools.anomaly_detector import list_anomalies, get_category_stats, rebuild_stats
+from tools.archive_manager import (list_partitions, archive_year, restore_year, run_maintenance,
+                                   start_maintenance_scheduler, stop_maintenance_scheduler, RestoreConflict,
+                                   ArchiveConflict)
+from tools.prefix_ledger import range_total, range_summary, range_totals_by_category, rolling_totals, monthly_totals
+from utils.db_utils import init_schema, load_mock_data
 
 # -------------------
-# DB Init
+# Startup
 # -------------------
-init_db()
-load_mock_data()
-init_income_table()
-init_budget_table()
+# SEED_MOCK_DATA=0 disables seeding; otherwise the seed CSV is only loaded
+# when its checksum differs from the last load (see load_mock_data).
+_SEED_ON_STARTUP = os.getenv("SEED_MOCK_DATA", "1").lower() not in ("0", "false", "no")
+# What /query does when inference is overloaded: "degrade" answers with the
+# rule-based intent matcher, "reject" returns 503 with Retry-After
+QUERY_OVERLOAD_MODE = os.getenv("QUERY_OVERLOAD_MODE", "degrade").lower()
+startup_report = {}
+
+@asynccontextmanager
+async def lifespan(app):
+    imported = time.perf_counter()
+    migrated = init_schema()
+    schema_done = time.perf_counter()
+    seed = load_mock_data() if _SEED_ON_STARTUP else {"status": "skipped", "reason": "disabled"}
+    seed_done = time.perf_counter()
+    startup_report.update({
+        "pid": os.getpid(),
+        "import_ms": round((imported - _IMPORT_STARTED) * 1000, 1),
+        "schema_ms": round((schema_done - imported) * 1000, 1),
+        "seed_ms": round((seed_done - schema_done) * 1000, 1),
+        "cold_start_ms": round((seed_done - _IMPORT_STARTED) * 1000, 1),
+        "schema_migrated": migrated,
+        "seed": seed,
+    })
+    print(f"Worker {startup_report['pid']} ready in {startup_report['cold_start_ms']} ms: {startup_report}")
+    start_maintenance_scheduler()
+    yield
+    stop_maintenance_scheduler()
+    shutdown_reports()
+
+app = FastAPI(title="Personal Finance Copilot - MCP Server", lifespan=lifespan)
 
 # -------------------
 # Utils
 # -------------------
-def get_connection():
-    return sqlite3.connect(DB_PATH)
-
 def get_date_range_for_month(year: int, month: int):
     start = datetime(year, month, 1)
     if month == 12:
@@ -48,6 +99,14 @@ def get_date_range_for_month(year: int, month: int):
 def home():
     return {"message": "Personal Finance Copilot MCP Server running"}
 
+@app.get("/health/startup")
+def api_startup_report():
+    return startup_report
+
+@app.post("/seed")
+def api_seed(force: bool = False):
+    return load_mock_data(force=force)
+
 @app.get("/expenses/total")
 def total_spent():
     return get_total_spent()
@@ -57,28 +116,65 @@ def api_top_categories(limit: int=5):
     return top_categories(limit)
 
 @app.get("/expenses/trends")
-def api_expense_trends():
-    return expense_trends()
+def api_expense_trends(request: Request, format: str = "rows", resolution: str = "day", start: str = None,
+                       end: str = None, category: str = None, by_category: bool = False, max_points: int = None):
+    """Expense totals per `resolution` bucket; each series is capped at `max_points` (0 = all points)."""
+    try:
+        as_columns = check_format(format)
+        trends = expense_trends(as_columns, resolution, start, end, category, by_category, max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encode_response(request, trends)
 
 @app.post("/expenses/add")
-def api_add_expense(category: str, amount: float, date: str, notes: str = ""):
-    return add_expense(category, amount, date, notes)
+def api_add_expense(category: str, amount: float, date: str, notes: str = "", currency: str = None):
+    try:
+        return add_expense(category, amount, date, notes, currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/expenses/list")
-def api_list_expenses(limit: int = 50):
-    return list_expenses(limit)
+def api_list_expenses(request: Request, limit: int = 50, format: str = "rows"):
+    try:
+        as_columns = check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encode_response(request, list_expenses(limit, as_columns))
+
+def _export_response(kind, format, start, end, category):
+    try:
+        media_type, filename, body = export_transactions(kind, format, start, end, category)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.get("/expenses/export")
+def api_export_expenses(format: str = "csv", start: str = None, end: str = None, category: str = None):
+    return _export_response("expenses", format, start, end, category)
 
 @app.get("/market/crypto/{symbol}")
 def crypto_price(symbol: str = "bitcoin"):
     return get_crypto_price(symbol)
 
 @app.post("/income/add")
-def api_add_income(source: str, amount: float, date: str, notes: str = ""):
-    return add_income(source, amount, date, notes)
+def api_add_income(source: str, amount: float, date: str, notes: str = "", currency: str = None):
+    try:
+        return add_income(source, amount, date, notes, currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/income/list")
-def api_list_income(limit: int = 50):
-    return list_income(limit)
+def api_list_income(request: Request, limit: int = 50, format: str = "rows"):
+    try:
+        as_columns = check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encode_response(request, list_income(limit, as_columns))
+
+@app.get("/income/export")
+def api_export_income(format: str = "csv", start: str = None, end: str = None, source: str = None):
+    return _export_response("income", format, start, end, source)
 
 @app.post("/budget/add")
 def api_add_budget(category: str, limit_amount: float, period: str, start_date: str):
@@ -92,19 +188,265 @@ def api_list_budgets():
 def api_budget_status(category: str):
     return check_budget_usage(category)
 
+@app.get("/budget/alerts")
+def api_budget_alerts(limit: int = 50, category: str = None):
+    return list_budget_alerts(limit, category)
+
 @app.get("/savings/summary")
 def api_savings_summary():
     return get_savings_summary()
 
+@app.get("/savings/projection")
+def api_savings_projection(target: float, by: str, paths: int = 20000, start_balance: float = None):
+    """Monte Carlo probability of having saved `target` by the date `by`."""
+    try:
+        return project_savings(target, by, paths, start_balance)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/ledger/range")
+def api_ledger_range(start: str = None, end: str = None, category: str = None):
+    return range_summary(start, end, category)
+
+@app.get("/ledger/range/categories")
+def api_ledger_range_categories(kind: str = "expenses", start: str = None, end: str = None):
+    try:
+        return range_totals_by_category(kind, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/ledger/rolling")
+def api_ledger_rolling(windows: str = "30,90", as_of: str = None, category: str = None):
+    try:
+        window_days = [int(w) for w in windows.split(",") if w.strip()]
+        return rolling_totals(window_days, as_of, category)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/anomalies")
+def api_anomalies(limit: int = 50, category: str = None, start: str = None, end: str = None):
+    return list_anomalies(limit, category, start, end)
+
+@app.get("/anomalies/stats")
+def api_anomaly_stats():
+    return get_category_stats()
+
+@app.post("/anomalies/rebuild")
+def api_anomaly_rebuild():
+    return rebuild_stats()
+
+@app.get("/recurring")
+def api_recurring(min_occurrences: int = 3):
+    return list_recurring(min_occurrences)
+
+@app.post("/recurring/rebuild")
+def api_recurring_rebuild():
+    return rebuild_recurring()
+
+@app.get("/archive")
+def api_archive():
+    return list_partitions()
+
+@app.post("/archive/{year}")
+def api_archive_year(year: int):
+    try:
+        return archive_year(year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ArchiveConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/archive/{year}/restore")
+def api_restore_year(year: int):
+    try:
+        return restore_year(year)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RestoreConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/maintenance")
+def api_maintenance():
+    return run_maintenance(force=True)
+
+@app.get("/cashflow")
+def api_cashflow(resolution: str = "monthly", start: str = None, end: str = None):
+    if resolution not in CASHFLOW_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {sorted(CASHFLOW_RESOLUTIONS)}")
+    return StreamingResponse(stream_cashflow_json(resolution, start, end), media_type="application/json")
+
+@app.get("/events/stream")
+async def api_event_stream(request: Request):
+    client = event_broker.subscribe()
+    if client is None:
+        raise HTTPException(status_code=503, detail="Too many event stream clients", headers={"Retry-After": "5"})
+    return StreamingResponse(
+        event_broker.stream(client, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/snapshot/export")
+def api_snapshot_export(tables: str = ""):
+    table_list = [t for t in tables.split(",") if t] or None
+    return StreamingResponse(
+        iter_snapshot_archive(table_list),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": "attachment; filename=finance_snapshot.tar"},
+    )
+
+@app.post("/snapshot/import")
+async def api_snapshot_import(request: Request, tables: str = ""):
+    table_list = [t for t in tables.split(",") if t] or None
+    fd, archive_path = tempfile.mkstemp(suffix=".tar")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                f.write(chunk)
+        return await run_in_threadpool(import_snapshot_archive, archive_path, table_list)
+    except sqlite3.IntegrityError as e:
+        raise HTTPException(status_code=409, detail=f"Snapshot conflicts with existing rows: {e}")
+    except (ValueError, KeyError, OSError, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot: {e}")
+    finally:
+        os.remove(archive_path)
+
+@app.post("/import/statement")
+async def api_import_statement(request: Request, background_tasks: BackgroundTasks,
+                               filename: str = "statement.csv", profile: str = "default", sheet: str = None):
+    try:
+        get_profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix not in (".csv", ".txt", ".xlsx", ".xlsm"):
+        raise HTTPException(status_code=400, detail="Statement must be a .csv or .xlsx file")
+    fd, statement_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        os.remove(statement_path)
+        raise
+    import_id, runner = start_import(statement_path, profile, sheet, cleanup=True)
+    background_tasks.add_task(runner)
+    return {"import_id": import_id, "status": "queued"}
+
+@app.get("/import/status/{import_id}")
+def api_import_status(import_id: str):
+    status = get_import_status(import_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown import id")
+    return status
+
+@app.get("/fx/rates")
+def api_fx_rates(currency: str = None, limit: int = 100):
+    return list_fx_rates(currency, limit)
+
+@app.post("/fx/rates/load")
+def api_fx_load(background_tasks: BackgroundTasks, path: str = None):
+    """Load rates from a CSV in FX_RATES_DIR; corrected rates queue a background re-rating job."""
+    try:
+        result = load_fx_rates(rates_file(path))
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not load FX rates: {e}")
+    if result["changed"]:
+        job_id, runner = start_rerate(result["currencies"], result["since"])
+        background_tasks.add_task(runner)
+        result["rerate_job"] = job_id
+    return result
+
+@app.post("/fx/rerate")
+def api_fx_rerate(background_tasks: BackgroundTasks, currency: str = None, since: str = None):
+    job_id, runner = start_rerate([currency] if currency else None, since)
+    background_tasks.add_task(runner)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/fx/rerate/{job_id}")
+def api_fx_rerate_status(job_id: str):
+    status = get_rerate_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown re-rating job id")
+    return status
+
+@app.get("/transactions/search")
+def api_transaction_search(q: str, kind: str = None, start: str = None, end: str = None, category: str = None,
+                           limit: int = 20, cursor: str = None, order: str = "rank", prefix: bool = False):
+    try:
+        return search_transactions(q, kind, start, end, category, limit, cursor, order, prefix=prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/transactions/semantic-search")
+def api_semantic_search(q: str, kind: str = None, k: int = 10, start: str = None, end: str = None,
+                        category: str = None):
+    try:
+        with inference_admission.admit():
+            return semantic_search(q, kind, k, start, end, category)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/transactions/semantic-index")
+def api_semantic_index_stats():
+    return index_stats()
+
+@app.post("/transactions/semantic-index")
+def api_semantic_index_sync(background_tasks: BackgroundTasks):
+    for kind in ("expenses", "income"):
+        background_tasks.add_task(sync_index, kind)
+    return {"status": "queued"}
+
+@app.post("/reports")
+def api_submit_report(report_type: str = "monthly", period: str = None):
+    """Queue a monthly (period=YYYY-MM) or annual (period=YYYY) XLSX statement."""
+    try:
+        return submit_report(report_type, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ReportQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/reports")
+def api_list_reports():
+    return list_reports()
+
+@app.get("/reports/{job_id}")
+def api_report_status(job_id: str):
+    status = get_report_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown report id")
+    return status
+
+@app.post("/reports/{job_id}/cancel")
+def api_cancel_report(job_id: str):
+    status = cancel_report(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown report id")
+    return status
+
+@app.get("/reports/{job_id}/download")
+def api_download_report(job_id: str):
+    path = report_file(job_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Report not found or not finished")
+    return FileResponse(path, filename=path.name,
+                        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
 # -------------------
 # Copilot Queries
 # -------------------
 class QueryIn(BaseModel):
     query: str
+    deadline_ms: int = None
 
 def detect_intent(query: str):
     q = query.lower()
-    if "total expense" in q and "month" in q:
+    if is_search_query(q):
+        return "search_transactions"
+    elif "total expense" in q and "month" in q:
         return "monthly_expense_summary"
     elif "top" in q and "category" in q:
         return "top_expense_categories"
@@ -122,15 +464,7 @@ def detect_intent(query: str):
 def monthly_expense_summary():
     today = datetime.today()
     start, end = get_date_range_for_month(today.year, today.month)
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT SUM(amount) FROM expenses WHERE date BETWEEN ? AND ?",
-        (start, end)
-    )
-    total = cursor.fetchone()[0] or 0
-    conn.close()
-    return {"start": start, "end": end, "total": total}
+    return {"start": start, "end": end, "total": range_total("expenses", start, end)}
 
 def compare_monthly_expenses():
     today = datetime.today()
@@ -138,74 +472,89 @@ def compare_monthly_expenses():
     last_month = today.month - 1 or 12
     last_year = today.year if today.month > 1 else today.year - 1
     start_last, end_last = get_date_range_for_month(last_year, last_month)
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT strftime('%Y-%m', date) as month, SUM(amount)
-        FROM expenses
-        WHERE date BETWEEN ? AND ?
-        GROUP BY month
-        ORDER BY month
-        """,
-        (start_last, end_this)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-    return [{"month": r[0], "total": r[1]} for r in rows]
+    return sorted(monthly_totals("expenses", start_last, end_this), key=lambda r: r["month"])
 
 def monthly_income_summary():
     today = datetime.today()
     start, end = get_date_range_for_month(today.year, today.month)
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT SUM(amount) FROM income WHERE date BETWEEN ? AND ?",
-        (start, end)
-    )
-    total = cursor.fetchone()[0] or 0
-    conn.close()
-    return {"start": start, "end": end, "total_income": total}
+    return {"start": start, "end": end, "total_income": range_total("income", start, end)}
 
 def expense_breakdown():
     today = datetime.today()
     start, end = get_date_range_for_month(today.year, today.month)
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT category, SUM(amount)
-        FROM expenses
-        WHERE date BETWEEN ? AND ?
-        GROUP BY category
-        ORDER BY SUM(amount) DESC
-        """,
-        (start, end)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-    return [{"category": r[0], "total": r[1]} for r in rows]
+    return range_totals_by_category("expenses", start, end)
+
+@app.get("/query/cache")
+def api_query_cache_stats():
+    return answer_cache.metrics()
+
+@app.get("/query/metrics")
+def api_query_metrics():
+    return {"overload_mode": QUERY_OVERLOAD_MODE, "model_available": _nlq_error is None,
+            **inference_admission.metrics()}
+
+def rule_based_answer(query: str):
+    intent = detect_intent(query)
+    if intent == "monthly_expense_summary":
+        result = monthly_expense_summary()
+    elif intent == "top_expense_categories":
+        result = get_top_categories(limit=2)
+    elif intent == "compare_monthly_expenses":
+        result = compare_monthly_expenses()
+    elif intent == "savings_summary":
+        result = get_savings_summary()
+    elif intent == "monthly_income_summary":
+        result = monthly_income_summary()
+    elif intent == "expense_breakdown":
+        result = expense_breakdown()
+    elif intent == "search_transactions":
+        result = search_natural(query)
+    else:
+        result = {"message": "Sorry, I didn’t understand your query."}
+    return {"intent": intent, "result": result}
+
+# The MiniLM handler is imported on first use (loading the model is slow);
+# a failed load is remembered so every request doesn't retry it
+_nlq_handler = None
+_nlq_error = None
+
+def _load_nlq_handler():
+    global _nlq_handler, _nlq_error
+    if _nlq_handler is None and _nlq_error is None:
+        try:
+            from tools.nlq_manager import handle_query
+            _nlq_handler = handle_query
+        except Exception as e:
+            _nlq_error = str(e)
+            print(f"NLQ model unavailable, answering with rules only: {e}")
+    return _nlq_handler
+
+def _degraded_answer(query: str, reason: str):
+    inference_admission.record_degraded()
+    return {**rule_based_answer(query), "degraded": True, "degraded_reason": reason}
 
 @app.post("/query")
 def api_query(q: QueryIn):
     if not q.query or not q.query.strip():
         raise HTTPException(status_code=400, detail="Empty query")
     try:
-        intent = detect_intent(q.query)
-        if intent == "monthly_expense_summary":
-            result = monthly_expense_summary()
-        elif intent == "top_expense_categories":
-            result = get_top_categories(limit=2)
-        elif intent == "compare_monthly_expenses":
-            result = compare_monthly_expenses()
-        elif intent == "savings_summary":
-            result = get_savings_summary()
-        elif intent == "monthly_income_summary":
-            result = monthly_income_summary()
-        elif intent == "expense_breakdown":
-            result = expense_breakdown()
-        else:
-            result = {"message": "Sorry, I didn’t understand your query."}
-        return {"intent": intent, "result": result}
+        # Questions the keyword router understands (and searches) never need the model
+        if detect_intent(q.query) != "unknown":
+            return rule_based_answer(q.query)
+        if _nlq_error is not None:
+            return _degraded_answer(q.query, "model_unavailable")
+        try:
+            with inference_admission.admit(q.deadline_ms):
+                # The first request loads the model, so a cold burst is bounded by the same limit
+                handler = _load_nlq_handler()
+                if handler is not None:
+                    return handler(q.query)
+            return _degraded_answer(q.query, "model_unavailable")
+        except Overloaded as e:
+            if QUERY_OVERLOAD_MODE == "reject":
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+            return _degraded_answer(q.query, e.reason)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,18 @@
+import os
+
+# Before any tools import: no background embedding worker, no columnar cache
+os.environ["SEMANTIC_INDEX"] = "0"
+os.environ["COLUMNAR_BACKEND"] = "0"
+
+import pytest
+
+from utils import db_utils
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database in a temp directory (archives go next to it)."""
+    monkeypatch.setattr(db_utils, "DB_PATH", tmp_path / "finance.db")
+    db_utils.init_schema()
+    return db_utils
+
@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+
+import pytest
+
+from tools.budget_manager import budget_window, refresh_budget_status
+
+
+@pytest.mark.parametrize("period, start, day, window", [
+    ("monthly", "2025-01-15", "2025-01-15", ("2025-01-15", "2025-02-14")),
+    ("monthly", "2025-01-15", "2025-03-14", ("2025-02-15", "2025-03-14")),
+    ("daily", "2025-01-01", "2025-03-09", ("2025-03-09", "2025-03-09")),
+    ("weekly", "2025-01-01", "2025-01-08", ("2025-01-08", "2025-01-14")),
+    ("yearly", "2024-04-01", "2025-03-31", ("2024-04-01", "2025-03-31")),
+    # Anchored on the 31st: short months end early and the next window returns to the 31st
+    ("monthly", "2025-01-31", "2025-02-28", ("2025-02-28", "2025-03-30")),
+    ("monthly", "2025-01-31", "2025-03-31", ("2025-03-31", "2025-04-29")),
+    ("yearly", "2024-02-29", "2025-02-28", ("2025-02-28", "2026-02-27")),
+])
+def test_window_containing_a_day(period, start, day, window):
+    assert budget_window(period, start, day) == window
+
+
+def test_no_window_before_the_budget_starts():
+    assert budget_window("monthly", "2025-01-15", "2025-01-14") is None
+
+
+def test_windows_tile_the_calendar_without_gaps():
+    windows = {budget_window("monthly", "2024-01-31", date(2024, 1, 31) + timedelta(days=d)) for d in range(800)}
+    ordered = sorted(windows)
+    for (_, end), (start, _) in zip(ordered, ordered[1:]):
+        assert date.fromisoformat(end) + timedelta(days=1) == date.fromisoformat(start)
+
+
+def test_status_tracks_spend_in_the_current_window_only(db):
+    today = date.today()
+    db.insert_budget("Food", 1000.0, "monthly", today.replace(day=1).isoformat())
+    db.insert_expenses_batch([("Food", 300.0, today.isoformat(), "in window"),
+                              ("Food", 999.0, (today.replace(day=1) - timedelta(days=1)).isoformat(), "last month"),
+                              ("Rent", 500.0, today.isoformat(), "other category")])
+    conn = db.get_connection()
+    status = refresh_budget_status(conn, 1)
+    conn.close()
+    assert status["window_start"] == today.replace(day=1).isoformat()
+    assert status["spent"] == pytest.approx(300.0)
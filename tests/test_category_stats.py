@@ -0,0 +1,45 @@
+import random
+import statistics
+
+import pytest
+
+from tools.anomaly_detector import ANOMALY_MIN_SAMPLES, get_category_stats, rebuild_category_stats
+
+
+def _stats(db):
+    conn = db.get_connection()
+    rows = {r["category"]: (r["n"], r["mean"], r["m2"]) for r in conn.execute("SELECT * FROM category_stats")}
+    conn.close()
+    return rows
+
+
+def test_running_stats_match_a_full_recompute(db):
+    rng = random.Random(3)
+    amounts = [round(rng.uniform(10, 5000), 2) for _ in range(60)]
+    # Several batches, so the fold continues from stored state
+    for lo in range(0, len(amounts), 17):
+        db.insert_expenses_batch([("Food", a, "2025-02-01", f"row {lo + i}")
+                                  for i, a in enumerate(amounts[lo:lo + 17])])
+
+    food = get_category_stats()["categories"][0]
+    assert food["count"] == len(amounts)
+    assert food["mean"] == pytest.approx(statistics.mean(amounts), abs=0.01)
+    assert food["std"] == pytest.approx(statistics.stdev(amounts), abs=0.01)
+
+    incremental = _stats(db)
+    conn = db.get_connection()
+    rebuild_category_stats(conn)
+    conn.commit()
+    conn.close()
+    assert _stats(db)["Food"] == pytest.approx(incremental["Food"], rel=1e-9)
+
+
+def test_single_sample_has_zero_std_and_outliers_are_flagged(db):
+    db.insert_expense("Travel", 500.0, "2025-02-01", "first")
+    assert get_category_stats()["categories"][0]["std"] == 0.0
+
+    db.insert_expenses_batch([("Food", 100.0 + i, "2025-02-02", f"usual {i}") for i in range(ANOMALY_MIN_SAMPLES)])
+    inserted = db.insert_expenses_batch([("Food", 10_000.0, "2025-02-03", "outlier")])
+    assert inserted[0]["anomaly"]["zscore"] > 3
+    inserted = db.insert_expenses_batch([("Food", 103.0, "2025-02-04", "normal")])
+    assert "anomaly" not in inserted[0]
@@ -0,0 +1,52 @@
+import pytest
+
+from utils.db_utils import ledger_range_total, rebuild_daily_ledger
+
+RANGES = [
+    (None, None, None), ("2025-01-01", "2025-01-31", None), ("2025-01-06", "2025-01-15", None),
+    ("2025-01-16", None, None), (None, "2025-01-05", None), ("2025-01-01", "2025-01-31", "Food"),
+    ("2025-01-11", "2025-01-19", "Food"), ("2025-01-31", "2025-01-01", None),
+]
+
+
+def _sql_total(conn, start, end, category):
+    where, params = ["1 = 1"], []
+    if start:
+        where.append("date >= ?")
+        params.append(start)
+    if end:
+        where.append("date <= ?")
+        params.append(end)
+    if category:
+        where.append("category = ?")
+        params.append(category)
+    total = conn.execute(f"SELECT SUM(amount) FROM expenses WHERE {' AND '.join(where)}", params).fetchone()[0]
+    return round(total or 0, 2)
+
+
+def _ledger(conn):
+    return [tuple(r) for r in conn.execute("SELECT * FROM daily_ledger ORDER BY kind, category, day")]
+
+
+def test_range_totals_match_the_raw_rows(db):
+    db.insert_expenses_batch([("Food", 100.0, "2025-01-10", "a"), ("Rent", 900.0, "2025-01-20", "b"),
+                              ("Food", 50.5, "2025-01-20", "c")])
+    conn = db.get_connection()
+    for start, end, category in RANGES:
+        assert ledger_range_total(conn, "expenses", start, end, category) == _sql_total(conn, start, end, category)
+    conn.close()
+
+
+def test_backdated_insert_shifts_every_later_day(db):
+    db.insert_expenses_batch([("Food", 100.0, "2025-01-10", "a"), ("Rent", 900.0, "2025-01-20", "b")])
+    # Earlier than every existing day, then in between, in one batch and on their own
+    db.insert_expenses_batch([("Food", 7.25, "2025-01-05", "backdated"), ("Rent", 30.0, "2025-01-15", "mid")])
+    db.insert_expense("Food", 12.0, "2025-01-01", "first day")
+
+    conn = db.get_connection()
+    for start, end, category in RANGES:
+        assert ledger_range_total(conn, "expenses", start, end, category) == _sql_total(conn, start, end, category)
+    incremental = _ledger(conn)
+    rebuild_daily_ledger(conn)
+    assert _ledger(conn) == pytest.approx(incremental)
+    conn.close()
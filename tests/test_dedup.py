@@ -0,0 +1,42 @@
+from tools.archive_manager import archive_year
+
+ROWS = [
+    ("Food", 250.0, "2023-03-01", "Zomato order"),
+    ("Transport", 120.0, "2023-03-02", "Uber trip"),
+]
+
+
+def test_reinserting_a_batch_skips_every_row(db):
+    assert len(db.insert_expenses_batch(ROWS)) == 2
+    assert db.insert_expenses_batch(ROWS) == []
+    assert db.insert_expense("Food", 250.0, "2023-03-01", "Zomato order") is None
+
+
+def test_duplicates_within_one_batch_are_counted_once(db):
+    inserted = db.insert_expenses_batch(ROWS + [ROWS[0]])
+    assert [r["notes"] for r in inserted] == ["Zomato order", "Uber trip"]
+
+
+def test_hash_ignores_whitespace_and_case_but_not_amount_or_currency(db):
+    db.insert_expenses_batch(ROWS)
+    assert db.insert_expense("food", 250, "2023-03-01", "  Zomato   ORDER ") is None
+    assert db.insert_expense("Food", 251.0, "2023-03-01", "Zomato order") is not None
+
+
+def test_seed_reload_reports_skip_counts(db, tmp_path):
+    seed = tmp_path / "seed.csv"
+    seed.write_text("date,category,amount,description\n"
+                    "2023-03-01,Food,250,Zomato order\n"
+                    "2023-03-01,Food,250,Zomato order\n"
+                    "2023-03-02,Transport,120,Uber trip\n")
+    assert db.load_mock_data(path=seed) == {"status": "loaded", "rows": 3, "inserted": 2, "duplicates": 1}
+    assert db.load_mock_data(path=seed)["status"] == "skipped"
+    assert db.load_mock_data(force=True, path=seed) == {"status": "loaded", "rows": 3, "inserted": 0,
+                                                        "duplicates": 3}
+
+
+def test_archived_rows_still_dedup_reimports(db):
+    db.insert_expenses_batch(ROWS)
+    archive_year(2023)
+    assert db.insert_expenses_batch(ROWS) == []
+    assert len(db.insert_expenses_batch([("Food", 99.0, "2023-03-03", "Late row")])) == 1
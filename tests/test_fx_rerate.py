@@ -0,0 +1,54 @@
+import pytest
+
+from tools.archive_manager import archive_year
+from tools.fx_manager import load_fx_rates, rerate
+from utils.db_utils import ledger_range_total
+
+
+def _write_rates(path, rows):
+    path.write_text("date,currency,rate\n" + "".join(f"{d},{c},{r}\n" for d, c, r in rows))
+    return path
+
+
+def _amounts(db, table="expenses"):
+    conn = db.get_connection()
+    rows = {r["notes"]: (r["amount"], r["fx_rate"]) for r in conn.execute(f"SELECT * FROM {table}")}
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def usd(db, tmp_path):
+    load_fx_rates(_write_rates(tmp_path / "rates.csv", [("2023-01-01", "USD", 80), ("2024-01-01", "USD", 82)]))
+    db.insert_expenses_batch([("Travel", 10.0, "2023-06-01", "hotel", "USD"),
+                              ("Travel", 10.0, "2024-06-01", "flight", "usd"),
+                              ("Food", 500.0, "2024-06-02", "lunch")])
+    return db
+
+
+def test_inserts_convert_with_the_rate_in_effect(usd):
+    assert _amounts(usd) == {"hotel": (800.0, 80.0), "flight": (820.0, 82.0), "lunch": (500.0, 1.0)}
+    with pytest.raises(ValueError):
+        usd.insert_expense("Travel", 1.0, "2022-12-31", "before any rate", "USD")
+
+
+def test_rate_correction_rerates_rows_and_totals(usd, tmp_path):
+    changed = load_fx_rates(_write_rates(tmp_path / "fix.csv", [("2024-01-01", "USD", 83.5)]))
+    assert changed == {"rates": 1, "changed": 1, "currencies": ["USD"], "since": "2024-01-01"}
+    stats = rerate(changed["currencies"], changed["since"], batch_rows=1)
+    assert stats["updated"] == 1
+    assert _amounts(usd) == {"hotel": (800.0, 80.0), "flight": (835.0, 83.5), "lunch": (500.0, 1.0)}
+    conn = usd.get_connection()
+    assert ledger_range_total(conn, "expenses", "2024-01-01", "2024-12-31") == 1335.0
+    conn.close()
+    # Nothing left to change
+    assert rerate(["USD"])["updated"] == 0
+
+
+def test_rerate_reaches_archived_years(usd, tmp_path):
+    archive_year(2023)
+    load_fx_rates(_write_rates(tmp_path / "fix.csv", [("2023-01-01", "USD", 81)]))
+    assert rerate(["USD"], "2023-01-01")["updated"] == 1
+    conn = usd.get_connection()
+    assert ledger_range_total(conn, "expenses", "2023-01-01", "2023-12-31") == 810.0
+    conn.close()
@@ -0,0 +1,53 @@
+import csv
+import io
+
+import pytest
+
+from tools.archive_manager import archive_year
+from tools.ledger_export import _export_segments, export_transactions
+
+
+def _export_csv(**kwargs):
+    _, _, body = export_transactions("expenses", "csv", chunk_rows=2, **kwargs)
+    return list(csv.reader(io.StringIO(b"".join(body).decode("utf-8"))))
+
+
+@pytest.fixture
+def archived(db):
+    db.insert_expenses_batch([("Food", float(m), f"{y}-0{m}-1{m}", f"{y} {m}")
+                              for y in (2021, 2022, 2023) for m in (1, 6, 9)])
+    archive_year(2021)
+    archive_year(2022)
+    return db
+
+
+def test_segments_alternate_hot_and_archived_years(archived):
+    conn = archived.get_connection()
+    assert list(_export_segments(conn, None, None)) == [
+        (None, "2020-12-31", None), ("2021-01-01", "2021-12-31", 2021), ("2022-01-01", "2022-12-31", 2022),
+        ("2023-01-01", None, None),
+    ]
+    assert list(_export_segments(conn, "2021-06-01", "2022-03-01")) == [
+        ("2021-06-01", "2021-12-31", 2021), ("2022-01-01", "2022-03-01", 2022),
+    ]
+    assert list(_export_segments(conn, "2023-01-01", None)) == [("2023-01-01", None, None)]
+    conn.close()
+
+
+def test_export_spans_archives_in_date_order(archived):
+    rows = _export_csv()
+    assert rows[0] == ["id", "date", "category", "notes", "amount", "currency", "original_amount"]
+    dates = [r[1] for r in rows[1:]]
+    assert len(dates) == 9 and dates == sorted(dates)
+
+
+def test_export_range_inside_one_archive(archived):
+    assert [r[3] for r in _export_csv(start="2022-05-01", end="2022-06-16")[1:]] == ["2022 6"]
+    assert _export_csv(start="2024-01-01")[1:] == []
+
+
+def test_unknown_kind_or_format(db):
+    with pytest.raises(ValueError):
+        export_transactions("transfers")
+    with pytest.raises(ValueError):
+        export_transactions("expenses", "pdf")
@@ -0,0 +1,47 @@
+import pytest
+
+from tools.transaction_search import search_transactions
+
+
+@pytest.fixture
+def rides(db):
+    # Identical notes give identical bm25 scores, so only the id tie-break orders them
+    db.insert_expenses_batch([("Transport", 100.0 + i, f"2025-03-{1 + i % 5:02d}", "Uber ride") for i in range(23)])
+    db.insert_expenses_batch([("Food", 250.0, "2025-03-02", "Swiggy dinner")])
+    return db
+
+
+def _pages(q, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = search_transactions(q, cursor=cursor, **kwargs)
+        pages.append(page["results"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("order", ["rank", "date"])
+def test_cursor_pages_cover_every_match_once(rides, order):
+    pages = _pages("uber", kind="expenses", limit=5, order=order)
+    ids = [r["id"] for page in pages for r in page]
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 3]
+    assert len(ids) == len(set(ids)) == 23
+    if order == "date":
+        keys = [(r["date"], r["id"]) for page in pages for r in page]
+        assert keys == sorted(keys, reverse=True)
+
+
+def test_exact_page_boundary_has_no_trailing_cursor(rides):
+    page = search_transactions("swiggy", limit=1)
+    assert page["count"] == 1 and page["next_cursor"] is None
+
+
+def test_filters_and_bad_cursor(rides):
+    march_first = search_transactions("uber", start="2025-03-01", end="2025-03-01", limit=50)
+    assert {r["date"] for r in march_first["results"]} == {"2025-03-01"}
+    assert search_transactions("uber", category="Food")["count"] == 0
+    with pytest.raises(ValueError):
+        search_transactions("uber", cursor="not-a-cursor")
+    with pytest.raises(ValueError):
+        search_transactions("  ")
@@ -0,0 +1,49 @@
+import math
+from datetime import date, timedelta
+
+import pytest
+
+from utils.db_utils import _lttb
+
+
+def _series(n):
+    start = date(2024, 1, 1)
+    return [((start + timedelta(days=i)).isoformat(), round(100 + 50 * math.sin(i / 7), 2)) for i in range(n)]
+
+
+def test_lttb_keeps_the_endpoints_and_the_requested_count():
+    rows = _series(500)
+    kept = _lttb(rows, 50)
+    assert len(kept) == 50
+    assert kept[0] == rows[0] and kept[-1] == rows[-1]
+    assert kept == sorted(kept)   # still in date order, no duplicates
+    assert len(set(kept)) == 50
+
+
+def test_lttb_keeps_a_spike_and_returns_short_series_unchanged():
+    rows = [(d, 10.0) for d, _ in _series(300)]
+    rows[137] = (rows[137][0], 10_000.0)
+    assert rows[137] in _lttb(rows, 20)
+    assert _lttb(rows[:10], 10) == rows[:10]
+
+
+def test_trends_are_capped_per_series(db):
+    db.insert_expenses_batch([(c, 10.0 + i, d, f"{c} {i}") for i, (d, _) in enumerate(_series(200))
+                              for c in ("Food", "Rent")])
+    assert len(db.get_expense_trends(max_points=20)) == 20
+    per_category = db.get_expense_trends(by_category=True, max_points=20)
+    assert sorted({r["category"] for r in per_category}) == ["Food", "Rent"]
+    assert len(per_category) == 40
+    assert len(db.get_expense_trends(max_points=0)) == 200
+    with pytest.raises(ValueError):
+        db.get_expense_trends(max_points=2)
+
+
+def test_partial_buckets_are_widened_to_whole_buckets(db):
+    db.insert_expenses_batch([("Food", 10.0, f"2024-01-{d:02d}", f"day {d}") for d in range(1, 32)])
+    # 2024-01-10 is a Wednesday: its week starts on Monday the 8th
+    weeks = db.get_expense_trends(resolution="week", start="2024-01-10", end="2024-01-16")
+    assert weeks == [{"date": "2024-01-08", "total": 70.0}, {"date": "2024-01-15", "total": 70.0}]
+    assert db.get_expense_trends(resolution="month", start="2024-01-20") == [{"date": "2024-01-01", "total": 310.0}]
+    with pytest.raises(ValueError):
+        db.get_expense_trends(category="Food", by_category=True)
@@ -0,0 +1,100 @@
+# tools/admission.py
+"""Admission control for model-backed (MiniLM) query work.
+
+At most INFERENCE_CONCURRENCY requests run inference at once and at most
+INFERENCE_QUEUE_SIZE more may wait for a slot. A request is shed when the
+queue is already full, or when it has waited longer than its deadline. The
+dashboard gives up after 10 s, so work that cannot start well before that is
+dropped up front instead of being computed for a client that has left. The
+caller decides what shedding means: a 503 with Retry-After, or a degraded
+rule-based answer.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "4"))
+INFERENCE_DEADLINE_MS = int(os.getenv("INFERENCE_DEADLINE_MS", "3000"))
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionController.admit when a request is shed."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Inference overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=INFERENCE_CONCURRENCY, max_queue=INFERENCE_QUEUE_SIZE,
+                 deadline_ms=INFERENCE_DEADLINE_MS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.deadline_ms = deadline_ms
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+        self._service_ms = None    # moving average of time spent holding a slot
+        self.stats = {"admitted": 0, "shed_queue_full": 0, "shed_deadline": 0, "degraded": 0}
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained (at least 1)."""
+        per_request = (self._service_ms or 1000) / 1000
+        backlog = (self._running + self._waiting) / max(self.max_concurrent, 1)
+        return max(1, round(backlog * per_request))
+
+    @contextmanager
+    def admit(self, deadline_ms=None):
+        """Hold an inference slot for the duration of the block, or raise Overloaded."""
+        deadline_ms = self.deadline_ms if deadline_ms is None else deadline_ms
+        give_up = time.monotonic() + deadline_ms / 1000
+        with self._cond:
+            if self._running >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    self.stats["shed_queue_full"] += 1
+                    raise Overloaded("queue_full", self.retry_after())
+                self._waiting += 1
+                try:
+                    while self._running >= self.max_concurrent:
+                        remaining = give_up - time.monotonic()
+                        if remaining <= 0:
+                            self.stats["shed_deadline"] += 1
+                            raise Overloaded("deadline", self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._running += 1
+            self.stats["admitted"] += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            with self._cond:
+                self._running -= 1
+                self._service_ms = elapsed_ms if self._service_ms is None else 0.8 * self._service_ms + 0.2 * elapsed_ms
+                self._cond.notify()
+
+    def record_degraded(self):
+        with self._cond:
+            self.stats["degraded"] += 1
+
+    def metrics(self):
+        with self._cond:
+            return {
+                **self.stats,
+                "shed": self.stats["shed_queue_full"] + self.stats["shed_deadline"],
+                "in_flight": self._running,
+                "queued": self._waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "deadline_ms": self.deadline_ms,
+                "avg_service_ms": round(self._service_ms, 1) if self._service_ms is not None else None,
+            }
+
+
+inference_admission = AdmissionController()
@@ -0,0 +1,140 @@
+import math
+import os
+
+from utils.db_utils import get_connection
+from tools.archive_manager import archive_rows
+
+# Welford count/mean/M2 per expense category, updated in O(1) per insert.
+# An expense is flagged when it sits more than ANOMALY_Z_THRESHOLD standard
+# deviations above its category mean, once the category has enough history.
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.0"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "5"))
+
+
+def init_category_stats(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS category_stats (
+        category TEXT PRIMARY KEY,
+        n INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS anomalies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        expense_id INTEGER,
+        date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        mean REAL NOT NULL,
+        std REAL NOT NULL,
+        zscore REAL NOT NULL,
+        detected_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_date ON anomalies(date)")
+    if conn.execute("SELECT 1 FROM category_stats LIMIT 1").fetchone() is None:
+        rebuild_category_stats(conn)
+    if own:
+        conn.commit()
+        conn.close()
+
+
+def rebuild_category_stats(conn):
+    """Recompute the running statistics from the expenses table and its archived years."""
+    moments = ("SELECT category, COUNT(*), SUM(amount), SUM(amount * amount)"
+               " FROM expenses WHERE amount IS NOT NULL GROUP BY category")
+    totals = {}
+    for category, n, total, sum_sq in [*conn.execute(moments), *archive_rows(conn, moments)]:
+        t = totals.setdefault(category, [0, 0.0, 0.0])
+        t[0] += n
+        t[1] += total
+        t[2] += sum_sq
+    conn.execute("DELETE FROM category_stats")
+    conn.executemany(
+        "INSERT INTO category_stats (category, n, mean, m2) VALUES (?, ?, ?, ?)",
+        [(c, n, total / n, max(sum_sq - total * total / n, 0)) for c, (n, total, sum_sq) in totals.items()]
+    )
+
+
+def apply_category_stats(conn, rows):
+    """Score and fold new expense rows into category_stats inside the caller's transaction."""
+    stats = {}
+    for r in rows:
+        category = r["category"]
+        if category not in stats:
+            row = conn.execute("SELECT n, mean, m2 FROM category_stats WHERE category = ?", (category,)).fetchone()
+            stats[category] = list(row) if row else [0, 0.0, 0.0]
+        n, mean, m2 = stats[category]
+        amount = float(r["amount"] or 0)
+
+        std = math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+        if n >= ANOMALY_MIN_SAMPLES and std > 0:
+            z = (amount - mean) / std
+            if z > ANOMALY_Z_THRESHOLD:
+                r["anomaly"] = {"zscore": round(z, 2), "category_mean": round(mean, 2), "category_std": round(std, 2)}
+                conn.execute(
+                    "INSERT INTO anomalies (expense_id, date, category, amount, mean, std, zscore) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (r.get("id"), r["date"], category, amount, mean, std, z)
+                )
+
+        n += 1
+        delta = amount - mean
+        mean += delta / n
+        m2 += delta * (amount - mean)
+        stats[category] = [n, mean, m2]
+    conn.executemany(
+        "INSERT OR REPLACE INTO category_stats (category, n, mean, m2) VALUES (?, ?, ?, ?)",
+        [(c, n, mean, m2) for c, (n, mean, m2) in stats.items()]
+    )
+
+
+def list_anomalies(limit: int = 50, category: str = None, start: str = None, end: str = None):
+    query = "SELECT * FROM anomalies WHERE 1=1"
+    args = []
+    if category:
+        query += " AND category = ?"
+        args.append(category)
+    if start:
+        query += " AND date >= ?"
+        args.append(start)
+    if end:
+        query += " AND date <= ?"
+        args.append(end)
+    query += " ORDER BY date DESC, id DESC LIMIT ?"
+    args.append(limit)
+    conn = get_connection()
+    rows = conn.execute(query, args).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def get_category_stats():
+    conn = get_connection()
+    rows = conn.execute("SELECT category, n, mean, m2 FROM category_stats ORDER BY category").fetchall()
+    conn.close()
+    return {
+        "z_threshold": ANOMALY_Z_THRESHOLD,
+        "min_samples": ANOMALY_MIN_SAMPLES,
+        "categories": [
+            {
+                "category": r["category"],
+                "count": r["n"],
+                "mean": round(r["mean"], 2),
+                "std": round(math.sqrt(r["m2"] / (r["n"] - 1)), 2) if r["n"] > 1 else 0.0,
+            }
+            for r in rows
+        ],
+    }
+
+
+def rebuild_stats():
+    conn = get_connection()
+    rebuild_category_stats(conn)
+    conn.commit()
+    conn.close()
+    return get_category_stats()
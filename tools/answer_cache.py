@@ -0,0 +1,136 @@
+# tools/answer_cache.py
+"""Semantic answer cache for natural-language queries.
+
+Answers are stored under (intent, extracted params, data version). A new
+query reuses an answer when it has the same key and its embedding has cosine
+similarity >= ANSWER_CACHE_THRESHOLD with the query that produced it, so
+"what did I spend on food this month" and "this month's food spending" share
+one SQL run while "... last month" never does (different params).
+
+The data version is the database file's mtime/size (and its WAL's), read with
+os.stat: any committed write from any worker changes it, and checking it
+needs no SQL. Inserts made by this process also bump a local counter, which
+covers writes landing within the filesystem's mtime granularity. Entries are
+evicted least-recently-used beyond ANSWER_CACHE_SIZE.
+"""
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from utils import db_utils
+from utils.db_utils import register_insert_listener
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+
+
+_local_writes = 0
+
+
+def _on_insert(table, rows):
+    global _local_writes
+    _local_writes += 1
+
+
+register_insert_listener(_on_insert)
+
+
+def data_version():
+    parts = [str(_local_writes)]
+    for suffix in ("", "-wal"):
+        try:
+            st = os.stat(f"{db_utils.DB_PATH}{suffix}")
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except FileNotFoundError:
+            parts.append("-")
+    return "|".join(parts)
+
+
+def params_key(params):
+    # Relative phrases ("last 3 months") resolve against today
+    return json.dumps({"today": date.today().isoformat(), **params}, sort_keys=True, default=str)
+
+
+class AnswerCache:
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries = OrderedDict()   # entry id -> (key, embedding, result)
+        self._buckets = {}              # key -> [entry ids]
+        self._next_id = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self):
+        version = data_version()
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._buckets.clear()
+            self._version = version
+        return version
+
+    def get(self, intent, params, embedding):
+        """Cached result for a near-duplicate query, or None."""
+        with self._lock:
+            version = self._check_version()
+            ids = self._buckets.get((intent, params_key(params), version))
+            if ids:
+                embeddings = np.stack([self._entries[i][1] for i in ids])
+                scores = embeddings @ np.asarray(embedding, dtype=np.float32)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.stats["hits"] += 1
+                    return copy.deepcopy(self._entries[entry_id][2])
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, intent, params, embedding, result, version=None):
+        """Store `result`; pass the data_version() read before computing it so
+        an answer racing with a write is not cached under the new version."""
+        with self._lock:
+            current = self._check_version()
+            if version is not None and version != current:
+                return
+            version = current
+            key = (intent, params_key(params), version)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, np.asarray(embedding, dtype=np.float32), copy.deepcopy(result))
+            self._buckets.setdefault(key, []).append(entry_id)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                old_id, (old_key, _, _) = self._entries.popitem(last=False)
+                bucket = self._buckets[old_key]
+                bucket.remove(old_id)
+                if not bucket:
+                    del self._buckets[old_key]
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,466 @@
+# tools/archive_manager.py
+"""Hot/cold partitioning of the ledgers and scheduled database maintenance.
+
+`archive_year` moves one closed year of expenses and income out of the hot
+database into db/archive/finance_<year>.db. Rows are copied with their ids
+and then deleted from the hot tables in the same transaction. The FTS
+triggers drop them from the hot search index and the archive file gets a
+full-text index of its own; their content hashes go to archived_hashes so
+re-imports are still deduplicated. The prefix-sum ledger and category
+statistics are left alone, since they already cover every year. Row-level
+reads attach an archive only when their date range reaches into it (see
+ledger_source); full scans such as recurring detection and FX re-rating
+visit every archive file. `restore_year` moves the rows back.
+
+`run_maintenance` runs on a schedule in every API worker. A lease in
+app_meta lets one worker at a time do the work, and last_maintenance is only
+recorded once a run succeeds, so a failed run is retried at the next check.
+Each run archives closed years when ARCHIVE_HOT_YEARS is set, reclaims free
+pages with incremental vacuum, runs ANALYZE when it is due and finishes with
+PRAGMA optimize. Incremental vacuum needs auto_vacuum=INCREMENTAL, which
+only a full VACUUM can switch on; that is a one-off admin step
+(`enable-incremental-vacuum`), never done by the scheduler.
+
+    python -m tools.archive_manager archive 2023
+    python -m tools.archive_manager maintain
+    python -m tools.archive_manager enable-incremental-vacuum
+"""
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from utils import db_utils
+from utils.db_utils import get_connection, get_meta, set_meta, FTS_OPTIONS, LEDGER_LABEL_COLUMNS
+
+# Keep the current year plus this many previous years hot; 0 disables automatic archiving
+ARCHIVE_HOT_YEARS = int(os.getenv("ARCHIVE_HOT_YEARS", "0"))
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))
+ANALYZE_INTERVAL_DAYS = 7
+MAINTENANCE_CHECK_SECONDS = 600
+# A worker that died mid-run stops holding the maintenance lease after this long
+MAINTENANCE_LEASE_MINUTES = 60
+
+
+# --- Partitions ---
+# daily_ledger and category_stats keep covering every year, so totals never
+# touch the archives; row-level reads ATTACH only the archived years their
+# date range overlaps. archived_hashes keeps the content-hash deduplication
+# working for rows that moved out.
+def init_archive_tables(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive_partitions (
+        year INTEGER PRIMARY KEY,
+        expenses INTEGER NOT NULL DEFAULT 0,
+        income INTEGER NOT NULL DEFAULT 0,
+        archived_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archived_hashes (
+        kind TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        PRIMARY KEY (kind, content_hash)
+    ) WITHOUT ROWID
+    """)
+    if own:
+        conn.commit()
+        conn.close()
+
+
+def archive_path(year):
+    return Path(db_utils.DB_PATH).parent / "archive" / f"finance_{int(year)}.db"
+
+
+def archived_years(conn, start=None, end=None):
+    """Archived years overlapping the inclusive ISO range [start, end], oldest first."""
+    try:
+        years = [r[0] for r in conn.execute("SELECT year FROM archive_partitions ORDER BY year")]
+    except sqlite3.OperationalError:
+        return []
+    lo = int(start[:4]) if start else None
+    hi = int(end[:4]) if end else None
+    return [y for y in years if (lo is None or y >= lo) and (hi is None or y <= hi)]
+
+
+def attach_archives(conn, start=None, end=None):
+    """ATTACH the archived years a range needs (outside any transaction); returns their schema names."""
+    years = archived_years(conn, start, end)
+    attached = {r[1] for r in conn.execute("PRAGMA database_list")}
+    missing = [y for y in years if f"archive_{y}" not in attached]
+    if len(attached - {"main", "temp"}) + len(missing) > conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        raise ValueError(f"The date range spans {len(years)} archived years; narrow it to at most "
+                         f"{conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)}")
+    for y in missing:
+        conn.execute(f"ATTACH DATABASE ? AS archive_{y}", (str(archive_path(y)),))
+    return [f"archive_{y}" for y in years]
+
+
+def ledger_source(conn, kind, start=None, end=None):
+    """FROM-clause source for row-level reads of `kind` over [start, end].
+
+    Just the hot table when no archived year overlaps the range; otherwise a
+    UNION ALL of it with the attached archive tables, aliased to `kind`.
+    Date filters in the outer query are pushed down into each branch.
+    """
+    schemas = attach_archives(conn, start, end)
+    if not schemas:
+        return kind
+    columns = [r[1] for r in conn.execute(f"PRAGMA main.table_info({kind})")]
+    parts = [f"SELECT {', '.join(columns)} FROM main.{kind}"]
+    for schema in schemas:
+        have = {r[1].lower() for r in conn.execute(f"PRAGMA {schema}.table_info({kind})")}
+        select = ", ".join(c if c.lower() in have else f"NULL AS {c}" for c in columns)
+        parts.append(f"SELECT {select} FROM {schema}.{kind}")
+    return f"({' UNION ALL '.join(parts)}) AS {kind}"
+
+
+def archive_rows(conn, sql, params=(), start=None, end=None):
+    """Run `sql` against every archive file overlapping [start, end] on its own connection and yield the rows."""
+    for year in archived_years(conn, start, end):
+        archive = sqlite3.connect(archive_path(year))
+        try:
+            yield from archive.execute(sql, params).fetchall()
+        finally:
+            archive.close()
+
+
+def recent_rows(conn, kind, columns, limit):
+    """(cursor, rows) for the `limit` newest rows; archives are read only if the hot table has too few."""
+    query = "SELECT {columns} FROM {source} ORDER BY date DESC LIMIT ?"
+    cursor = conn.execute(query.format(columns=columns, source=kind), (limit,))
+    rows = cursor.fetchall()
+    years = archived_years(conn)
+    if len(rows) < limit and years:
+        newest = years[-conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):]
+        cursor = conn.execute(query.format(columns=columns, source=ledger_source(conn, kind, f"{newest[0]}-01-01")),
+                              (limit,))
+        rows = cursor.fetchall()
+    return cursor, rows
+
+
+class RestoreConflict(Exception):
+    """Raised by restore_year when archived rows clash with rows now in the hot tables."""
+
+
+class ArchiveConflict(Exception):
+    """Raised by archive_year when hot rows clash with rows already in the archive file."""
+
+
+def _ensure_archive_table(conn, schema, kind):
+    """Create `kind` in the attached archive with the hot table's columns (adding any new ones)."""
+    columns = [(r[1], r[2]) for r in conn.execute(f"PRAGMA main.table_info({kind})")]
+    label = LEDGER_LABEL_COLUMNS[kind]
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{kind} (
+            {', '.join('id INTEGER PRIMARY KEY' if name == 'id' else f'{name} {ctype}' for name, ctype in columns)}
+        )
+    """)
+    have = {r[1].lower() for r in conn.execute(f"PRAGMA {schema}.table_info({kind})")}
+    for name, ctype in columns:
+        if name.lower() not in have:
+            conn.execute(f"ALTER TABLE {schema}.{kind} ADD COLUMN {name} {ctype}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{kind}_date ON {kind}(date)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{kind}_{label} ON {kind}({label}, date)")
+    return [name for name, _ in columns]
+
+
+def _index_archive_text(conn, schema, kind):
+    """(Re)build the archive's own full-text index so searches still find moved rows."""
+    label = LEDGER_LABEL_COLUMNS[kind]
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.{kind}_fts USING fts5(
+            notes, {label}, content='{kind}', content_rowid='id', {FTS_OPTIONS}
+        )
+    """)
+    conn.execute(f"INSERT INTO {schema}.{kind}_fts ({kind}_fts) VALUES ('rebuild')")
+
+
+def _year_bounds(year):
+    return f"{year}-01-01", f"{year + 1}-01-01"
+
+
+def archive_year(year):
+    """Move one closed year of both ledgers into its archive file; re-running appends late rows."""
+    year = int(year)
+    if year >= date.today().year:
+        raise ValueError("Only closed years (before the current one) can be archived")
+    path = archive_path(year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lo, hi = _year_bounds(year)
+
+    conn = get_connection()
+    conn.isolation_level = None
+    conn.execute("ATTACH DATABASE ? AS archive_new", (str(path),))
+    moved, archived = {}, {}
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind in LEDGER_LABEL_COLUMNS:
+                names = ", ".join(_ensure_archive_table(conn, "archive_new", kind))
+                copied = conn.execute(f"""
+                    INSERT OR IGNORE INTO archive_new.{kind} ({names})
+                    SELECT {names} FROM main.{kind} WHERE date >= ? AND date < ?
+                """, (lo, hi)).rowcount
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO archived_hashes (kind, content_hash)
+                    SELECT ?, content_hash FROM main.{kind}
+                    WHERE date >= ? AND date < ? AND content_hash IS NOT NULL
+                """, (kind, lo, hi))
+                moved[kind] = conn.execute(f"DELETE FROM main.{kind} WHERE date >= ? AND date < ?", (lo, hi)).rowcount
+                if copied != moved[kind]:
+                    # An id already taken in the archive (e.g. after a snapshot import) would lose the hot row
+                    raise ArchiveConflict(f"Only {copied} of {moved[kind]} {kind} rows for {year} could be "
+                                          f"copied to the archive; nothing was moved")
+                archived[kind] = conn.execute(f"SELECT COUNT(*) FROM archive_new.{kind}").fetchone()[0]
+                _index_archive_text(conn, "archive_new", kind)
+            conn.execute(
+                "INSERT OR REPLACE INTO archive_partitions (year, expenses, income, archived_at)"
+                " VALUES (?, ?, ?, datetime('now'))",
+                (year, archived["expenses"], archived["income"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("ANALYZE archive_new")
+    finally:
+        conn.execute("DETACH DATABASE archive_new")
+        conn.close()
+    return {"year": year, "moved": moved, "archived_rows": archived, "path": str(path)}
+
+
+def restore_year(year):
+    """Move an archived year back into the hot tables and delete its archive file."""
+    year = int(year)
+    conn = get_connection()
+    if year not in archived_years(conn):
+        conn.close()
+        raise ValueError(f"{year} is not archived")
+    conn.isolation_level = None
+    path = archive_path(year)
+    conn.execute("ATTACH DATABASE ? AS archive_old", (str(path),))
+    restored = {}
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind in LEDGER_LABEL_COLUMNS:
+                have = {r[1].lower() for r in conn.execute(f"PRAGMA archive_old.table_info({kind})")}
+                if not have:
+                    restored[kind] = 0
+                    continue
+                names = ", ".join(r[1] for r in conn.execute(f"PRAGMA main.table_info({kind})") if r[1].lower() in have)
+                restored[kind] = conn.execute(f"""
+                    INSERT OR IGNORE INTO main.{kind} ({names}) SELECT {names} FROM archive_old.{kind}
+                """).rowcount
+                archived = conn.execute(f"SELECT COUNT(*) FROM archive_old.{kind}").fetchone()[0]
+                if restored[kind] != archived:
+                    # Conflicting ids or hashes in the hot table (e.g. a snapshot import) would lose rows
+                    raise RestoreConflict(f"Only {restored[kind]} of {archived} archived {kind} rows for {year} "
+                                     f"could be restored; the archive was left in place")
+                conn.execute(f"""
+                    DELETE FROM archived_hashes
+                    WHERE kind = ? AND content_hash IN (SELECT content_hash FROM archive_old.{kind})
+                """, (kind,))
+            conn.execute("DELETE FROM archive_partitions WHERE year = ?", (year,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.execute("DETACH DATABASE archive_old")
+        conn.close()
+    path.unlink(missing_ok=True)
+    return {"year": year, "restored": restored}
+
+
+def archive_closed_years(hot_years=None):
+    """Archive every year older than the `hot_years` most recent closed years that still has hot rows."""
+    hot_years = ARCHIVE_HOT_YEARS if hot_years is None else hot_years
+    cutoff = f"{date.today().year - hot_years}-01-01"
+    conn = get_connection()
+    years = set()
+    for kind in LEDGER_LABEL_COLUMNS:
+        # One index seek per year that has rows, skipping empty years
+        after = ""
+        while True:
+            first = conn.execute(f"SELECT MIN(date) FROM {kind} WHERE date > ? AND date < ?",
+                                 (after, cutoff)).fetchone()[0]
+            if first is None:
+                break
+            if first[:4].isdigit():
+                years.add(int(first[:4]))
+                after = f"{first[:4]}-99"   # sorts after every date in that year
+            else:
+                after = first
+    conn.close()
+    return [archive_year(year) for year in sorted(years)]
+
+
+def list_partitions():
+    conn = get_connection()
+    hot = {kind: conn.execute(f"SELECT COUNT(*) FROM {kind}").fetchone()[0] for kind in LEDGER_LABEL_COLUMNS}
+    page_size, page_count, freelist = (conn.execute(f"PRAGMA {p}").fetchone()[0]
+                                       for p in ("page_size", "page_count", "freelist_count"))
+    partitions = [dict(r) for r in conn.execute(
+        "SELECT year, expenses, income, archived_at FROM archive_partitions ORDER BY year"
+    )]
+    conn.close()
+    for p in partitions:
+        path = archive_path(p["year"])
+        p["file_mb"] = round(path.stat().st_size / 1e6, 2) if path.exists() else None
+    return {
+        "hot": {**hot, "file_mb": round(page_size * page_count / 1e6, 2), "free_mb": round(page_size * freelist / 1e6, 2)},
+        "archives": partitions,
+        "last_maintenance": get_meta("last_maintenance"),
+    }
+
+
+# --- Maintenance ---
+def _claim_maintenance(force):
+    """Take the maintenance lease if a run is due (or forced) and no other worker holds it."""
+    conn = get_connection()
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        meta = dict(conn.execute(
+            "SELECT key, value FROM app_meta WHERE key IN ('last_maintenance', 'maintenance_lease')"
+        ).fetchall())
+        now = datetime.now()
+        last, lease = meta.get("last_maintenance"), meta.get("maintenance_lease")
+        due = last is None or now - datetime.fromisoformat(last) >= timedelta(hours=MAINTENANCE_INTERVAL_HOURS)
+        leased = lease is not None and now - datetime.fromisoformat(lease) < timedelta(minutes=MAINTENANCE_LEASE_MINUTES)
+        claimed = (due or force) and not leased
+        if claimed:
+            conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('maintenance_lease', ?)",
+                         (now.isoformat(timespec="seconds"),))
+        conn.execute("COMMIT")
+        return claimed
+    finally:
+        conn.close()
+
+
+def _release_maintenance(succeeded):
+    conn = get_connection()
+    if succeeded:
+        conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('last_maintenance', ?)",
+                     (datetime.now().isoformat(timespec="seconds"),))
+    conn.execute("DELETE FROM app_meta WHERE key = 'maintenance_lease'")
+    conn.commit()
+    conn.close()
+
+
+def run_maintenance(force=False):
+    if not _claim_maintenance(force):
+        return {"status": "skipped", "last_maintenance": get_meta("last_maintenance")}
+    try:
+        result = _maintain()
+    except Exception:
+        _release_maintenance(False)
+        raise
+    _release_maintenance(True)
+    return result
+
+
+def _maintain():
+    result = {"status": "done"}
+    if ARCHIVE_HOT_YEARS > 0:
+        result["archived"] = archive_closed_years()
+
+    conn = get_connection()
+    conn.isolation_level = None
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute("PRAGMA incremental_vacuum")
+            result["vacuum"] = {"freed_pages": freed}
+        else:
+            result["vacuum"] = "skipped: run `python -m tools.archive_manager enable-incremental-vacuum` once"
+
+        last_analyze = get_meta("last_analyze")
+        if (result.get("archived") or last_analyze is None
+                or datetime.now() - datetime.fromisoformat(last_analyze) >= timedelta(days=ANALYZE_INTERVAL_DAYS)):
+            conn.execute("ANALYZE")
+            set_meta("last_analyze", datetime.now().isoformat(timespec="seconds"))
+            result["analyzed"] = True
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    return result
+
+
+def enable_incremental_vacuum():
+    """Switch the hot database to auto_vacuum=INCREMENTAL; rewrites the whole file with VACUUM.
+
+    Run it once, while the API is stopped or idle: VACUUM needs exclusive
+    access and as much free disk as the database itself.
+    """
+    conn = get_connection()
+    conn.isolation_level = None
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return {"status": "already enabled"}
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return {"status": "enabled", "file_mb": round(Path(db_utils.DB_PATH).stat().st_size / 1e6, 2)}
+    finally:
+        conn.close()
+
+
+_scheduler_stop = threading.Event()
+
+
+def start_maintenance_scheduler():
+    """Check every MAINTENANCE_CHECK_SECONDS whether maintenance is due (no-op if the interval is 0)."""
+    if MAINTENANCE_INTERVAL_HOURS <= 0:
+        return None
+    _scheduler_stop.clear()
+
+    def loop():
+        while not _scheduler_stop.wait(MAINTENANCE_CHECK_SECONDS):
+            try:
+                result = run_maintenance()
+                if result["status"] != "skipped":
+                    print(f"Maintenance: {result}")
+            except Exception as e:
+                print(f"Maintenance failed: {e}")
+
+    thread = threading.Thread(target=loop, name="db-maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_maintenance_scheduler():
+    _scheduler_stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Archive closed years and run database maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    archive = sub.add_parser("archive")
+    archive.add_argument("year", type=int, nargs="?", help="default: every year older than ARCHIVE_HOT_YEARS")
+    restore = sub.add_parser("restore")
+    restore.add_argument("year", type=int)
+    sub.add_parser("maintain")
+    sub.add_parser("enable-incremental-vacuum")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        result = list_partitions()
+    elif args.command == "archive":
+        result = archive_year(args.year) if args.year else archive_closed_years(max(ARCHIVE_HOT_YEARS, 1))
+    elif args.command == "restore":
+        result = restore_year(args.year)
+    elif args.command == "maintain":
+        result = run_maintenance(force=True)
+    else:
+        result = enable_incremental_vacuum()
+    print(json.dumps(result, indent=2))
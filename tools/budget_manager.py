@@ -1,8 +1,151 @@
-from utils.db_utils import insert_budget, fetch_budgets, get_connection
+from datetime import date, timedelta
+
+from utils.db_utils import insert_budget, fetch_budgets, get_connection, ledger_range_total
+
+# budget_status holds each budget's spend for the period window containing
+# today (windows repeat every `period` from `start_date`). Expense inserts add
+# to it and record threshold crossings in budget_alerts; once today moves past
+# the window it is rolled over and re-seeded from the prefix-sum ledger.
+BUDGET_ALERT_THRESHOLDS = (0.8, 1.0)
+
+def init_budget_status(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS budget_status (
+        budget_id INTEGER PRIMARY KEY,
+        category TEXT NOT NULL,
+        window_start TEXT,
+        window_end TEXT,
+        spent REAL NOT NULL DEFAULT 0,
+        last_threshold REAL NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_budget_status_category ON budget_status(category)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_budgets_category ON budgets(category)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS budget_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        budget_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        window_start TEXT NOT NULL,
+        window_end TEXT NOT NULL,
+        threshold REAL NOT NULL,
+        spent REAL NOT NULL,
+        limit_amount REAL NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    """)
+    for (budget_id,) in conn.execute("SELECT id FROM budgets").fetchall():
+        refresh_budget_status(conn, budget_id)
+    if own:
+        conn.commit()
+        conn.close()
+
+def _add_months(day, months, anchor_day):
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    next_month = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+    last_day = (next_month - timedelta(days=1)).day
+    return date(year, month + 1, min(anchor_day, last_day))
+
+def budget_window(period, start_date, day):
+    """Return the (start, end) ISO window of a budget that contains `day`, or None before it starts."""
+    start = date.fromisoformat(str(start_date)[:10])
+    day = date.fromisoformat(str(day)[:10])
+    if day < start:
+        return None
+    period = (period or "monthly").lower()
+    if period in ("daily", "weekly"):
+        length = 1 if period == "daily" else 7
+        k = (day - start).days // length
+        window_start = start + timedelta(days=k * length)
+        window_end = window_start + timedelta(days=length - 1)
+    else:
+        step = 12 if period == "yearly" else 1
+        k = ((day.year - start.year) * 12 + day.month - start.month) // step
+        if _add_months(start, k * step, start.day) > day:
+            k -= 1
+        window_start = _add_months(start, k * step, start.day)
+        window_end = _add_months(start, (k + 1) * step, start.day) - timedelta(days=1)
+    return window_start.isoformat(), window_end.isoformat()
+
+def _record_budget_crossings(conn, status, limit_amount, before, after):
+    if not limit_amount or limit_amount <= 0:
+        return []
+    alerts = []
+    for threshold in BUDGET_ALERT_THRESHOLDS:
+        if threshold > status["last_threshold"] and before < threshold * limit_amount <= after:
+            conn.execute("""
+                INSERT INTO budget_alerts (budget_id, category, window_start, window_end, threshold, spent, limit_amount)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (status["budget_id"], status["category"], status["window_start"], status["window_end"],
+                  threshold, after, limit_amount))
+            status["last_threshold"] = threshold
+            alerts.append({"budget_id": status["budget_id"], "category": status["category"],
+                           "threshold": threshold, "spent": round(after, 2), "limit": limit_amount,
+                           "window_start": status["window_start"], "window_end": status["window_end"]})
+    return alerts
+
+def refresh_budget_status(conn, budget_id, today=None):
+    """Make sure a budget's status row covers the window containing today; returns it as a dict."""
+    today = today or date.today().isoformat()
+    budget = conn.execute("SELECT * FROM budgets WHERE id = ?", (budget_id,)).fetchone()
+    if budget is None:
+        return None
+    row = conn.execute("SELECT * FROM budget_status WHERE budget_id = ?", (budget_id,)).fetchone()
+    status = dict(row) if row else None
+    if status and status["window_start"] and status["window_start"] <= today <= status["window_end"]:
+        return status
+
+    window = budget_window(budget["period"], budget["start_date"], today)
+    status = {"budget_id": budget_id, "category": budget["category"], "window_start": None,
+              "window_end": None, "spent": 0.0, "last_threshold": 0.0}
+    if window:
+        status["window_start"], status["window_end"] = window
+        # Crossings already recorded for this window must not fire twice
+        recorded = conn.execute(
+            "SELECT MAX(threshold) FROM budget_alerts WHERE budget_id = ? AND window_start = ?",
+            (budget_id, window[0])
+        ).fetchone()[0]
+        status["last_threshold"] = recorded or 0.0
+        spent = ledger_range_total(conn, "expenses", window[0], window[1], budget["category"])
+        _record_budget_crossings(conn, status, budget["limit_amount"], 0.0, spent)
+        status["spent"] = spent
+    conn.execute("""
+        INSERT OR REPLACE INTO budget_status (budget_id, category, window_start, window_end, spent, last_threshold)
+        VALUES (:budget_id, :category, :window_start, :window_end, :spent, :last_threshold)
+    """, status)
+    return status
+
+def apply_budget_windows(conn, rows):
+    """Add new expense rows to the current window of every budget on their category."""
+    budgets = {}
+    for r in rows:
+        category = r["category"]
+        if category not in budgets:
+            ids = conn.execute("SELECT id, limit_amount FROM budgets WHERE category = ?", (category,)).fetchall()
+            budgets[category] = [(refresh_budget_status(conn, b["id"]), b["limit_amount"]) for b in ids]
+        day = str(r["date"])[:10]
+        for status, limit_amount in budgets[category]:
+            if not status["window_start"] or not (status["window_start"] <= day <= status["window_end"]):
+                continue
+            before = status["spent"]
+            status["spent"] = before + float(r["amount"] or 0)
+            alerts = _record_budget_crossings(conn, status, limit_amount, before, status["spent"])
+            if alerts:
+                r.setdefault("budget_alerts", []).extend(alerts)
+    for statuses in budgets.values():
+        for status, _ in statuses:
+            conn.execute(
+                "UPDATE budget_status SET spent = ?, last_threshold = ? WHERE budget_id = ?",
+                (status["spent"], status["last_threshold"], status["budget_id"])
+            )
 
 def add_budget(category: str, limit_amount: float, period: str, start_date: str):
-    insert_budget(category, limit_amount, period, start_date)
-    return {"status": "success", "message": "Budget added!"}
+    budget_id = insert_budget(category, limit_amount, period, start_date)
+    return {"status": "success", "message": "Budget added!", "id": budget_id}
 
 def list_budgets():
     return fetch_budgets()
@@ -10,19 +153,43 @@ def list_budgets():
 def check_budget_usage(category: str):
     conn = get_connection()
     cursor = conn.cursor()
-    # total spent in category
-    cursor.execute("SELECT SUM(amount) as total_spent FROM expenses WHERE category=?", (category,))
-    row = cursor.fetchone()
-    total_spent = row["total_spent"] if row["total_spent"] else 0
-
-    # fetch budget limit
-    cursor.execute("SELECT limit_amount FROM budgets WHERE category=? ORDER BY id DESC LIMIT 1", (category,))
-    row = cursor.fetchone()
-    budget_limit = row["limit_amount"] if row else None
+    # latest budget for the category
+    cursor.execute("SELECT id, limit_amount, period FROM budgets WHERE category=? ORDER BY id DESC LIMIT 1", (category,))
+    budget = cursor.fetchone()
+    if budget is None:
+        total_spent = ledger_range_total(conn, "expenses", category=category)
+        conn.close()
+        return {"category": category, "spent": total_spent, "limit": None, "status": "No budget set"}
 
+    # spend for the current window is maintained on insert, so this is a lookup
+    status = refresh_budget_status(conn, budget["id"])
+    conn.commit()
     conn.close()
-    if budget_limit is None:
-        return {"category": category, "spent": total_spent, "limit": None, "status": "No budget set"}
 
-    status = "OK" if total_spent <= budget_limit else "Exceeded"
-    return {"category": category, "spent": total_spent, "limit": budget_limit, "status": status}
+    budget_limit = budget["limit_amount"]
+    spent = round(status["spent"], 2)
+    if status["window_start"] is None:
+        state = "Not started"
+    else:
+        state = "OK" if spent <= budget_limit else "Exceeded"
+    return {
+        "category": category,
+        "spent": spent,
+        "limit": budget_limit,
+        "status": state,
+        "period": budget["period"],
+        "window_start": status["window_start"],
+        "window_end": status["window_end"],
+        "percent_used": round(spent / budget_limit * 100, 1) if budget_limit else None,
+    }
+
+def list_budget_alerts(limit: int = 50, category: str = None):
+    conn = get_connection()
+    cursor = conn.cursor()
+    if category:
+        cursor.execute("SELECT * FROM budget_alerts WHERE category=? ORDER BY id DESC LIMIT ?", (category, limit))
+    else:
+        cursor.execute("SELECT * FROM budget_alerts ORDER BY id DESC LIMIT ?", (limit,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
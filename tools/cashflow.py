@@ -0,0 +1,76 @@
+# tools/cashflow.py
+import json
+
+from utils.db_utils import get_connection, LEDGER_ALL
+
+# SQL expressions that map a YYYY-MM-DD day onto its bucket label
+RESOLUTIONS = {
+    "daily": "day",
+    "weekly": "date(day, 'weekday 0', '-6 days')",   # Monday starting the week
+    "monthly": "substr(day, 1, 7)",
+}
+
+
+def iter_cashflow(resolution="monthly", start=None, end=None, chunk_size=1000):
+    """Yield {period, income, expenses, net, balance} rows in period order.
+
+    Reads the all-category series of daily_ledger, so the raw tables are never
+    scanned; the running balance is a window SUM seeded with the net flow
+    before `start`.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {sorted(RESOLUTIONS)}")
+    bucket = RESOLUTIONS[resolution]
+    start = start[:10] if start else "0000-01-01"
+    end = end[:10] if end else "9999-12-31"
+
+    # StreamingResponse advances this generator from whichever threadpool worker is free
+    conn = get_connection(check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT
+          COALESCE((SELECT cumulative FROM daily_ledger
+                    WHERE kind = 'income' AND category = ? AND day < ?
+                    ORDER BY day DESC LIMIT 1), 0)
+        - COALESCE((SELECT cumulative FROM daily_ledger
+                    WHERE kind = 'expenses' AND category = ? AND day < ?
+                    ORDER BY day DESC LIMIT 1), 0)
+    """, (LEDGER_ALL, start, LEDGER_ALL, start))
+    opening = cur.fetchone()[0] or 0
+
+    cur.execute(f"""
+        SELECT period, income, expenses, income - expenses AS net,
+               ? + SUM(income - expenses) OVER (ORDER BY period) AS balance
+        FROM (
+            SELECT {bucket} AS period,
+                   SUM(CASE WHEN kind = 'income' THEN amount ELSE 0 END) AS income,
+                   SUM(CASE WHEN kind = 'expenses' THEN amount ELSE 0 END) AS expenses
+            FROM daily_ledger
+            WHERE category = ? AND day BETWEEN ? AND ?
+            GROUP BY period
+        )
+        ORDER BY period
+    """, (opening, LEDGER_ALL, start, end))
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for r in rows:
+                yield {
+                    "period": r["period"],
+                    "income": round(r["income"], 2),
+                    "expenses": round(r["expenses"], 2),
+                    "net": round(r["net"], 2),
+                    "balance": round(r["balance"], 2),
+                }
+    finally:
+        conn.close()
+
+
+def stream_cashflow_json(resolution="monthly", start=None, end=None):
+    """Serialize iter_cashflow as a JSON array, one row at a time."""
+    yield "["
+    for i, row in enumerate(iter_cashflow(resolution, start, end)):
+        yield ("," if i else "") + json.dumps(row)
+    yield "]"
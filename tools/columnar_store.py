@@ -0,0 +1,237 @@
+# tools/columnar_store.py
+"""In-memory columnar copies of the ledgers for the NLQ aggregates (COLUMNAR_BACKEND=1).
+
+Each API worker holds its own copy. Inserts made by this process are appended
+through the insert listener; writes from other workers (or any other process)
+are noticed through data_version() and trigger a full reload on the next query.
+"""
+import threading
+import numpy as np
+
+# Imported first so the answer cache's write counter is bumped before our listener reads data_version()
+from tools.answer_cache import data_version
+from utils.db_utils import get_connection, register_insert_listener
+from tools.archive_manager import archive_rows
+
+# Which column plays the role of "category" for each ledger table
+LEDGER_COLUMNS = {
+    "expenses": "category",
+    "income": "source",
+}
+
+_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*"
+
+
+def _to_days(dates):
+    # 'YYYY-MM-DD' strings -> int32 day numbers since 1970-01-01
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int32)
+
+
+def _day_to_iso(day):
+    return str(np.datetime64(int(day), "D"))
+
+
+def _month_to_iso(month):
+    return str(np.datetime64(int(month), "M"))
+
+
+class ColumnarLedger:
+    """In-memory columnar copy of one ledger table.
+
+    Dates are int32 day numbers, the category (or income source) is dictionary
+    encoded into int32 codes and amounts are float64. Rows are kept sorted by
+    day so date ranges resolve with searchsorted; backdated appends mark the
+    arrays unsorted and they are re-sorted once on the next query.
+    """
+
+    def __init__(self, table, capacity=1024):
+        self.table = table
+        self.category_column = LEDGER_COLUMNS[table]
+        self.days = np.empty(capacity, dtype=np.int32)
+        self.codes = np.empty(capacity, dtype=np.int32)
+        self.amounts = np.empty(capacity, dtype=np.float64)
+        self.categories = []   # code -> label
+        self._code_of = {}     # label -> code
+        self.size = 0
+        self._sorted = True
+        self._lock = threading.RLock()
+        self.version = None    # data_version() the arrays reflect
+
+    # --- Loading / appending ---
+    def load(self, chunk_size=50000):
+        conn = get_connection()
+        sql = f"""
+            SELECT substr(date, 1, 10), {self.category_column}, amount
+            FROM {self.table}
+            WHERE date GLOB ? AND amount IS NOT NULL
+            ORDER BY date
+        """
+        cur = conn.cursor()
+        with self._lock:
+            self.size = 0
+            self._sorted = True
+            # Archived years first: they predate the hot rows, so the arrays stay sorted
+            archived = list(archive_rows(conn, sql, (_DATE_GLOB,)))
+            if archived:
+                self._append_columns(*zip(*archived))
+            cur.execute(sql, (_DATE_GLOB,))
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                dates, cats, amounts = zip(*rows)
+                self._append_columns(dates, cats, amounts)
+        conn.close()
+        return self
+
+    def append(self, date, category, amount):
+        self.append_many([date], [category], [amount])
+
+    def append_many(self, dates, categories, amounts):
+        with self._lock:
+            self._append_columns(dates, categories, amounts)
+
+    def _append_columns(self, dates, categories, amounts):
+        n = len(dates)
+        if n == 0:
+            return
+        days = _to_days([str(d)[:10] for d in dates])
+        codes = np.fromiter((self._encode(c) for c in categories), dtype=np.int32, count=n)
+        self._reserve(self.size + n)
+        end = self.size + n
+        if self._sorted and (np.any(np.diff(days) < 0) or (self.size and days[0] < self.days[self.size - 1])):
+            self._sorted = False
+        self.days[self.size:end] = days
+        self.codes[self.size:end] = codes
+        self.amounts[self.size:end] = np.asarray(amounts, dtype=np.float64)
+        self.size = end
+
+    def _encode(self, label):
+        label = label if label is not None else "Other"
+        code = self._code_of.get(label)
+        if code is None:
+            code = len(self.categories)
+            self._code_of[label] = code
+            self.categories.append(label)
+        return code
+
+    def _reserve(self, needed):
+        capacity = len(self.days)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.days = np.resize(self.days, capacity)
+        self.codes = np.resize(self.codes, capacity)
+        self.amounts = np.resize(self.amounts, capacity)
+
+    def _ensure_sorted(self):
+        if self._sorted:
+            return
+        order = np.argsort(self.days[:self.size], kind="stable")
+        self.days[:self.size] = self.days[:self.size][order]
+        self.codes[:self.size] = self.codes[:self.size][order]
+        self.amounts[:self.size] = self.amounts[:self.size][order]
+        self._sorted = True
+
+    # --- Range helpers ---
+    def _range(self, start=None, end=None):
+        """Return (lo, hi) row positions for an inclusive ISO date range."""
+        self._ensure_sorted()
+        days = self.days[:self.size]
+        lo = int(np.searchsorted(days, _to_days([start[:10]])[0], side="left")) if start else 0
+        hi = int(np.searchsorted(days, _to_days([end[:10]])[0], side="right")) if end else self.size
+        return lo, max(lo, hi)
+
+    # --- Aggregations ---
+    def total(self, start=None, end=None):
+        with self._lock:
+            lo, hi = self._range(start, end)
+            return float(self.amounts[lo:hi].sum())
+
+    def totals_by_category(self, start=None, end=None):
+        """Return {label: total} for every category that has rows in the range."""
+        with self._lock:
+            lo, hi = self._range(start, end)
+            codes = self.codes[lo:hi]
+            n = len(self.categories)
+            sums = np.bincount(codes, weights=self.amounts[lo:hi], minlength=n)
+            present = np.flatnonzero(np.bincount(codes, minlength=n))
+            return {self.categories[i]: float(sums[i]) for i in present}
+
+    def top_categories(self, limit=5, start=None, end=None):
+        with self._lock:
+            lo, hi = self._range(start, end)
+            codes = self.codes[lo:hi]
+            n = len(self.categories)
+            sums = np.bincount(codes, weights=self.amounts[lo:hi], minlength=n)
+            present = np.flatnonzero(np.bincount(codes, minlength=n))
+            if limit is not None and limit < len(present):
+                part = np.argpartition(-sums[present], limit - 1)[:limit]
+                present = present[part]
+            present = present[np.argsort(-sums[present], kind="stable")]
+            return [{"category": self.categories[i], "total": float(sums[i])} for i in present]
+
+    def monthly_totals(self, start=None, end=None, limit=None, descending=True):
+        """Return [{'month': 'YYYY-MM', 'total': ...}] for months with rows in the range."""
+        with self._lock:
+            lo, hi = self._range(start, end)
+            if hi == lo:
+                return []
+            months = self.days[lo:hi].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            first = months[0]
+            idx = months - first
+            sums = np.bincount(idx, weights=self.amounts[lo:hi])
+            present = np.flatnonzero(np.bincount(idx))
+            if descending:
+                present = present[::-1]
+            if limit is not None:
+                present = present[:limit]
+            return [{"month": _month_to_iso(first + i), "total": float(sums[i])} for i in present]
+
+    def daily_totals(self, start=None, end=None):
+        """Return [{'date': 'YYYY-MM-DD', 'total': ...}] for days with rows in the range."""
+        with self._lock:
+            lo, hi = self._range(start, end)
+            days = self.days[lo:hi]
+            uniq, first_pos = np.unique(days, return_index=True)
+            sums = np.add.reduceat(self.amounts[lo:hi], first_pos) if len(first_pos) else []
+            return [{"date": _day_to_iso(d), "total": float(t)} for d, t in zip(uniq, sums)]
+
+
+# --- Process-wide ledgers, loaded lazily and kept current by insert listeners ---
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(table="expenses"):
+    """The loaded ledger, reloaded when the database changed outside this process."""
+    version = data_version()
+    ledger = _ledgers.get(table)
+    if ledger is None or ledger.version != version:
+        with _ledgers_lock:
+            ledger = _ledgers.get(table)
+            if ledger is None or ledger.version != version:
+                ledger = ColumnarLedger(table).load()
+                ledger.version = version
+                _ledgers[table] = ledger
+    return ledger
+
+
+def reset_ledgers():
+    """Drop loaded ledgers so the next query reloads them from SQLite."""
+    with _ledgers_lock:
+        _ledgers.clear()
+
+
+def _on_insert(table, rows):
+    ledger = _ledgers.get(table)
+    if ledger is None or not rows:
+        return
+    column = LEDGER_COLUMNS[table]
+    ledger.append_many([r["date"] for r in rows], [r[column] for r in rows], [r["amount"] for r in rows])
+    # Our own commit is now reflected; a concurrent foreign write in the same window is picked up by the next one
+    ledger.version = data_version()
+
+
+register_insert_listener(_on_insert)
@@ -0,0 +1,322 @@
+# tools/embedding_service.py
+"""Shared sentence-embedding service for multi-worker deployments.
+
+With `uvicorn --workers N` every worker that imports nlq_manager would load
+its own copy of the MiniLM model. Instead, run one service process that owns
+the model and answers encode requests over a Unix socket:
+
+    python -m tools.embedding_service serve --socket /tmp/pfc-embed.sock
+    EMBEDDING_SERVICE_SOCKET=/tmp/pfc-embed.sock uvicorn server:app --workers 4
+
+Requests from all callers are queued and encoded together: the batcher takes
+the first pending request, keeps collecting for up to BATCH_WINDOW_MS (or
+until MAX_BATCH_TEXTS), runs a single model.encode and hands each caller its
+slice. Frames are a 4-byte big-endian length followed by JSON; replies to
+`encode` carry the float32 matrix as raw bytes after the JSON header.
+
+`python -m tools.embedding_service measure --workers 4` compares the total
+resident memory of N in-process workers against N service-backed workers
+plus the service itself.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_TEXTS = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+CONNECT_TIMEOUT = 30
+
+_HEADER = struct.Struct(">I")
+
+
+def rss_mb(pid=None):
+    """Resident set size of a process in MB (Linux /proc)."""
+    with open(f"/proc/{pid or 'self'}/statm") as f:
+        pages = int(f.read().split()[1])
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+
+
+def load_model():
+    from dotenv import load_dotenv
+    from sentence_transformers import SentenceTransformer
+
+    load_dotenv()
+    return SentenceTransformer(MODEL_NAME, token=os.getenv("HF_TOKEN"))
+
+
+# --- Framing ---
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding service connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _send_frame(sock, payload, body=b""):
+    data = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data + body)
+
+
+def _recv_frame(sock):
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, length))
+
+
+# --- Server ---
+class _Pending:
+    __slots__ = ("texts", "done", "result", "error")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # one persistent connection per API worker thread
+
+
+class EmbeddingServer:
+    """Owns the encoder and micro-batches requests from every connection.
+
+    `encode_fn(list_of_texts) -> 2-D array` defaults to the MiniLM model.
+    """
+
+    def __init__(self, socket_path, encode_fn=None, batch_window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH_TEXTS):
+        if encode_fn is None:
+            model = load_model()
+            encode_fn = lambda texts: model.encode(texts, batch_size=max_batch, convert_to_numpy=True)
+        self.socket_path = socket_path
+        self.encode_fn = encode_fn
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.stats = {"requests": 0, "texts": 0, "batches": 0, "encode_ms": 0.0}
+        self._queue = queue.Queue()
+        self._server = None
+
+    def encode(self, texts):
+        """Queue `texts` for the next batch and block until they are encoded."""
+        pending = _Pending(texts)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error:
+            raise RuntimeError(pending.error)
+        return pending.result
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.batch_window
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+                size += len(item.texts)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        texts = [t for p in batch for t in p.texts]
+        started = time.perf_counter()
+        try:
+            vectors = np.asarray(self.encode_fn(texts), dtype=np.float32) if texts else np.zeros((0, 0), np.float32)
+        except Exception as e:
+            for p in batch:
+                p.error = str(e)
+                p.done.set()
+            return
+        self.stats["encode_ms"] += (time.perf_counter() - started) * 1000
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(batch)
+        self.stats["texts"] += len(texts)
+        offset = 0
+        for p in batch:
+            p.result = vectors[offset:offset + len(p.texts)]
+            offset += len(p.texts)
+            p.done.set()
+
+    def serve_forever(self):
+        service = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = _recv_frame(self.request)
+                    except (ConnectionError, OSError):
+                        return
+                    op = request.get("op", "encode")
+                    try:
+                        if op == "encode":
+                            vectors = service.encode([str(t) for t in request.get("texts", [])])
+                            _send_frame(self.request, {"shape": list(vectors.shape)}, vectors.tobytes())
+                        elif op == "stats":
+                            _send_frame(self.request, {**service.stats, "rss_mb": rss_mb(), "pid": os.getpid()})
+                        else:
+                            _send_frame(self.request, {"error": f"unknown op '{op}'"})
+                    except RuntimeError as e:
+                        _send_frame(self.request, {"error": str(e)})
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        self._server = _UnixServer(self.socket_path, Handler)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._queue.put(None)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self._server:
+            self._server.shutdown()
+
+
+# --- Client ---
+class EmbeddingClient:
+    """Thread-safe client; keeps one persistent connection per thread."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(CONNECT_TIMEOUT)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                raise RuntimeError(f"Embedding service not reachable at {self.socket_path}: {e}") from e
+            self._local.sock = sock
+        return sock
+
+    def _call(self, payload):
+        for attempt in (0, 1):
+            sock = self._connect()
+            try:
+                _send_frame(sock, payload)
+                header = _recv_frame(sock)
+                if "shape" in header:
+                    rows, dims = header["shape"]
+                    body = _recv_exact(sock, rows * dims * 4)
+                    return header, body
+                return header, b""
+            except (ConnectionError, OSError):
+                # Service restarted: reconnect once
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+
+    def encode(self, texts):
+        """Encode a string or list of strings; returns a float32 array (1-D for a single string)."""
+        single = isinstance(texts, str)
+        header, body = self._call({"op": "encode", "texts": [texts] if single else list(texts)})
+        if "error" in header:
+            raise RuntimeError(header["error"])
+        vectors = np.frombuffer(body, dtype=np.float32).reshape(header["shape"])
+        return vectors[0] if single else vectors
+
+    def stats(self):
+        return self._call({"op": "stats"})[0]
+
+
+# --- Memory comparison ---
+_WORKER_SNIPPET = (
+    "import tools.nlq_manager as n; n.classify_intent('how much did I spend this month');"
+    "from tools.embedding_service import rss_mb; print(rss_mb(), flush=True); import sys; sys.stdin.read()"
+)
+
+
+def _spawn_workers(n, env):
+    procs = [subprocess.Popen([sys.executable, "-c", _WORKER_SNIPPET], env=env, stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True) for _ in range(n)]
+    try:
+        return [float(p.stdout.readline()) for p in procs]
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+
+
+def measure_memory(workers=4, socket_path="/tmp/pfc-embed-measure.sock"):
+    """RSS of `workers` API-style processes with and without the shared service."""
+    base_env = {k: v for k, v in os.environ.items() if k != "EMBEDDING_SERVICE_SOCKET"}
+    in_process = _spawn_workers(workers, base_env)
+
+    service = subprocess.Popen([sys.executable, "-m", "tools.embedding_service", "serve", "--socket", socket_path])
+    try:
+        client = EmbeddingClient(socket_path)
+        for _ in range(600):
+            try:
+                client.encode("warmup")
+                break
+            except RuntimeError:
+                time.sleep(0.1)
+        shared = _spawn_workers(workers, {**base_env, "EMBEDDING_SERVICE_SOCKET": socket_path})
+        service_stats = client.stats()
+    finally:
+        service.terminate()
+        service.wait()
+
+    return {
+        "workers": workers,
+        "per_worker_model": {"worker_rss_mb": in_process, "total_mb": round(sum(in_process), 1)},
+        "shared_service": {
+            "worker_rss_mb": shared,
+            "service_rss_mb": service_stats["rss_mb"],
+            "total_mb": round(sum(shared) + service_stats["rss_mb"], 1),
+            "batches": service_stats["batches"],
+            "requests": service_stats["requests"],
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared MiniLM embedding service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--socket", default=os.getenv("EMBEDDING_SERVICE_SOCKET", "/tmp/pfc-embed.sock"))
+    serve.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS)
+    serve.add_argument("--max-batch", type=int, default=MAX_BATCH_TEXTS)
+    measure = sub.add_parser("measure")
+    measure.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = EmbeddingServer(args.socket, batch_window_ms=args.batch_window_ms, max_batch=args.max_batch)
+        print(f"Embedding service ({MODEL_NAME}) listening on {args.socket}, rss={rss_mb()} MB", flush=True)
+        server.serve_forever()
+    else:
+        print(json.dumps(measure_memory(args.workers), indent=2))
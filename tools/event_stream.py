@@ -0,0 +1,131 @@
+# tools/event_stream.py
+"""Server-Sent Events fan-out for committed ledger changes.
+
+After each committed insert the insert listener publishes compact events:
+
+    transaction    - table, count and (up to EVENT_ROW_SAMPLE) new rows
+    aggregates     - month-to-date totals overall and for the touched categories
+    budget_alert   - threshold crossings raised by the insert
+
+Each client gets a bounded queue. A client that falls behind has its oldest
+events dropped and receives a `resync` event telling it to refetch everything,
+so one slow consumer never blocks the others or grows memory.
+"""
+import asyncio
+import json
+import os
+import threading
+from datetime import date
+
+from utils.db_utils import get_connection, ledger_range_total, register_insert_listener, LEDGER_LABEL_COLUMNS
+
+MAX_EVENT_CLIENTS = int(os.getenv("MAX_EVENT_CLIENTS", "50"))
+CLIENT_QUEUE_SIZE = 100
+EVENT_ROW_SAMPLE = 20
+HEARTBEAT_SECONDS = 15
+
+
+class _Client:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+
+class EventBroker:
+    def __init__(self, max_clients=MAX_EVENT_CLIENTS, queue_size=CLIENT_QUEUE_SIZE):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._seq = 0
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        """Register a client on the running event loop; returns None when at capacity."""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            self._loop = asyncio.get_running_loop()
+            client = _Client(self.queue_size)
+            self._clients.add(client)
+            return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, event, data):
+        """Thread-safe: may be called from worker threads after a commit."""
+        loop = self._loop
+        if loop is None or not self._clients or loop.is_closed():
+            return
+        with self._lock:
+            self._seq += 1
+            message = (self._seq, event, json.dumps(data, default=str))
+        loop.call_soon_threadsafe(self._fanout, message)
+
+    def _fanout(self, message):
+        for client in list(self._clients):
+            if client.queue.full():
+                client.queue.get_nowait()
+                client.dropped += 1
+            client.queue.put_nowait(message)
+
+    async def stream(self, client, is_disconnected):
+        """Yield SSE-formatted messages for `client` until it disconnects."""
+        try:
+            yield "retry: 3000\n\n"
+            while not await is_disconnected():
+                if client.dropped:
+                    client.dropped = 0
+                    yield "event: resync\ndata: {}\n\n"
+                try:
+                    seq, event, data = await asyncio.wait_for(client.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+        finally:
+            self.unsubscribe(client)
+
+
+broker = EventBroker()
+
+
+# --- Publishing from the insert path ---
+def _month_to_date(conn, categories):
+    today = date.today()
+    start, end = today.replace(day=1).isoformat(), today.isoformat()
+    return {
+        "start": start,
+        "end": end,
+        "expenses": ledger_range_total(conn, "expenses", start, end),
+        "income": ledger_range_total(conn, "income", start, end),
+        "categories": {c: ledger_range_total(conn, "expenses", start, end, c) for c in categories},
+    }
+
+
+def _on_insert(table, rows):
+    if not broker.client_count:
+        return
+    label = LEDGER_LABEL_COLUMNS.get(table)
+    sample = [{k: r.get(k) for k in ("id", "date", label, "amount", "notes")} for r in rows[:EVENT_ROW_SAMPLE]]
+    broker.publish("transaction", {"table": table, "count": len(rows), "rows": sample})
+
+    categories = sorted({r[label] for r in rows}) if table == "expenses" else []
+    conn = get_connection()
+    try:
+        broker.publish("aggregates", {"month_to_date": _month_to_date(conn, categories)})
+    finally:
+        conn.close()
+
+    for r in rows:
+        for alert in r.get("budget_alerts", []):
+            broker.publish("budget_alert", alert)
+
+
+register_insert_listener(_on_insert)
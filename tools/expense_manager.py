@@ -4,8 +4,8 @@ import pandas as pd
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from utils.db_utils import (DB_PATH, insert_expense, fetch_expenses,
-                            get_top_categories, get_expense_trends)
+from utils.db_utils import (DB_PATH, insert_expenses_batch, fetch_expenses, get_connection, ledger_range_total,
+                            get_top_categories as db_top_categories, get_expense_trends)
 
 
 
@@ -51,38 +51,29 @@ def check_budget(budgets, month="2025-09"):
                   
 
 def get_total_spent():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT SUM(amount) FROM expenses")
-    total = cursor.fetchone()[0]
+    conn = get_connection()
+    total = ledger_range_total(conn, "expenses")
     conn.close()
     return {"total_spent": total}
 
 def get_top_categories(limit=3):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT category, SUM(amount) as total FROM expenses GROUP BY category ORDER BY total DESC LIMIT ?", (limit,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [{"category": r[0], "total": r[1]} for r in rows]
-
-
-def add_expense(category: str, amount: float, date: str, notes: str = ""):
-    insert_expense(category, amount, date, notes)
-    return {"status": "success", "message": "Expense added!"}
+    return db_top_categories(limit)
 
-def list_expenses(limit: int = 50):
-    return fetch_expenses(limit)
 
-def add_expense(category: str, amount: float, date: str, notes: str = ""):
-    insert_expense(category, amount, date, notes)
-    return {"status": "success", "message": "Expense added!"}
+def add_expense(category: str, amount: float, date: str, notes: str = "", currency: str = None):
+    inserted = insert_expenses_batch([(category, amount, date, notes, currency)])
+    if not inserted:
+        return {"status": "duplicate", "message": "Expense already recorded", "duplicates": 1}
+    row = inserted[0]
+    return {"status": "success", "message": "Expense added!", "id": row["id"], "duplicates": 0,
+            "anomaly": row.get("anomaly"), "budget_alerts": row.get("budget_alerts", [])}
 
-def list_expenses(limit: int = 50):
-    return fetch_expenses(limit)
+def list_expenses(limit: int = 50, as_columns: bool = False):
+    return fetch_expenses(limit, as_columns)
 
 def top_categories(limit: int = 5):
     return get_top_categories(limit)
 
-def expense_trends():
-    return get_expense_trends()
+def expense_trends(as_columns: bool = False, resolution: str = "day", start: str = None, end: str = None,
+                   category: str = None, by_category: bool = False, max_points: int = None):
+    return get_expense_trends(as_columns, resolution, start, end, category, by_category, max_points)
@@ -0,0 +1,260 @@
+# tools/fx_manager.py
+"""FX rates and re-rating of stored base-currency amounts.
+
+Rates are loaded from a local CSV (date,currency,rate — the base-currency
+value of one unit of `currency` from that date on). Inserts convert with the
+rate in effect on the transaction date, so aggregates remain plain SUMs.
+When rates are corrected, `rerate` recomputes amount = original_amount * rate
+in rowid-ranged batches (short write transactions), in the hot tables and in
+every archived year the correction reaches, and then rebuilds the derived
+tables once.
+
+Usage:
+    python -m tools.fx_manager load data/fx_rates.csv
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from utils.db_utils import get_connection, rebuild_daily_ledger, BASE_CURRENCY, LEDGER_LABEL_COLUMNS
+from tools.anomaly_detector import rebuild_category_stats
+from tools.archive_manager import archive_path, archived_years
+from tools.budget_manager import init_budget_status
+from tools.report_jobs import prune_finished
+
+FX_RATES_PATH = Path(__file__).parent.parent / "data" / "fx_rates.csv"
+# The API only loads rate files from this directory
+FX_RATES_DIR = Path(os.getenv("FX_RATES_DIR", FX_RATES_PATH.parent))
+RERATE_BATCH_ROWS = 20000
+
+
+# --- Rates ---
+# fx_rates holds the base-currency value of one unit of `currency` from `day`
+# onwards; a row uses the latest rate on or before its date.
+def init_fx_rates(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            currency TEXT NOT NULL,
+            day TEXT NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, day)
+        )
+    """)
+    if own:
+        conn.commit()
+        conn.close()
+
+
+def fx_rate(conn, currency, day):
+    """Base-currency value of one unit of `currency` on `day`; raises ValueError if unknown."""
+    currency = (currency or BASE_CURRENCY).upper()
+    if currency == BASE_CURRENCY:
+        return 1.0
+    row = conn.execute(
+        "SELECT rate FROM fx_rates WHERE currency = ? AND day <= ? ORDER BY day DESC LIMIT 1",
+        (currency, str(day)[:10])
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"No FX rate for {currency} on or before {str(day)[:10]}")
+    return row[0]
+
+
+def to_base(conn, rates, amount, date, currency):
+    """(base amount, rate, currency) for one row, caching rates per (currency, day) within a batch."""
+    currency = (currency or BASE_CURRENCY).upper()
+    key = (currency, str(date)[:10])
+    if key not in rates:
+        rates[key] = fx_rate(conn, currency, date)
+    rate = rates[key]
+    return round(float(amount) * rate, 2), rate, currency
+
+
+def rates_file(name=None):
+    """Resolve a rate file name from an API request inside FX_RATES_DIR; rejects paths that leave it."""
+    if not name:
+        return FX_RATES_PATH
+    root = FX_RATES_DIR.resolve()
+    path = (root / name).resolve()
+    if not path.is_relative_to(root):
+        raise ValueError(f"FX rate files must be inside {FX_RATES_DIR}")
+    return path
+
+
+def load_fx_rates(path=None):
+    """Upsert rates from a CSV file; returns what changed so re-rating can be scoped."""
+    path = Path(path or FX_RATES_PATH)
+    if not path.exists():
+        raise ValueError(f"FX rate file not found: {path}")
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            currency = r["currency"].strip().upper()
+            if currency == BASE_CURRENCY:
+                continue
+            rate = float(r["rate"])
+            if rate <= 0:
+                raise ValueError(f"Invalid FX rate {rate} for {currency} on {r['date']}")
+            rows.append((currency, r["date"].strip()[:10], rate))
+
+    conn = get_connection()
+    changed = [
+        row for row in rows
+        if conn.execute("SELECT 1 FROM fx_rates WHERE currency = ? AND day = ? AND rate = ?", row).fetchone() is None
+    ]
+    conn.executemany("INSERT OR REPLACE INTO fx_rates (currency, day, rate) VALUES (?, ?, ?)", changed)
+    conn.commit()
+    conn.close()
+    return {
+        "rates": len(rows),
+        "changed": len(changed),
+        "currencies": sorted({c for c, _, _ in changed}),
+        "since": min((d for _, d, _ in changed), default=None),
+    }
+
+
+def list_fx_rates(currency=None, limit=100):
+    conn = get_connection()
+    query = "SELECT currency, day, rate FROM fx_rates"
+    params = []
+    if currency:
+        query += " WHERE currency = ?"
+        params.append(currency.upper())
+    query += " ORDER BY currency, day DESC LIMIT ?"
+    rows = conn.execute(query, params + [limit]).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+# --- Re-rating ---
+_RATE_ON_DATE = """(SELECT f.rate FROM fx_rates f
+                    WHERE f.currency = {table}.currency AND f.day <= substr({table}.date, 1, 10)
+                    ORDER BY f.day DESC LIMIT 1)"""
+
+
+def _rerate_table(conn, schema, table, currencies, since, batch_rows, stats, on_progress):
+    rate = _RATE_ON_DATE.format(table=table)
+    where = [f"currency != '{BASE_CURRENCY}'"]
+    params = []
+    if currencies:
+        where.append(f"currency IN ({','.join('?' * len(currencies))})")
+        params += [c.upper() for c in currencies]
+    if since:
+        where.append("date >= ?")
+        params.append(since)
+    lo, hi = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {schema}.{table} WHERE {' AND '.join(where)}",
+                          params).fetchone()
+    if lo is None:
+        return
+    for start in range(lo, hi + 1, batch_rows):
+        before = conn.total_changes
+        conn.execute(f"""
+            UPDATE {schema}.{table}
+            SET fx_rate = COALESCE({rate}, fx_rate),
+                amount = ROUND(original_amount * COALESCE({rate}, fx_rate), 2)
+            WHERE rowid >= ? AND rowid < ? AND {' AND '.join(where)}
+              AND fx_rate IS NOT COALESCE({rate}, fx_rate)
+        """, [start, start + batch_rows] + params)
+        conn.commit()
+        stats["updated"] += conn.total_changes - before
+        stats["scanned_batches"] += 1
+        if on_progress:
+            on_progress(dict(stats))
+
+
+def rerate(currencies=None, since=None, batch_rows=RERATE_BATCH_ROWS, on_progress=None):
+    """Recompute base amounts of non-base-currency rows (archived years included), then rebuild derived tables."""
+    stats = {"scanned_batches": 0, "updated": 0}
+    conn = get_connection()
+    try:
+        for table in LEDGER_LABEL_COLUMNS:
+            _rerate_table(conn, "main", table, currencies, since, batch_rows, stats, on_progress)
+            # Archives are visited after the hot table, so a year archived meanwhile is still covered
+            for year in archived_years(conn, since):
+                schema = f"archive_{year}"
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(archive_path(year)),))
+                try:
+                    columns = {r[1].lower() for r in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+                    if "fx_rate" in columns:
+                        _rerate_table(conn, schema, table, currencies, since, batch_rows, stats, on_progress)
+                finally:
+                    conn.rollback()
+                    conn.execute(f"DETACH DATABASE {schema}")
+
+        if stats["updated"]:
+            # Every derived table is keyed on the stored base amounts
+            rebuild_daily_ledger(conn)
+            rebuild_category_stats(conn)
+            conn.execute("DELETE FROM budget_status")
+            init_budget_status(conn)
+            conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('recurring_built', '0')")
+            conn.commit()
+    finally:
+        conn.close()
+
+    if stats["updated"]:
+        from tools.columnar_store import reset_ledgers
+        reset_ledgers()
+    return stats
+
+
+# --- Background jobs ---
+# Finished jobs are forgotten after RERATE_TTL_HOURS, or sooner once more than
+# MAX_KEPT_RERATES have finished
+RERATE_TTL_HOURS = float(os.getenv("RERATE_TTL_HOURS", "24"))
+MAX_KEPT_RERATES = int(os.getenv("MAX_KEPT_RERATES", "50"))
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_rerate(currencies=None, since=None):
+    """Register a re-rating job and return (job_id, runner); call runner() in a worker thread."""
+    job_id = uuid.uuid4().hex[:12]
+    with _jobs_lock:
+        prune_finished(_jobs, lambda j: j["status"] in ("done", "failed"),
+                       ttl_hours=RERATE_TTL_HOURS, max_kept=MAX_KEPT_RERATES)
+        _jobs[job_id] = {"id": job_id, "status": "queued", "currencies": currencies, "since": since,
+                         "created": time.monotonic()}
+
+    def update(stats):
+        with _jobs_lock:
+            _jobs[job_id].update(stats)
+
+    def runner():
+        update({"status": "running"})
+        try:
+            update({**rerate(currencies, since, on_progress=update), "status": "done"})
+        except Exception as e:
+            update({"status": "failed", "error": str(e)})
+
+    return job_id, runner
+
+
+def get_rerate_status(job_id):
+    with _jobs_lock:
+        status = _jobs.get(job_id)
+        return {k: v for k, v in status.items() if k != "created"} if status else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load FX rates and re-rate stored amounts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    load = sub.add_parser("load")
+    load.add_argument("path", nargs="?", default=None)
+    sub.add_parser("rerate")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        result = load_fx_rates(args.path)
+        print(json.dumps(result))
+        if result["changed"]:
+            print(json.dumps(rerate(result["currencies"], result["since"])))
+    else:
+        print(json.dumps(rerate()))
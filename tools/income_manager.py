@@ -1,8 +1,10 @@
 from utils.db_utils import insert_income, fetch_income
 
-def add_income(source: str, amount: float, date: str, notes: str = ""):
-    insert_income(source, amount, date, notes)
-    return {"status": "success", "message": "Income added!"}
+def add_income(source: str, amount: float, date: str, notes: str = "", currency: str = None):
+    income_id = insert_income(source, amount, date, notes, currency)
+    if income_id is None:
+        return {"status": "duplicate", "message": "Income already recorded", "duplicates": 1}
+    return {"status": "success", "message": "Income added!", "id": income_id, "duplicates": 0}
 
-def list_income(limit: int = 50):
-    return fetch_income(limit)
+def list_income(limit: int = 50, as_columns: bool = False):
+    return fetch_income(limit, as_columns)
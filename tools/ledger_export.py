@@ -0,0 +1,214 @@
+# tools/ledger_export.py
+"""Streaming CSV / XLSX export of the expense and income ledgers.
+
+Rows are read with fetchmany(EXPORT_CHUNK_ROWS) and encoded one chunk at a
+time, so peak memory is one chunk of rows plus the encoder's buffers no
+matter how many rows match. XLSX is written as a minimal SpreadsheetML
+package straight into a streaming zip (inline strings, no shared-string
+table), since openpyxl's writer only assembles the zip at save time.
+
+    python -m tools.ledger_export expenses --format xlsx --start 2024-01-01 > expenses.xlsx
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from utils.db_utils import get_connection, LEDGER_LABEL_COLUMNS
+from tools.archive_manager import archived_years, ledger_source
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_CHUNK_ROWS = 5000
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _export_segments(conn, start, end):
+    """Inclusive (first, last, archived year or None) date pieces covering [start, end] in order."""
+    bound, end = (start[:10] if start else None), (end[:10] if end else None)
+    for year in archived_years(conn, start, end):
+        first, last = f"{year}-01-01", f"{year}-12-31"
+        if bound is None or bound < first:
+            yield bound, f"{year - 1}-12-31", None
+        yield max(bound or first, first), min(end or last, last), year
+        bound = f"{year + 1}-01-01"
+    if bound is None or end is None or bound <= end:
+        yield bound, end, None
+
+
+def _export_cursor(conn, kind, start, end, category, source=None):
+    label = LEDGER_LABEL_COLUMNS[kind]
+    where, params = [], []
+    if start:
+        where.append("date >= ?")
+        params.append(start[:10])
+    if end:
+        where.append("date < date(?, '+1 day')")
+        params.append(end[:10])
+    if category:
+        where.append(f"{label} = ? COLLATE NOCASE")
+        params.append(category)
+    return conn.execute(f"""
+        SELECT id, date, {label}, notes AS notes, amount, currency, original_amount FROM {source or kind}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY date, id
+    """, params)
+
+
+def _iter_chunks(kind, start, end, category, chunk_rows):
+    """Yield the header, then lists of row tuples; the connection closes with the generator.
+
+    Archived years are read one segment at a time, each with only its own
+    archive attached, so an all-time export is not limited by SQLite's
+    ATTACH limit and rows still come out in date order.
+    """
+    # Starlette advances sync iterators from whichever threadpool worker is free
+    conn = get_connection(check_same_thread=False)
+    conn.row_factory = None
+    try:
+        yield ["id", "date", LEDGER_LABEL_COLUMNS[kind], "notes", "amount", "currency", "original_amount"]
+        for lo, hi, year in _export_segments(conn, start, end):
+            source = ledger_source(conn, kind, lo, hi) if year else None
+            cursor = _export_cursor(conn, kind, lo, hi, category, source)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+            if year:
+                conn.execute(f"DETACH DATABASE archive_{year}")
+    finally:
+        conn.close()
+
+
+def _iter_csv(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(next(chunks))
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable file that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value!r}</v></c>"
+    text = escape(_INVALID_XML.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return "<row>" + "".join(_xlsx_cell(v) for v in values) + "</row>"
+
+
+def _iter_xlsx(chunks, sheet_name):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_STATIC.items():
+            zf.writestr(name, xml)
+        zf.writestr("xl/workbook.xml", _WORKBOOK_XML.format(name=sheet_name))
+        # The size is unknown up front; zip64 keeps >4 GB sheets valid
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(_xlsx_row(next(chunks)).encode("utf-8"))
+            for rows in chunks:
+                sheet.write("".join(_xlsx_row(r) for r in rows).encode("utf-8"))
+                yield sink.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+def export_transactions(kind, fmt="csv", start=None, end=None, category=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Validate, then return (media_type, filename, byte iterator) for a streamed export."""
+    if kind not in LEDGER_LABEL_COLUMNS:
+        raise ValueError(f"Unknown ledger '{kind}'")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {list(EXPORT_FORMATS)}")
+    chunks = _iter_chunks(kind, start, end, category, chunk_rows)
+    body = _iter_csv(chunks) if fmt == "csv" else _iter_xlsx(chunks, kind.title())
+    return EXPORT_FORMATS[fmt], f"{kind}.{fmt}", body
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Stream a ledger export to stdout")
+    parser.add_argument("kind", choices=list(LEDGER_LABEL_COLUMNS))
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--category")
+    args = parser.parse_args()
+    _, _, body = export_transactions(args.kind, args.format, args.start, args.end, args.category)
+    for block in body:
+        sys.stdout.buffer.write(block)
@@ -1,9 +1,11 @@
 # tools/nlq_manager.py
-from sentence_transformers import SentenceTransformer, util
 import numpy as np
 import re
 from datetime import datetime, date, timedelta
-from utils.db_utils import get_connection
+from utils.db_utils import get_connection, ledger_range_total, LEDGER_ALL
+from tools.archive_manager import recent_rows
+from tools.prefix_ledger import range_total, range_totals_by_category, monthly_totals
+from tools.answer_cache import answer_cache, data_version
 import os
 from dotenv import load_dotenv
 
@@ -11,9 +13,29 @@ from dotenv import load_dotenv
 load_dotenv()
 hf_token = os.getenv("HF_TOKEN")
 
-# Load a small CPU-friendly HF model (cached locally after first run)
+# Optional in-memory columnar backend for the aggregate handlers (COLUMNAR_BACKEND=1)
+_USE_COLUMNAR = os.getenv("COLUMNAR_BACKEND", "0").lower() in ("1", "true", "yes")
+if _USE_COLUMNAR:
+    from tools.columnar_store import get_ledger
+
+# Embeddings come from a shared service process when EMBEDDING_SERVICE_SOCKET is
+# set (see tools/embedding_service.py); otherwise this process loads its own
+# copy of the small CPU-friendly HF model (cached locally after first run)
 _MODEL_NAME = "all-MiniLM-L6-v2"
-_model = SentenceTransformer(_MODEL_NAME, token=hf_token)
+_EMBEDDING_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET")
+if _EMBEDDING_SOCKET:
+    from tools.embedding_service import EmbeddingClient
+    _model = EmbeddingClient(_EMBEDDING_SOCKET)
+else:
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(_MODEL_NAME, token=hf_token)
+
+
+def embed_texts(texts):
+    """Unit-normalized float32 embeddings, so a dot product is cosine similarity."""
+    vectors = np.asarray(_model.encode(texts), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
 
 # Define intents with short descriptions (used for semantic matching)
 INTENTS = [
@@ -45,12 +67,31 @@ INTENTS = [
     "name": "predict_future_expenses",
     "desc": "Predict or forecast next month's total or category-wise expenses using past spending trends or monthly totals.",
 },
-
+    {
+        "name": "compare_monthly_expenses",
+        "desc": "Compare this month's total expenses with last month's.",
+    },
+    {
+        "name": "expense_breakdown",
+        "desc": "Break down expenses category wise, with the total spent per category.",
+    },
+    {
+        "name": "monthly_income_summary",
+        "desc": "Return income totals per month or a specific month's total income.",
+    },
 ]
 
-# Precompute intent embeddings
+# Intent embeddings are computed on first use, so importing this module does
+# not require the embedding service to be up yet
 _intent_texts = [it["desc"] for it in INTENTS]
-_intent_embeddings = _model.encode(_intent_texts, convert_to_tensor=True)
+_intent_embeddings = None
+
+
+def _get_intent_embeddings():
+    global _intent_embeddings
+    if _intent_embeddings is None:
+        _intent_embeddings = embed_texts(_intent_texts)
+    return _intent_embeddings
 
 
 # --- Helpers: Parse parameters from free text ---
@@ -117,10 +158,11 @@ def _detect_income_or_expense(query: str):
 
 
 # --- Intent matching using embeddings ---
-def classify_intent(query: str, top_k=1):
-    q_emb = _model.encode(query, convert_to_tensor=True)
-    cos_scores = util.cos_sim(q_emb, _intent_embeddings)[0]
-    top_results = np.argpartition(-cos_scores.cpu().numpy(), range(top_k))[:top_k]
+def classify_intent(query: str, top_k=1, q_emb=None):
+    if q_emb is None:
+        q_emb = embed_texts(query)
+    cos_scores = _get_intent_embeddings() @ q_emb
+    top_results = np.argpartition(-cos_scores, range(top_k))[:top_k]
     best_idx = int(top_results[0])
     score = float(cos_scores[best_idx])
     intent = INTENTS[best_idx]["name"]
@@ -129,7 +171,8 @@ def classify_intent(query: str, top_k=1):
 
 # --- Main handler that maps query -> DB results ---
 def handle_query(query: str):
-    intent, score = classify_intent(query)
+    q_emb = embed_texts(query)
+    intent, score = classify_intent(query, q_emb=q_emb)
     print(f"Detected intent: {intent} (score={score:.3f}) for query='{query}'")
 
     params = {}
@@ -141,6 +184,19 @@ def handle_query(query: str):
 
     params.update({"limit": limit, "date_range": date_range, "category": category, "type": typ})
 
+    # Near-duplicate phrasing of an answered question: no SQL needed
+    cached = answer_cache.get(intent, params, q_emb)
+    if cached is not None:
+        return cached
+    version = data_version()
+    result = _dispatch(intent, params)
+    if result is None:
+        return {"error": "Could not understand query", "intent": intent, "score": score, "params": params}
+    answer_cache.put(intent, params, q_emb, result, version)
+    return result
+
+
+def _dispatch(intent, params):
     if intent == "top_expense_categories":
         return _top_expense_categories(params)
     if intent == "monthly_expense_summary":
@@ -161,98 +217,54 @@ def handle_query(query: str):
         return _compare_monthly_expenses(params)
     if intent == "predict_future_expenses":
         return _predict_future_expenses(params)
-
-
-    return {"error": "Could not understand query", "intent": intent, "score": score, "params": params}
+    return None
 
 
 # --- Query implementations ---
 def _top_expense_categories(params):
     limit = params.get("limit", 5)
-    dr = params.get("date_range", None)
-    conn = get_connection()
-    cur = conn.cursor()
-    if dr:
-        start, end = dr
-        cur.execute("""
-            SELECT category, SUM(amount) as total
-            FROM expenses
-            WHERE date BETWEEN ? AND ?
-            GROUP BY category
-            ORDER BY total DESC
-            LIMIT ?
-        """, (start, end, limit))
-    else:
-        cur.execute("""
-            SELECT category, SUM(amount) as total
-            FROM expenses
-            GROUP BY category
-            ORDER BY total DESC
-            LIMIT ?
-        """, (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    return {"intent": "top_expense_categories", "result": [dict(r) for r in rows]}
+    start, end = params.get("date_range") or (None, None)
+    if _USE_COLUMNAR:
+        return {"intent": "top_expense_categories", "result": get_ledger("expenses").top_categories(limit, start, end)}
+    return {"intent": "top_expense_categories", "result": range_totals_by_category("expenses", start, end)[:limit]}
 
 
 def _monthly_expense_summary(params):
     dr = params.get("date_range", None)
-    conn = get_connection()
-    cur = conn.cursor()
+    if _USE_COLUMNAR:
+        ledger = get_ledger("expenses")
+        if dr:
+            start, end = dr
+            return {"intent": "monthly_expense_summary", "result": {"start": start, "end": end, "total": ledger.total(start, end)}}
+        return {"intent": "monthly_expense_summary", "result": ledger.monthly_totals(limit=12)}
     if dr:
         start, end = dr
-        cur.execute("SELECT SUM(amount) as total FROM expenses WHERE date BETWEEN ? AND ?", (start, end))
-        row = cur.fetchone()
-        conn.close()
-        return {"intent": "monthly_expense_summary", "result": {"start": start, "end": end, "total": row["total"] or 0}}
+        return {"intent": "monthly_expense_summary", "result": {"start": start, "end": end, "total": range_total("expenses", start, end)}}
     else:
-        cur.execute("""
-            SELECT strftime('%Y-%m', date) AS month, SUM(amount) as total
-            FROM expenses
-            GROUP BY month
-            ORDER BY month DESC
-            LIMIT 12
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"intent": "monthly_expense_summary", "result": [dict(r) for r in rows]}
+        return {"intent": "monthly_expense_summary", "result": monthly_totals("expenses", limit=12)}
 
 
 def _income_vs_expense(params):
     dr = params.get("date_range", None)
-    conn = get_connection()
-    cur = conn.cursor()
-
     if dr:
         start, end = dr
-        cur.execute("""
-            SELECT
-              (SELECT IFNULL(SUM(amount),0) FROM income WHERE date BETWEEN ? AND ?) as income,
-              (SELECT IFNULL(SUM(amount),0) FROM expenses WHERE date BETWEEN ? AND ?) as expense
-        """, (start, end, start, end))
-        row = cur.fetchone()
-        conn.close()
-        income = row[0] or 0
-        expense = row[1] or 0
+        income = range_total("income", start, end)
+        expense = range_total("expenses", start, end)
         return {"intent": "income_vs_expense_savings", "result": {"start": start, "end": end, "income": income, "expense": expense, "savings": income-expense}}
     else:
+        conn = get_connection()
+        cur = conn.cursor()
         cur.execute("""
-            SELECT m.month, IFNULL(i.income,0) as income, IFNULL(e.expense,0) as expense,
-                   IFNULL(i.income,0) - IFNULL(e.expense,0) as savings
-            FROM (
-                SELECT DISTINCT strftime('%Y-%m', date) as month FROM (
-                    SELECT date FROM income UNION ALL SELECT date FROM expenses
-                )
-            ) m
-            LEFT JOIN (
-                SELECT strftime('%Y-%m', date) as month, SUM(amount) as income FROM income GROUP BY month
-            ) i ON i.month = m.month
-            LEFT JOIN (
-                SELECT strftime('%Y-%m', date) as month, SUM(amount) as expense FROM expenses GROUP BY month
-            ) e ON e.month = m.month
-            ORDER BY m.month DESC
+            SELECT substr(day, 1, 7) as month,
+                   ROUND(SUM(CASE WHEN kind = 'income' THEN amount ELSE 0 END), 2) as income,
+                   ROUND(SUM(CASE WHEN kind = 'expenses' THEN amount ELSE 0 END), 2) as expense,
+                   ROUND(SUM(CASE WHEN kind = 'income' THEN amount ELSE -amount END), 2) as savings
+            FROM daily_ledger
+            WHERE category = ?
+            GROUP BY month
+            ORDER BY month DESC
             LIMIT 12
-        """)
+        """, (LEDGER_ALL,))
         rows = cur.fetchall()
         conn.close()
         return {"intent": "income_vs_expense_savings", "result": [dict(r) for r in rows]}
@@ -261,31 +273,30 @@ def _income_vs_expense(params):
 def _budget_vs_actual(params):
     dr = params.get("date_range", None)
     month = dr[0][:7] if dr else datetime.today().strftime("%Y-%m")
+    start = datetime.strptime(month + "-01", "%Y-%m-%d").date()
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("""
-        SELECT b.category, b.limit_amount as budget,
-               IFNULL(SUM(e.amount),0) as spent,
-               b.limit_amount - IFNULL(SUM(e.amount),0) as remaining
-        FROM budgets b
-        LEFT JOIN expenses e
-          ON b.category = e.category AND strftime('%Y-%m', e.date) = ?
-        WHERE b.period = 'monthly' OR b.period IS NULL
-        GROUP BY b.category, b.limit_amount
-    """, (month,))
-    rows = cur.fetchall()
+        SELECT category, limit_amount as budget
+        FROM budgets
+        WHERE period = 'monthly' OR period IS NULL
+        GROUP BY category, limit_amount
+    """)
+    result = []
+    for r in cur.fetchall():
+        spent = ledger_range_total(conn, "expenses", start.isoformat(), end.isoformat(), r["category"])
+        result.append({"category": r["category"], "budget": r["budget"], "spent": spent,
+                       "remaining": r["budget"] - spent})
     conn.close()
-    return {"intent": "budget_vs_actual", "month": month, "result": [dict(r) for r in rows]}
+    return {"intent": "budget_vs_actual", "month": month, "result": result}
 
 
 def _recent_transactions(params):
     limit = params.get("limit", 5)
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT date, category, amount, notes FROM expenses ORDER BY date DESC LIMIT ?", (limit,))
-    rows_e = cur.fetchall()
-    cur.execute("SELECT date, source as category, amount, notes FROM income ORDER BY date DESC LIMIT ?", (limit,))
-    rows_i = cur.fetchall()
+    _, rows_e = recent_rows(conn, "expenses", "date, category, amount, notes", limit)
+    _, rows_i = recent_rows(conn, "income", "date, source as category, amount, notes", limit)
     conn.close()
     combined = [dict(r) for r in rows_e] + [dict(r) for r in rows_i]
     combined.sort(key=lambda x: x.get("date", ""), reverse=True)
@@ -293,21 +304,13 @@ def _recent_transactions(params):
 
 
 def _savings_summary(params):
-    dr = params.get("date_range", None)
-    conn = get_connection()
-    cur = conn.cursor()
-    if dr:
-        start, end = dr
-        cur.execute("SELECT IFNULL(SUM(amount),0) FROM income WHERE date BETWEEN ? AND ?", (start, end))
-        total_income = cur.fetchone()[0] or 0
-        cur.execute("SELECT IFNULL(SUM(amount),0) FROM expenses WHERE date BETWEEN ? AND ?", (start, end))
-        total_expenses = cur.fetchone()[0] or 0
+    start, end = params.get("date_range") or (None, None)
+    if _USE_COLUMNAR:
+        total_income = get_ledger("income").total(start, end)
+        total_expenses = get_ledger("expenses").total(start, end)
     else:
-        cur.execute("SELECT IFNULL(SUM(amount),0) FROM income")
-        total_income = cur.fetchone()[0] or 0
-        cur.execute("SELECT IFNULL(SUM(amount),0) FROM expenses")
-        total_expenses = cur.fetchone()[0] or 0
-    conn.close()
+        total_income = range_total("income", start, end)
+        total_expenses = range_total("expenses", start, end)
     savings = total_income - total_expenses
     rate = (savings / total_income * 100) if total_income > 0 else 0
     return {"intent": "savings_summary", "result": {"total_income": total_income, "total_expenses": total_expenses, "savings": savings, "savings_rate": round(rate,2)}}
@@ -321,42 +324,24 @@ def _expense_breakdown(params):
         end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
         dr = (start.isoformat(), end.isoformat())
     start, end = dr
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT category, SUM(amount) as total
-        FROM expenses
-        WHERE date BETWEEN ? AND ?
-        GROUP BY category
-        ORDER BY total DESC
-    """, (start, end))
-    rows = cur.fetchall()
-    conn.close()
-    return {"intent": "expense_breakdown", "result": [dict(r) for r in rows]}
+    if _USE_COLUMNAR:
+        return {"intent": "expense_breakdown", "result": get_ledger("expenses").top_categories(None, start, end)}
+    return {"intent": "expense_breakdown", "result": range_totals_by_category("expenses", start, end)}
 
 
 def _monthly_income_summary(params):
     dr = params.get("date_range", None)
-    conn = get_connection()
-    cur = conn.cursor()
+    if _USE_COLUMNAR:
+        ledger = get_ledger("income")
+        if dr:
+            start, end = dr
+            return {"intent": "monthly_income_summary", "result": {"start": start, "end": end, "total_income": ledger.total(start, end)}}
+        return {"intent": "monthly_income_summary", "result": ledger.monthly_totals(limit=12)}
     if dr:
         start, end = dr
-        cur.execute("SELECT SUM(amount) as total FROM income WHERE date BETWEEN ? AND ?", (start, end))
-        row = cur.fetchone()
-        total = row["total"] if row and row["total"] else 0
-        conn.close()
-        return {"intent": "monthly_income_summary", "result": {"start": start, "end": end, "total_income": total}}
+        return {"intent": "monthly_income_summary", "result": {"start": start, "end": end, "total_income": range_total("income", start, end)}}
     else:
-        cur.execute("""
-            SELECT strftime('%Y-%m', date) AS month, SUM(amount) as total
-            FROM income
-            GROUP BY month
-            ORDER BY month DESC
-            LIMIT 12
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"intent": "monthly_income_summary", "result": [dict(r) for r in rows]}
+        return {"intent": "monthly_income_summary", "result": monthly_totals("income", limit=12)}
 
 
 def _compare_monthly_expenses(params):
@@ -371,13 +356,13 @@ def _compare_monthly_expenses(params):
     start_last = date(last_of_last.year, last_of_last.month, 1).isoformat()
     end_last = last_of_last.isoformat()
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT SUM(amount) as total FROM expenses WHERE date BETWEEN ? AND ?", (start_last, end_last))
-    last_total = cur.fetchone()[0] or 0
-    cur.execute("SELECT SUM(amount) as total FROM expenses WHERE date BETWEEN ? AND ?", (start_this, end_this))
-    this_total = cur.fetchone()[0] or 0
-    conn.close()
+    if _USE_COLUMNAR:
+        ledger = get_ledger("expenses")
+        last_total = ledger.total(start_last, end_last)
+        this_total = ledger.total(start_this, end_this)
+    else:
+        last_total = range_total("expenses", start_last, end_last)
+        this_total = range_total("expenses", start_this, end_this)
 
     return {
         "intent": "compare_monthly_expenses",
@@ -389,18 +374,10 @@ def _compare_monthly_expenses(params):
 
 def _predict_future_expenses(params):
     """Predict next month's expenses using a simple moving average of past 3 months."""
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT strftime('%Y-%m', date) AS month, SUM(amount) as total
-        FROM expenses
-        GROUP BY month
-        ORDER BY month DESC
-        LIMIT 3
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    if _USE_COLUMNAR:
+        rows = get_ledger("expenses").monthly_totals(limit=3)
+    else:
+        rows = monthly_totals("expenses", limit=3)
 
     if not rows:
         return {"intent": "predict_future_expenses", "result": {"message": "Not enough data to predict."}}
@@ -0,0 +1,85 @@
+# tools/prefix_ledger.py
+from datetime import date, timedelta
+
+from utils.db_utils import get_connection, ledger_range_total, LEDGER_ALL, LEDGER_LABEL_COLUMNS
+
+
+def range_total(kind, start=None, end=None, category=None):
+    """Total of `kind` ('expenses' or 'income') between two inclusive ISO dates."""
+    if kind not in LEDGER_LABEL_COLUMNS:
+        raise ValueError(f"Unknown ledger '{kind}'")
+    conn = get_connection()
+    total = ledger_range_total(conn, kind, start, end, category)
+    conn.close()
+    return total
+
+
+def range_totals_by_category(kind, start=None, end=None):
+    """Per-category totals for a range in one grouped query, largest first.
+
+    Each category's total is its prefix sum at `end` minus its prefix sum
+    before `start` (SQLite returns the bare `cumulative` from the MAX(day) row).
+    """
+    if kind not in LEDGER_LABEL_COLUMNS:
+        raise ValueError(f"Unknown ledger '{kind}'")
+    start, end = (start or "0000-01-01")[:10], (end or "9999-12-31")[:10]
+    if start > end:
+        return []
+    conn = get_connection()
+    rows = conn.execute("""
+        WITH upper AS (
+            SELECT category, cumulative, MAX(day) FROM daily_ledger
+            WHERE kind = ? AND category != ? AND day <= ? GROUP BY category
+        ), lower AS (
+            SELECT category, cumulative, MAX(day) FROM daily_ledger
+            WHERE kind = ? AND category != ? AND day < ? GROUP BY category
+        )
+        SELECT upper.category AS category, ROUND(upper.cumulative - COALESCE(lower.cumulative, 0), 2) AS total
+        FROM upper LEFT JOIN lower USING (category)
+        WHERE total != 0
+        ORDER BY total DESC
+    """, (kind, LEDGER_ALL, end, kind, LEDGER_ALL, start)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def monthly_totals(kind, start=None, end=None, limit=None, category=None):
+    """[{month, total}] newest first, summed from the daily ledger rather than the raw rows."""
+    if kind not in LEDGER_LABEL_COLUMNS:
+        raise ValueError(f"Unknown ledger '{kind}'")
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT substr(day, 1, 7) AS month, ROUND(SUM(amount), 2) AS total
+        FROM daily_ledger
+        WHERE kind = ? AND category = ? AND day BETWEEN ? AND ?
+        GROUP BY month
+        ORDER BY month DESC
+        LIMIT ?
+    """, (kind, category or LEDGER_ALL, (start or "0000-01-01")[:10], (end or "9999-12-31")[:10],
+          -1 if limit is None else limit)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def range_summary(start=None, end=None, category=None):
+    conn = get_connection()
+    expenses = ledger_range_total(conn, "expenses", start, end, category)
+    income = ledger_range_total(conn, "income", start, end, category) if category is None else None
+    conn.close()
+    result = {"start": start, "end": end, "category": category, "expenses": expenses}
+    if income is not None:
+        result.update({"income": income, "net": round(income - expenses, 2)})
+    return result
+
+
+def rolling_totals(windows=(30, 90), as_of=None, category=None):
+    """Trailing-window totals ending on `as_of` (default today) for each window length in days."""
+    as_of = as_of or date.today().isoformat()
+    end_day = date.fromisoformat(as_of[:10])
+    result = []
+    for days in windows:
+        start = (end_day - timedelta(days=days - 1)).isoformat()
+        summary = range_summary(start, end_day.isoformat(), category)
+        summary["window_days"] = days
+        result.append(summary)
+    return result
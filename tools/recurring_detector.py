@@ -0,0 +1,216 @@
+# tools/recurring_detector.py
+"""Recurring payment (rent, subscriptions, EMIs) detection.
+
+Expenses are grouped by normalized merchant (from the notes/description) and
+a ~15% log-spaced amount band. A full rebuild sorts the whole ledger once and
+computes each group's interval mean/variance with NumPy segment reductions;
+afterwards each new expense updates its group's running interval statistics
+in O(1). A group counts as recurring when it has at least MIN_OCCURRENCES and
+its intervals are regular (coefficient of variation <= MAX_INTERVAL_CV).
+"""
+import itertools
+import math
+import re
+from datetime import date, timedelta
+
+import numpy as np
+
+from utils.db_utils import get_connection, get_meta, set_meta, register_insert_listener
+from tools.archive_manager import archive_rows
+
+MIN_OCCURRENCES = 3
+MIN_INTERVAL_DAYS = 5
+MAX_INTERVAL_CV = 0.25
+AMOUNT_BAND_RATIO = 1.15
+
+CADENCES = [
+    ("weekly", 7),
+    ("biweekly", 14),
+    ("monthly", 30.44),
+    ("quarterly", 91.31),
+    ("yearly", 365.25),
+]
+
+_NOISE_TOKENS = {"upi", "pos", "ref", "txn", "payment", "to", "from", "by", "via", "imps", "neft", "ach", "nach", "debit", "card"}
+_NON_ALPHA = re.compile(r"[^a-z ]+")
+
+
+def normalize_merchant(notes, category=None):
+    tokens = [t for t in _NON_ALPHA.sub(" ", str(notes or "").lower()).split() if t not in _NOISE_TOKENS and len(t) > 1]
+    merchant = " ".join(tokens[:3])
+    return merchant or str(category or "other").lower()
+
+
+def amount_band(amount):
+    amount = abs(float(amount or 0))
+    return int(round(math.log(amount) / math.log(AMOUNT_BAND_RATIO))) if amount > 0 else 0
+
+
+def _cadence(interval_days):
+    for name, days in CADENCES:
+        if abs(interval_days - days) <= 0.2 * days:
+            return name
+    return f"every ~{round(interval_days)} days"
+
+
+# --- Full vectorized rebuild ---
+def rebuild_recurring(chunk_size=50000):
+    """Recompute every group from the expenses table and its archived years in one sorted pass."""
+    conn = get_connection()
+    sql = """
+        SELECT substr(date, 1, 10), category, notes, amount FROM expenses
+        WHERE amount IS NOT NULL AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+    """
+    source = itertools.chain(conn.execute(sql), archive_rows(conn, sql))
+    key_codes, days_parts, amount_parts = [], [], []
+    key_index, keys = {}, []
+    while True:
+        rows = list(itertools.islice(source, chunk_size))
+        if not rows:
+            break
+        dates, categories, notes, amounts = zip(*rows)
+        codes = []
+        for cat, note, amount in zip(categories, notes, amounts):
+            key = (normalize_merchant(note, cat), amount_band(amount), cat)
+            code = key_index.get(key[:2])
+            if code is None:
+                code = key_index[key[:2]] = len(keys)
+                keys.append(key)
+            codes.append(code)
+        key_codes.append(np.asarray(codes, dtype=np.int64))
+        days_parts.append(np.asarray(dates, dtype="datetime64[D]").astype(np.int64))
+        amount_parts.append(np.asarray(amounts, dtype=np.float64))
+
+    conn.execute("DELETE FROM recurring_groups")
+    if keys:
+        codes = np.concatenate(key_codes)
+        days = np.concatenate(days_parts)
+        amounts = np.concatenate(amount_parts)
+
+        order = np.lexsort((days, codes))
+        codes, days, amounts = codes[order], days[order], amounts[order]
+        n_groups = len(keys)
+
+        counts = np.bincount(codes, minlength=n_groups)
+        amount_mean = np.bincount(codes, weights=amounts, minlength=n_groups) / np.maximum(counts, 1)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)] - 1
+        present = codes[starts]
+        first_day = np.zeros(n_groups, dtype=np.int64)
+        last_day = np.zeros(n_groups, dtype=np.int64)
+        first_day[present] = days[starts]
+        last_day[present] = days[ends]
+
+        # Intervals between consecutive rows of the same group
+        same = codes[1:] == codes[:-1]
+        gaps = np.diff(days)[same].astype(np.float64)
+        gap_codes = codes[1:][same]
+        interval_n = np.bincount(gap_codes, minlength=n_groups)
+        interval_sum = np.bincount(gap_codes, weights=gaps, minlength=n_groups)
+        interval_mean = interval_sum / np.maximum(interval_n, 1)
+        interval_m2 = np.bincount(gap_codes, weights=gaps * gaps, minlength=n_groups) - interval_n * interval_mean ** 2
+
+        epoch = date(1970, 1, 1)
+        conn.executemany("""
+            INSERT INTO recurring_groups (key, merchant, category, amount_band, n, amount_mean, first_date, last_date,
+                                          interval_n, interval_mean, interval_m2, dirty)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+        """, [
+            (f"{merchant}|{band}", merchant, cat, band, int(counts[g]), float(amount_mean[g]),
+             (epoch + timedelta(days=int(first_day[g]))).isoformat(),
+             (epoch + timedelta(days=int(last_day[g]))).isoformat(),
+             int(interval_n[g]), float(interval_mean[g]), max(float(interval_m2[g]), 0.0))
+            for g, (merchant, band, cat) in enumerate(keys)
+        ])
+    conn.commit()
+    conn.close()
+    set_meta("recurring_built", "1")
+    return {"groups": len(keys)}
+
+
+# --- Incremental updates ---
+def _on_insert(table, rows):
+    if table != "expenses" or get_meta("recurring_built") != "1":
+        return
+    conn = get_connection()
+    try:
+        for r in rows:
+            merchant = normalize_merchant(r.get("notes"), r["category"])
+            band = amount_band(r["amount"])
+            key = f"{merchant}|{band}"
+            day = str(r["date"])[:10]
+            amount = float(r["amount"] or 0)
+            try:
+                day_date = date.fromisoformat(day)
+            except ValueError:
+                continue  # undated rows cannot extend an interval; rebuild_recurring skips them too
+            group = conn.execute("SELECT * FROM recurring_groups WHERE key = ?", (key,)).fetchone()
+            if group is None:
+                conn.execute("""
+                    INSERT INTO recurring_groups (key, merchant, category, amount_band, n, amount_mean, first_date, last_date)
+                    VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+                """, (key, merchant, r["category"], band, amount, day, day))
+            elif day < group["last_date"]:
+                # Out-of-order rows invalidate the running intervals; fixed by the next rebuild
+                conn.execute("UPDATE recurring_groups SET dirty = 1 WHERE key = ?", (key,))
+            else:
+                gap = (day_date - date.fromisoformat(group["last_date"])).days
+                k = group["interval_n"] + 1
+                delta = gap - group["interval_mean"]
+                mean = group["interval_mean"] + delta / k
+                m2 = group["interval_m2"] + delta * (gap - mean)
+                n = group["n"] + 1
+                conn.execute("""
+                    UPDATE recurring_groups
+                    SET n = ?, amount_mean = amount_mean + (? - amount_mean) / ?, last_date = ?,
+                        interval_n = ?, interval_mean = ?, interval_m2 = ?
+                    WHERE key = ?
+                """, (n, amount, n, day, k, mean, m2, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+register_insert_listener(_on_insert)
+
+
+# --- Queries ---
+def list_recurring(min_occurrences: int = MIN_OCCURRENCES):
+    """Return the recurring payments with cadence and next expected date."""
+    conn = get_connection()
+    needs_rebuild = get_meta("recurring_built") != "1" or conn.execute(
+        "SELECT 1 FROM recurring_groups WHERE dirty = 1 LIMIT 1"
+    ).fetchone() is not None
+    conn.close()
+    if needs_rebuild:
+        rebuild_recurring()
+
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT * FROM recurring_groups
+        WHERE n >= ? AND interval_n >= 2 AND interval_mean >= ?
+        ORDER BY amount_mean DESC
+    """, (max(min_occurrences, 2), MIN_INTERVAL_DAYS)).fetchall()
+    conn.close()
+
+    result = []
+    for r in rows:
+        std = math.sqrt(r["interval_m2"] / (r["interval_n"] - 1))
+        cv = std / r["interval_mean"]
+        if cv > MAX_INTERVAL_CV:
+            continue
+        period = r["interval_mean"]
+        next_expected = date.fromisoformat(r["last_date"]) + timedelta(days=round(period))
+        result.append({
+            "merchant": r["merchant"],
+            "category": r["category"],
+            "typical_amount": round(r["amount_mean"], 2),
+            "cadence": _cadence(period),
+            "period_days": round(period, 1),
+            "regularity": round(1 - cv, 3),
+            "occurrences": r["n"],
+            "first_date": r["first_date"],
+            "last_date": r["last_date"],
+            "next_expected_date": next_expected.isoformat(),
+        })
+    return result
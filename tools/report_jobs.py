@@ -0,0 +1,301 @@
+# tools/report_jobs.py
+"""Monthly / annual XLSX statements built by background jobs.
+
+Jobs run in a process pool (REPORT_WORKERS processes, spawn start method so
+the API's threads are never forked) and write the workbook with openpyxl in
+write-only mode, appending rows as they are fetched from SQLite, so a report
+over years of transactions keeps a flat memory profile. Sheets:
+
+    Summary        income, expenses, net and savings rate for the period
+    Savings        per-month income / expenses / net / running balance
+    Breakdown      expense totals per category with share of spend
+    Budgets        budget vs actual for every budget window in the period
+    Expenses       every expense in the period
+    Income         every income entry in the period
+
+At most MAX_PENDING_REPORTS jobs may be queued or running. Queued jobs are
+cancelled outright; running jobs see a cancel marker file and stop at the
+next chunk of rows. Finished jobs and their files are dropped after
+REPORT_TTL_HOURS, or sooner once more than MAX_KEPT_REPORTS have finished.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from utils import db_utils
+from tools.archive_manager import ledger_source
+from tools.budget_manager import budget_window
+
+REPORT_TYPES = ("monthly", "annual")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+MAX_PENDING_REPORTS = int(os.getenv("MAX_PENDING_REPORTS", "10"))
+REPORT_TTL_HOURS = float(os.getenv("REPORT_TTL_HOURS", "24"))
+MAX_KEPT_REPORTS = int(os.getenv("MAX_KEPT_REPORTS", "50"))
+ROW_CHUNK = 2000
+
+
+class ReportCancelled(Exception):
+    pass
+
+
+class ReportQueueFull(Exception):
+    pass
+
+
+def reports_dir():
+    return Path(db_utils.DB_PATH).parent / "reports"
+
+
+def report_range(report_type, period):
+    """(start, end) ISO dates for 'monthly' YYYY-MM or 'annual' YYYY."""
+    if report_type == "monthly":
+        try:
+            first = datetime.strptime(period, "%Y-%m").date()
+        except (TypeError, ValueError):
+            raise ValueError("Monthly reports need period=YYYY-MM")
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    elif report_type == "annual":
+        if not (period and len(period) == 4 and period.isdigit()):
+            raise ValueError("Annual reports need period=YYYY")
+        first, last = date(int(period), 1, 1), date(int(period), 12, 31)
+    else:
+        raise ValueError(f"report_type must be one of {list(REPORT_TYPES)}")
+    return first.isoformat(), last.isoformat()
+
+
+# --- Report builder (runs in a worker process) ---
+def _budget_rows(conn, start, end):
+    for budget in conn.execute("SELECT id, category, limit_amount, period, start_date FROM budgets ORDER BY category, id"):
+        day = max(start, budget["start_date"][:10])
+        while day <= end:
+            window = budget_window(budget["period"], budget["start_date"], day)
+            if window is None:
+                break
+            lo, hi = max(window[0], start), min(window[1], end)
+            spent = db_utils.ledger_range_total(conn, "expenses", lo, hi, budget["category"])
+            limit_amount = budget["limit_amount"]
+            yield [budget["category"], budget["period"], window[0], window[1], limit_amount, spent,
+                   round(limit_amount - spent, 2), "Exceeded" if spent > limit_amount else "OK"]
+            day = (date.fromisoformat(window[1]) + timedelta(days=1)).isoformat()
+
+
+def build_report(report_type, period, out_path, db_path=None):
+    """Write the XLSX statement to `out_path`; returns row counts per sheet."""
+    from openpyxl import Workbook
+
+    if db_path:
+        db_utils.DB_PATH = db_path
+    start, end = report_range(report_type, period)
+    cancel_marker = Path(f"{out_path}.cancel")
+    partial = Path(f"{out_path}.part")
+
+    def check_cancel():
+        if cancel_marker.exists():
+            raise ReportCancelled()
+
+    wb = Workbook(write_only=True)
+    conn = db_utils.get_connection()
+    try:
+        counts = _write_sheets(wb, conn, report_type, period, start, end, check_cancel)
+        wb.save(partial)
+        os.replace(partial, out_path)
+    except Exception:
+        # Cancelled or failed: leave neither a half-written workbook nor a stale marker behind
+        cancel_marker.unlink(missing_ok=True)
+        partial.unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+def _write_sheets(wb, conn, report_type, period, start, end, check_cancel):
+    from tools.cashflow import iter_cashflow
+    from tools.prefix_ledger import range_totals_by_category
+
+    counts = {}
+    income = db_utils.ledger_range_total(conn, "income", start, end)
+    expenses = db_utils.ledger_range_total(conn, "expenses", start, end)
+    ws = wb.create_sheet("Summary")
+    ws.append(["Personal Finance Copilot", f"{report_type.title()} statement {period}"])
+    ws.append(["Period", f"{start} to {end}"])
+    ws.append(["Currency", db_utils.BASE_CURRENCY])
+    ws.append([])
+    ws.append(["Total income", income])
+    ws.append(["Total expenses", expenses])
+    ws.append(["Net savings", round(income - expenses, 2)])
+    ws.append(["Savings rate %", round((income - expenses) / income * 100, 1) if income else None])
+
+    ws = wb.create_sheet("Savings")
+    ws.append(["Month", "Income", "Expenses", "Net", "Balance"])
+    counts["Savings"] = 0
+    for row in iter_cashflow("monthly", start, end):
+        ws.append([row["period"], row["income"], row["expenses"], row["net"], row["balance"]])
+        counts["Savings"] += 1
+
+    ws = wb.create_sheet("Breakdown")
+    ws.append(["Category", "Total", "Share %"])
+    breakdown = range_totals_by_category("expenses", start, end)
+    for row in breakdown:
+        ws.append([row["category"], row["total"], round(row["total"] / expenses * 100, 1) if expenses else None])
+    counts["Breakdown"] = len(breakdown)
+
+    ws = wb.create_sheet("Budgets")
+    ws.append(["Category", "Period", "Window start", "Window end", "Limit", "Spent", "Remaining", "Status"])
+    counts["Budgets"] = 0
+    for row in _budget_rows(conn, start, end):
+        ws.append(row)
+        counts["Budgets"] += 1
+    check_cancel()
+
+    for table in db_utils.LEDGER_LABEL_COLUMNS:
+        label = db_utils.LEDGER_LABEL_COLUMNS[table]
+        ws = wb.create_sheet(table.title())
+        ws.append(["Date", label.title(), "Notes", "Amount", "Currency", "Original amount"])
+        # An annual statement of an archived year reads that year's archive file
+        source = ledger_source(conn, table, start, end)
+        cursor = conn.execute(f"""
+            SELECT date, {label}, notes, amount, currency, original_amount FROM {source}
+            WHERE date >= ? AND date < date(?, '+1 day')
+            ORDER BY date, id
+        """, (start, end))
+        counts[table.title()] = 0
+        while True:
+            rows = cursor.fetchmany(ROW_CHUNK)
+            if not rows:
+                break
+            for r in rows:
+                ws.append(list(r))
+            counts[table.title()] += len(rows)
+            check_cancel()
+    return counts
+
+
+# --- Job registry (API process) ---
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _pending_count():
+    return sum(1 for j in _jobs.values() if not j["future"].done())
+
+
+def _remove_files(path):
+    for p in (Path(path), Path(f"{path}.part"), Path(f"{path}.cancel")):
+        p.unlink(missing_ok=True)
+
+
+def prune_finished(jobs, is_done, on_drop=None, ttl_hours=REPORT_TTL_HOURS, max_kept=MAX_KEPT_REPORTS):
+    """Forget finished entries of a job registry past the TTL or beyond `max_kept`; call under its lock.
+
+    Entries need "id" and a monotonic "created"; `on_drop` releases whatever an entry holds.
+    """
+    finished = sorted((j for j in jobs.values() if is_done(j)), key=lambda j: j["created"])
+    expired = time.monotonic() - ttl_hours * 3600
+    excess = len(finished) - max_kept
+    for i, job in enumerate(finished):
+        if i < excess or job["created"] < expired:
+            if on_drop:
+                on_drop(job)
+            del jobs[job["id"]]
+
+
+def _prune_jobs():
+    """Forget finished jobs (and delete their files) past the TTL or beyond MAX_KEPT_REPORTS; call under _jobs_lock."""
+    prune_finished(_jobs, lambda j: j["future"].done(), lambda j: _remove_files(j["path"]))
+
+
+def submit_report(report_type, period):
+    """Queue a report; raises ValueError for bad input and ReportQueueFull at the limit."""
+    report_range(report_type, period)
+    with _jobs_lock:
+        _prune_jobs()
+        if _pending_count() >= MAX_PENDING_REPORTS:
+            raise ReportQueueFull(f"{MAX_PENDING_REPORTS} reports already pending")
+        job_id = uuid.uuid4().hex[:12]
+        out_dir = reports_dir()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        out_path = out_dir / f"{report_type}-{period}-{job_id}.xlsx"
+        future = _get_executor().submit(build_report, report_type, period, str(out_path), str(db_utils.DB_PATH))
+        _jobs[job_id] = {
+            "id": job_id, "report_type": report_type, "period": period, "path": out_path,
+            "future": future, "submitted_at": datetime.now().isoformat(timespec="seconds"),
+            "created": time.monotonic(),
+        }
+    return get_report_status(job_id)
+
+
+def get_report_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        future = job["future"]
+        status = {k: job[k] for k in ("id", "report_type", "period", "submitted_at")}
+    if future.cancelled():
+        status["status"] = "cancelled"
+    elif future.running():
+        status["status"] = "running"
+    elif not future.done():
+        status["status"] = "queued"
+    elif isinstance(future.exception(), ReportCancelled):
+        status["status"] = "cancelled"
+    elif future.exception() is not None:
+        status.update({"status": "failed", "error": str(future.exception())})
+    else:
+        # A cancel that arrived as the job finished leaves a marker nobody will read
+        Path(f"{job['path']}.cancel").unlink(missing_ok=True)
+        status.update({"status": "done", "rows": future.result(), "download": f"/reports/{job_id}/download"})
+    return status
+
+
+def cancel_report(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if not job["future"].done() and not job["future"].cancel():
+            # Already running: the worker checks for this marker between chunks
+            Path(f"{job['path']}.cancel").touch()
+            if job["future"].done():
+                Path(f"{job['path']}.cancel").unlink(missing_ok=True)
+    return get_report_status(job_id)
+
+
+def report_file(job_id):
+    """Path of a finished report, or None."""
+    status = get_report_status(job_id)
+    if status is None or status["status"] != "done":
+        return None
+    with _jobs_lock:
+        # Pruned since the status check
+        job = _jobs.get(job_id)
+        return job["path"] if job else None
+
+
+def list_reports():
+    with _jobs_lock:
+        _prune_jobs()
+        ids = list(_jobs)
+    return [get_report_status(job_id) for job_id in ids]
+
+
+def shutdown_reports():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,116 @@
+# tools/response_format.py
+"""Response encoding for the large list/trend endpoints.
+
+`format=columns` returns parallel arrays ({"columns", "rows", "data"}) instead
+of one object per row. Bodies are serialized with orjson when it is installed
+(falling back to the stdlib json module) and gzip-compressed when the client
+sends `Accept-Encoding: gzip` and the body is larger than GZIP_MIN_BYTES.
+
+Benchmark on a year of daily data:
+    python -m tools.response_format --days 365
+"""
+import gzip
+import json
+import os
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+RESPONSE_FORMATS = ("rows", "columns")
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = 5
+
+
+def check_format(fmt):
+    """True for the columnar format; raises ValueError for an unknown one."""
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError(f"format must be one of {list(RESPONSE_FORMATS)}")
+    return fmt == "columns"
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def accepts_gzip(request):
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def encode_response(request, payload):
+    """Serialize `payload` once and gzip it when worthwhile and accepted."""
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= GZIP_MIN_BYTES and accepts_gzip(request):
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# --- Benchmark ---
+def benchmark(days=365, per_day=3, repeat=20):
+    """Payload size and serialization time for rows vs columns on synthetic daily data."""
+    import random
+    import tempfile
+    import time
+    from datetime import date, timedelta
+
+    import utils.db_utils as db
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db.init_schema()
+    start = date.today() - timedelta(days=days)
+    categories = ["Food", "Transport", "Shopping", "Rent", "Bills", "Other"]
+    db.insert_expenses_batch([
+        (random.choice(categories), round(random.uniform(50, 5000), 2),
+         (start + timedelta(days=d)).isoformat(), f"purchase {d}-{i}")
+        for d in range(days) for i in range(per_day)
+    ])
+
+    cases = {
+        "expenses/trends": lambda cols: db.get_expense_trends(as_columns=cols),
+        "expenses/list": lambda cols: db.fetch_expenses(days * per_day, as_columns=cols),
+    }
+    serializers = {"json": lambda p: json.dumps(p, default=str).encode("utf-8")}
+    if orjson is not None:
+        serializers["orjson"] = dumps
+
+    results = []
+    for name, fetch in cases.items():
+        for fmt in RESPONSE_FORMATS:
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                payload = fetch(fmt == "columns")
+            fetch_ms = (time.perf_counter() - t0) * 1000 / repeat
+            for ser_name, ser in serializers.items():
+                t0 = time.perf_counter()
+                for _ in range(repeat):
+                    body = ser(payload)
+                ser_ms = (time.perf_counter() - t0) * 1000 / repeat
+                t0 = time.perf_counter()
+                compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+                gzip_ms = (time.perf_counter() - t0) * 1000
+                results.append({
+                    "endpoint": name, "format": fmt, "serializer": ser_name,
+                    "fetch_ms": round(fetch_ms, 2), "serialize_ms": round(ser_ms, 2),
+                    "bytes": len(body), "gzip_bytes": len(compressed), "gzip_ms": round(gzip_ms, 2),
+                })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark response formats")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--per-day", type=int, default=3)
+    args = parser.parse_args()
+    print(f"{'endpoint':<16}{'format':<9}{'serializer':<11}{'fetch ms':>9}{'ser ms':>8}{'bytes':>10}{'gzip':>9}{'gzip ms':>9}")
+    for r in benchmark(args.days, args.per_day):
+        print(f"{r['endpoint']:<16}{r['format']:<9}{r['serializer']:<11}{r['fetch_ms']:>9}{r['serialize_ms']:>8}"
+              f"{r['bytes']:>10}{r['gzip_bytes']:>9}{r['gzip_ms']:>9}")
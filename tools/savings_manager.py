@@ -1,19 +1,12 @@
-from utils.db_utils import get_connection, init_income_table, init_budget_table
+from utils.db_utils import get_connection, ledger_range_total, init_income_table, init_budget_table
 # from tools.income_manager import 
 
 def get_savings_summary():
     conn = get_connection()
-    cursor = conn.cursor()
 
-    # Total income
-    cursor.execute("SELECT SUM(amount) as total_income FROM income")
-    row = cursor.fetchone()
-    total_income = row["total_income"] if row["total_income"] else 0
-
-    # Total expenses
-    cursor.execute("SELECT SUM(amount) as total_expenses FROM expenses")
-    row = cursor.fetchone()
-    total_expenses = row["total_expenses"] if row["total_expenses"] else 0
+    # All-time totals from the prefix-sum ledger (covers archived years too)
+    total_income = ledger_range_total(conn, "income")
+    total_expenses = ledger_range_total(conn, "expenses")
 
     conn.close()
 
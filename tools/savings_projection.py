@@ -0,0 +1,187 @@
+# tools/savings_projection.py
+"""Monte Carlo projection of savings towards a goal.
+
+Each simulated path draws whole historical months (income and expenses
+together, so a bonus month keeps its matching spend) with replacement, for
+the rest of the current month and every month after it through the target
+date, starting from the balance as of today. The first and last months are
+partial: their draws are scaled by the share of days they cover. All paths
+are simulated in one NumPy batch: an index matrix of shape (months, paths),
+one gather of monthly net flows and an in-place cumulative sum down the
+month axis. Probabilities and final-balance percentiles use every path; the
+per-month fan chart uses the first TRAJECTORY_PATHS of them, since
+partitioning every month column costs more than the simulation itself.
+
+The monthly history comes from the all-category series of daily_ledger. It is
+cached until data_version() changes, so repeated projections skip SQL.
+
+    python -m tools.savings_projection --target 500000 --by 2027-12-31
+"""
+import threading
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+
+from utils.db_utils import get_connection, LEDGER_ALL
+from tools.answer_cache import data_version
+
+HISTORY_MONTHS = 36
+MIN_HISTORY_MONTHS = 3
+DEFAULT_PATHS = 20_000
+MAX_PATHS = 200_000
+MAX_HORIZON_MONTHS = 600
+# paths x months bound on the simulated matrix (~80 MB of float64)
+MAX_SIMULATION_CELLS = 10_000_000
+PERCENTILES = (10, 25, 50, 75, 90)
+TRAJECTORY_PATHS = 4096
+
+_history_cache = {"version": None, "history": None}
+_history_lock = threading.Lock()
+
+
+def _month_index(d):
+    return d.year * 12 + d.month - 1
+
+
+def _month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _load_history(today):
+    """Complete months before `today`: labels, income and expense arrays, plus the balance as of today."""
+    this_month = today.replace(day=1).isoformat()
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT substr(day, 1, 7) AS month,
+               SUM(CASE WHEN kind = 'income' THEN amount ELSE 0 END) AS income,
+               SUM(CASE WHEN kind = 'expenses' THEN amount ELSE 0 END) AS expenses
+        FROM daily_ledger
+        WHERE category = ? AND day < ?
+        GROUP BY month
+        ORDER BY month
+    """, (LEDGER_ALL, this_month)).fetchall()
+    balance = conn.execute("""
+        SELECT COALESCE((SELECT cumulative FROM daily_ledger WHERE kind = 'income' AND category = ? AND day < ?
+                         ORDER BY day DESC LIMIT 1), 0)
+             - COALESCE((SELECT cumulative FROM daily_ledger WHERE kind = 'expenses' AND category = ? AND day < ?
+                         ORDER BY day DESC LIMIT 1), 0)
+    """, (LEDGER_ALL, tomorrow, LEDGER_ALL, tomorrow)).fetchone()[0]
+    conn.close()
+
+    last = _month_index(today) - 1
+    first = max(last - HISTORY_MONTHS + 1, _month_index(date.fromisoformat(rows[0]["month"] + "-01"))) if rows else last + 1
+    # Months without any activity are real zero months, not gaps
+    income = np.zeros(max(last - first + 1, 0))
+    expenses = np.zeros_like(income)
+    for r in rows:
+        i = _month_index(date.fromisoformat(r["month"] + "-01")) - first
+        if 0 <= i < len(income):
+            income[i], expenses[i] = r["income"], r["expenses"]
+    return {
+        "as_of": today.isoformat(),
+        "months": [_month_label(first + i) for i in range(len(income))],
+        "income": income,
+        "expenses": expenses,
+        "balance": float(balance or 0),
+    }
+
+
+def monthly_history(today=None):
+    """Cached monthly income/expense history; refreshed when the data or the day changes."""
+    today = today or date.today()
+    version = (data_version(), today)
+    with _history_lock:
+        if _history_cache["version"] != version:
+            _history_cache["history"] = _load_history(today)
+            _history_cache["version"] = version
+        return _history_cache["history"]
+
+
+def project_savings(target, by, paths=DEFAULT_PATHS, start_balance=None, seed=None, today=None):
+    """Probability that savings reach `target` by the date `by` (YYYY-MM-DD, or YYYY-MM for the month's last day)."""
+    today = today or date.today()
+    try:
+        by_date = date.fromisoformat(by if len(by) > 7 else f"{by}-01")
+        if len(by) <= 7:
+            by_date = by_date.replace(day=calendar.monthrange(by_date.year, by_date.month)[1])
+    except (TypeError, ValueError):
+        raise ValueError("by must be a date (YYYY-MM-DD or YYYY-MM)")
+    horizon = _month_index(by_date) - _month_index(today) + 1
+    if by_date < today or horizon < 1:
+        raise ValueError("by must not be in the past")
+    if horizon > MAX_HORIZON_MONTHS:
+        raise ValueError(f"Projections are limited to {MAX_HORIZON_MONTHS} months")
+    paths = int(paths)
+    if not 1 <= paths <= MAX_PATHS:
+        raise ValueError(f"paths must be between 1 and {MAX_PATHS}")
+    if paths * horizon > MAX_SIMULATION_CELLS:
+        raise ValueError(f"paths x months must not exceed {MAX_SIMULATION_CELLS:,}; "
+                         f"use at most {MAX_SIMULATION_CELLS // horizon} paths for {horizon} months")
+
+    history = monthly_history(today)
+    n = len(history["months"])
+    if n < MIN_HISTORY_MONTHS:
+        raise ValueError(f"Need at least {MIN_HISTORY_MONTHS} complete months of history, have {n}")
+    net = history["income"] - history["expenses"]
+    start = history["balance"] if start_balance is None else float(start_balance)
+
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, n, size=(horizon, paths), dtype=np.int32)
+    balances = net[draws]                                  # (horizon, paths): balance at each month end
+    # Today's balance already includes this month's booked flows; only the days left are simulated,
+    # and the target month only up to by_date
+    scale = np.ones(horizon)
+    scale[-1] = by_date.day / calendar.monthrange(by_date.year, by_date.month)[1]
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    scale[0] = ((by_date.day if horizon == 1 else days_in_month) - today.day) / days_in_month
+    balances *= scale[:, None]
+    np.cumsum(balances, axis=0, out=balances)
+    balances += start
+    final = balances[-1]
+    final_bands = np.percentile(final, PERCENTILES)
+    bands = np.percentile(balances[:, :TRAJECTORY_PATHS], PERCENTILES, axis=1)   # (len(PERCENTILES), horizon)
+    first_month = _month_index(today)
+
+    return {
+        "target": target,
+        "by": by_date.isoformat(),
+        "start_balance": round(start, 2),
+        "horizon_months": horizon,
+        "paths": paths,
+        "probability": round(float(np.mean(final >= target)), 4),
+        "probability_hit_anytime": round(float(np.mean(balances.max(axis=0) >= target)), 4),
+        "final_balance": {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, final_bands)},
+        "expected_final_balance": round(float(final.mean()), 2),
+        "trajectory": [
+            {"month": _month_label(first_month + m), **{f"p{p}": round(float(bands[i, m]), 2)
+                                                       for i, p in enumerate(PERCENTILES)}}
+            for m in range(horizon)
+        ],
+        "inputs": {
+            "history_months": n,
+            "from": history["months"][0],
+            "to": history["months"][-1],
+            "monthly_income_mean": round(float(history["income"].mean()), 2),
+            "monthly_expenses_mean": round(float(history["expenses"].mean()), 2),
+            "monthly_net_std": round(float(net.std()), 2),
+        },
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Monte Carlo savings-goal projection")
+    parser.add_argument("--target", type=float, required=True)
+    parser.add_argument("--by", required=True)
+    parser.add_argument("--paths", type=int, default=DEFAULT_PATHS)
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    result = project_savings(args.target, args.by, args.paths)
+    result["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    result.pop("trajectory")
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,324 @@
+# tools/snapshot_manager.py
+"""Columnar snapshots of the SQLite tables.
+
+A snapshot is a directory with a manifest.json and one binary file per column:
+
+    manifest.json
+    expenses/id.i64  expenses/id.valid
+    expenses/amount.f64  expenses/amount.valid
+    expenses/notes.offsets  expenses/notes.utf8  expenses/notes.valid
+    ...
+
+Integer columns are little-endian int64, real columns float64 and text columns
+an int64 offsets array (n + 1 entries) into a UTF-8 blob. Every column has a
+uint8 validity file (0 = NULL). Export streams rows with fetchmany and import
+reads the files through np.memmap, so neither side holds a whole table in memory.
+
+Usage:
+    python -m tools.snapshot_manager export snapshots/2025-10
+    python -m tools.snapshot_manager import snapshots/2025-10
+"""
+import argparse
+import json
+import os
+import tarfile
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from utils.db_utils import (get_connection, ensure_content_hash, ensure_currency_columns, rebuild_daily_ledger,
+                            init_db, init_income_table, init_budget_table, LEDGER_LABEL_COLUMNS)
+from tools.anomaly_detector import rebuild_category_stats
+from tools.budget_manager import init_budget_status
+from tools.fx_manager import init_fx_rates
+
+SNAPSHOT_FORMAT = "pfc-columnar"
+SNAPSHOT_VERSION = 1
+DEFAULT_TABLES = ["expenses", "income", "budgets", "fx_rates"]
+# Snapshot tables are only ever created from the local schema, never from SQL in a manifest
+_TABLE_INIT = {"expenses": init_db, "income": init_income_table, "budgets": init_budget_table, "fx_rates": init_fx_rates}
+
+_EXTENSIONS = {"int64": ".i64", "float64": ".f64"}
+_DTYPES = {"int64": "<i8", "float64": "<f8"}
+
+
+def _column_type(declared):
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return "int64"
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+        return "float64"
+    return "utf8"
+
+
+def _table_schema(conn, table):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    if row is None:
+        return None, []
+    cols = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return row[0], [{"name": c[1], "type": _column_type(c[2])} for c in cols]
+
+
+# --- Export ---
+class _ColumnWriter:
+    def __init__(self, directory, column):
+        self.type = column["type"]
+        base = directory / column["name"]
+        self.valid = open(f"{base}.valid", "wb")
+        if self.type == "utf8":
+            self.offsets = open(f"{base}.offsets", "wb")
+            self.data = open(f"{base}.utf8", "wb")
+            self.position = 0
+            np.zeros(1, dtype="<i8").tofile(self.offsets)
+        else:
+            self.data = open(f"{base}{_EXTENSIONS[self.type]}", "wb")
+
+    def write(self, values):
+        valid = np.fromiter((v is not None for v in values), dtype=np.uint8, count=len(values))
+        valid.tofile(self.valid)
+        if self.type == "utf8":
+            encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+            lengths = np.fromiter((len(b) for b in encoded), dtype="<i8", count=len(encoded))
+            (np.cumsum(lengths) + self.position).astype("<i8").tofile(self.offsets)
+            self.position += int(lengths.sum())
+            self.data.write(b"".join(encoded))
+        else:
+            fill = 0 if self.type == "int64" else np.nan
+            np.asarray([fill if v is None else v for v in values], dtype=_DTYPES[self.type]).tofile(self.data)
+
+    def close(self):
+        self.valid.close()
+        self.data.close()
+        if self.type == "utf8":
+            self.offsets.close()
+
+
+def export_snapshot(path, tables=None, chunk_size=50000):
+    """Write a columnar snapshot of `tables` into directory `path`; returns the manifest."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    conn = get_connection()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "tables": {},
+    }
+    for table in tables or DEFAULT_TABLES:
+        sql, columns = _table_schema(conn, table)
+        if sql is None:
+            continue
+        table_dir = path / table
+        table_dir.mkdir(exist_ok=True)
+        writers = [_ColumnWriter(table_dir, c) for c in columns]
+        names = ", ".join(f'"{c["name"]}"' for c in columns)
+        cur = conn.cursor()
+        cur.execute(f"SELECT {names} FROM {table} ORDER BY rowid")
+        rows_written = 0
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for i, writer in enumerate(writers):
+                    writer.write([r[i] for r in rows])
+                rows_written += len(rows)
+        finally:
+            for writer in writers:
+                writer.close()
+        manifest["tables"][table] = {"rows": rows_written, "sql": sql, "columns": columns}
+    conn.close()
+    with open(path / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# --- Import ---
+def read_manifest(path):
+    with open(Path(path) / "manifest.json") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot format in {path}")
+    return manifest
+
+
+def _memmap(file, dtype, count):
+    if count == 0 or os.path.getsize(file) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode="r", shape=(count,))
+
+
+def open_table(path, table):
+    """Memory-map a table's columns; returns {column: array}, with text columns as (offsets, blob)."""
+    path = Path(path)
+    info = read_manifest(path)["tables"][table]
+    n = info["rows"]
+    columns = {}
+    for col in info["columns"]:
+        base = path / table / col["name"]
+        if col["type"] == "utf8":
+            blob_size = os.path.getsize(f"{base}.utf8")
+            columns[col["name"]] = (_memmap(f"{base}.offsets", "<i8", n + 1), _memmap(f"{base}.utf8", np.uint8, blob_size))
+        else:
+            columns[col["name"]] = _memmap(f"{base}{_EXTENSIONS[col['type']]}", _DTYPES[col["type"]], n)
+        columns[col["name"] + ".valid"] = _memmap(f"{base}.valid", np.uint8, n)
+    return columns
+
+
+def _decode_text(offsets, blob, lo, hi):
+    starts = offsets[lo:hi]
+    ends = offsets[lo + 1:hi + 1]
+    raw = bytes(blob[starts[0]:ends[-1]]) if hi > lo else b""
+    base = int(starts[0]) if hi > lo else 0
+    return [raw[s - base:e - base].decode("utf-8") for s, e in zip(starts.tolist(), ends.tolist())]
+
+
+def iter_table_rows(path, table, chunk_size=50000):
+    """Yield lists of row tuples from a snapshot table, chunk by chunk."""
+    info = read_manifest(path)["tables"][table]
+    columns = open_table(path, table)
+    names = [c["name"] for c in info["columns"]]
+    n = info["rows"]
+    for lo in range(0, n, chunk_size):
+        hi = min(n, lo + chunk_size)
+        values = []
+        for name in names:
+            col = columns[name]
+            if isinstance(col, tuple):
+                vals = _decode_text(col[0], col[1], lo, hi)
+            else:
+                vals = col[lo:hi].tolist()
+            valid = columns[name + ".valid"][lo:hi]
+            if not valid.all():
+                vals = [v if ok else None for v, ok in zip(vals, valid.tolist())]
+            values.append(vals)
+        yield list(zip(*values))
+
+
+def _import_plan(conn, manifest, tables):
+    """Validate the manifest against the live schema before anything is deleted.
+
+    Only DEFAULT_TABLES may be restored, and every snapshot column must exist
+    in the live table (columns the snapshot lacks get their defaults or are
+    backfilled). Returns [(table, info, column names)].
+    """
+    plan = []
+    for table, info in manifest["tables"].items():
+        if tables and table not in tables:
+            continue
+        if table not in DEFAULT_TABLES:
+            raise ValueError(f"Snapshot table '{table}' is not importable (allowed: {DEFAULT_TABLES})")
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+        if not exists:
+            _TABLE_INIT[table](conn)
+        live_columns = {c[1] for c in conn.execute(f"PRAGMA table_info({table})")}
+        names = [c["name"] for c in info["columns"]]
+        unknown = [name for name in names if name not in live_columns]
+        if unknown or len(set(names)) != len(names):
+            raise ValueError(f"Snapshot columns for '{table}' do not match the database: {unknown or names}")
+        plan.append((table, info, names))
+    return plan
+
+
+def import_snapshot(path, tables=None, chunk_size=50000):
+    """Replace the contents of the snapshot's tables with the snapshot data."""
+    manifest = read_manifest(path)
+    conn = get_connection()
+    restored = {}
+    try:
+        for table, info, names in _import_plan(conn, manifest, tables):
+            col_sql = ", ".join(f'"{name}"' for name in names)
+            placeholders = ", ".join("?" for _ in names)
+            conn.execute(f"DELETE FROM {table}")
+            for rows in iter_table_rows(path, table, chunk_size):
+                conn.executemany(f"INSERT INTO {table} ({col_sql}) VALUES ({placeholders})", rows)
+            if table in LEDGER_LABEL_COLUMNS:
+                ensure_currency_columns(conn, table)
+                ensure_content_hash(conn, table, LEDGER_LABEL_COLUMNS[table])
+                rebuild_daily_ledger(conn, [table])
+            if table == "expenses":
+                rebuild_category_stats(conn)
+                # Recurring groups are rebuilt lazily on the next query
+                conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('recurring_built', '0')")
+            restored[table] = info["rows"]
+        # Budget windows depend on both budgets and expenses, so re-seed them last
+        conn.execute("DELETE FROM budget_status")
+        init_budget_status(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # In-memory ledgers are now stale
+    from tools.columnar_store import reset_ledgers
+    from tools.vector_index import reset_indexes
+    reset_ledgers()
+    reset_indexes()
+    return {"status": "success", "restored": restored}
+
+
+# --- Offline analytics ---
+def ledger_from_snapshot(path, table="expenses"):
+    """Build a ColumnarLedger straight from a snapshot, without touching SQLite."""
+    from tools.columnar_store import ColumnarLedger, LEDGER_COLUMNS
+
+    names = [c["name"] for c in read_manifest(path)["tables"][table]["columns"]]
+    d, c, a = (names.index(k) for k in ("date", LEDGER_COLUMNS[table], "amount"))
+    ledger = ColumnarLedger(table)
+    for rows in iter_table_rows(path, table):
+        rows = [r for r in rows if r[d] and r[a] is not None]
+        ledger.append_many([r[d] for r in rows], [r[c] for r in rows], [r[a] for r in rows])
+    return ledger
+
+
+# --- Archive helpers used by the HTTP endpoints ---
+def _tar_members(root, arcname, chunk_size):
+    """Yield ustar/pax blocks for `root` and everything under it, reading each file in chunks."""
+    for path in [root, *sorted(root.rglob("*"))]:
+        st = path.stat()
+        info = tarfile.TarInfo(str(Path(arcname) / path.relative_to(root)))
+        info.mtime = int(st.st_mtime)
+        if path.is_dir():
+            info.type, info.mode = tarfile.DIRTYPE, 0o755
+            yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+            continue
+        info.size, info.mode = st.st_size, 0o644
+        yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        with open(path, "rb") as f:
+            while block := f.read(chunk_size):
+                yield block
+        if info.size % tarfile.BLOCKSIZE:
+            yield tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+
+
+def iter_snapshot_archive(tables=None, chunk_size=1 << 20):
+    """Export into a temp dir and stream its files as tar members, without building the tar on disk."""
+    with tempfile.TemporaryDirectory() as tmp:
+        snap_dir = Path(tmp) / "snapshot"
+        export_snapshot(snap_dir, tables)
+        yield from _tar_members(snap_dir, "snapshot", chunk_size)
+        yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)     # end-of-archive marker
+
+
+def import_snapshot_archive(archive_path, tables=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        with tarfile.open(archive_path, "r") as tar:
+            tar.extractall(tmp, filter="data")
+        return import_snapshot(Path(tmp) / "snapshot", tables)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import columnar snapshots of the finance DB")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path")
+    parser.add_argument("--tables", nargs="*", default=None)
+    args = parser.parse_args()
+    if args.command == "export":
+        result = export_snapshot(args.path, args.tables)
+        print(json.dumps({t: i["rows"] for t, i in result["tables"].items()}))
+    else:
+        print(json.dumps(import_snapshot(args.path, args.tables)))
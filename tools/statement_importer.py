@@ -0,0 +1,321 @@
+# tools/statement_importer.py
+"""Streaming importer for bank statements in CSV or XLSX form.
+
+Rows are read lazily (csv.reader / openpyxl read-only mode), mapped through an
+import profile, categorized with expense_manager.categorize and written in
+batched transactions, so memory stays flat regardless of statement size.
+
+Usage:
+    python -m tools.statement_importer statement.xlsx --profile debit_credit
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, date
+from functools import lru_cache
+from pathlib import Path
+
+from tools.expense_manager import categorize
+from utils.db_utils import insert_expenses_batch, insert_income_batch
+from tools.report_jobs import prune_finished
+
+# Column mappings for the statement layouts we know about. A profile maps our
+# fields to statement headers (matched case-insensitively):
+#   date, description            - required
+#   amount                       - single amount column, or
+#   debit / credit               - separate withdrawal / deposit columns
+#   category                     - optional, used as-is when present
+#   currency                     - optional column, else the profile's
+#                                  `default_currency` (base currency if unset)
+#   negative_is_expense          - with `amount`, treat negative values as spend
+#   date_formats                 - strptime formats tried in order
+#   skip_rows                    - preamble lines before the header row
+IMPORT_PROFILES = {
+    "default": {
+        "date": "date",
+        "description": "description",
+        "amount": "amount",
+        "category": "category",
+        "currency": "currency",
+        "date_formats": ["%Y-%m-%d"],
+    },
+    "debit_credit": {
+        "date": "date",
+        "description": "narration",
+        "debit": "withdrawal amt.",
+        "credit": "deposit amt.",
+        "date_formats": ["%d/%m/%y", "%d/%m/%Y", "%Y-%m-%d"],
+    },
+    "signed_amount": {
+        "date": "date",
+        "description": "description",
+        "amount": "amount",
+        "currency": "currency",
+        "negative_is_expense": True,
+        "date_formats": ["%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d"],
+    },
+}
+
+# Extra or overriding profiles can be dropped into this JSON file
+IMPORT_PROFILES_PATH = Path(__file__).parent.parent / "data" / "import_profiles.json"
+
+BATCH_SIZE = 5000
+
+_AMOUNT_CLEAN = re.compile(r"[^0-9.\-]")
+
+
+def load_profiles():
+    profiles = dict(IMPORT_PROFILES)
+    if IMPORT_PROFILES_PATH.exists():
+        with open(IMPORT_PROFILES_PATH) as f:
+            profiles.update(json.load(f))
+    return profiles
+
+
+def get_profile(name):
+    profiles = load_profiles()
+    if name not in profiles:
+        raise ValueError(f"Unknown import profile '{name}'. Available: {sorted(profiles)}")
+    return profiles[name]
+
+
+# --- Row readers ---
+def _iter_csv(path, progress):
+    size = os.path.getsize(path) or 1
+    with open(path, "rb") as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        for i, row in enumerate(csv.reader(text)):
+            if i % BATCH_SIZE == 0:
+                progress(fraction=min(raw.tell() / size, 1.0))
+            yield row
+
+
+def _iter_xlsx(path, progress, sheet=None):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.active
+        total = ws.max_row or 0
+        for i, row in enumerate(ws.iter_rows(values_only=True)):
+            if total and i % BATCH_SIZE == 0:
+                progress(fraction=min(i / total, 1.0))
+            yield row
+    finally:
+        wb.close()
+
+
+# --- Value parsing ---
+def _parse_date(value, formats):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return _parse_date_text(str(value).strip(), tuple(formats))
+
+
+# Statements repeat the same few hundred dates, so strptime results are cached
+@lru_cache(maxsize=4096)
+def _parse_date_text(text, formats):
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_amount(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    negative = text.startswith("(") and text.endswith(")")
+    text = _AMOUNT_CLEAN.sub("", text)
+    if text in ("", "-", "."):
+        return None
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def _map_row(row, index, profile):
+    """Return ("expense" | "income", (label, amount, date, notes)) or None to skip."""
+    def cell(field):
+        i = index.get(field)
+        return row[i] if i is not None and i < len(row) else None
+
+    raw_date = cell("date")
+    if raw_date in (None, ""):
+        return None
+    tx_date = _parse_date(raw_date, profile.get("date_formats", ["%Y-%m-%d"]))
+    if tx_date is None:
+        return None
+    description = str(cell("description") or "").strip()
+
+    if "debit" in index or "credit" in index:
+        debit = _parse_amount(cell("debit"))
+        credit = _parse_amount(cell("credit"))
+        if debit:
+            kind, amount = "expense", abs(debit)
+        elif credit:
+            kind, amount = "income", abs(credit)
+        else:
+            return None
+    else:
+        amount = _parse_amount(cell("amount"))
+        if amount is None:
+            return None
+        kind = "expense"
+        if profile.get("negative_is_expense"):
+            kind = "expense" if amount < 0 else "income"
+        amount = abs(amount)
+
+    currency = str(cell("currency") or "").strip() or profile.get("default_currency")
+    if kind == "income":
+        return kind, (description or "Statement", amount, tx_date, description, currency)
+    category = str(cell("category") or "").strip() or categorize(description)
+    return kind, (category, amount, tx_date, description, currency)
+
+
+def _header_index(header, profile):
+    names = [str(h).strip().lower() if h is not None else "" for h in header]
+    index = {}
+    for field in ("date", "description", "amount", "debit", "credit", "category", "currency"):
+        column = profile.get(field)
+        if column and column.lower() in names:
+            index[field] = names.index(column.lower())
+    missing = [f for f in ("date", "description") if f not in index]
+    if "amount" not in index and "debit" not in index and "credit" not in index:
+        missing.append("amount")
+    if missing:
+        raise ValueError(f"Statement is missing columns for {missing} (header: {names})")
+    return index
+
+
+# --- Import ---
+def import_statement(path, profile="default", sheet=None, batch_size=BATCH_SIZE, on_progress=None):
+    """Stream a CSV/XLSX statement into the ledgers; returns import counts."""
+    prof = get_profile(profile) if isinstance(profile, str) else profile
+    stats = {"rows_read": 0, "expenses": 0, "income": 0, "duplicates": 0, "anomalies": 0, "skipped": 0, "fraction": 0.0}
+
+    def progress(fraction=None):
+        if fraction is not None:
+            stats["fraction"] = round(fraction, 4)
+        if on_progress:
+            on_progress(dict(stats))
+
+    suffix = Path(path).suffix.lower()
+    if suffix in (".xlsx", ".xlsm"):
+        rows = _iter_xlsx(path, progress, sheet)
+    elif suffix in (".csv", ".txt"):
+        rows = _iter_csv(path, progress)
+    else:
+        raise ValueError(f"Unsupported statement type '{suffix}' (expected .csv or .xlsx)")
+
+    for _ in range(prof.get("skip_rows", 0)):
+        next(rows, None)
+    header = next(rows, None)
+    if header is None:
+        return stats
+    index = _header_index(header, prof)
+
+    expenses, income = [], []
+
+    def flush():
+        if expenses:
+            inserted = insert_expenses_batch(expenses)
+            added = len(inserted)
+            stats["anomalies"] += sum(1 for r in inserted if "anomaly" in r)
+            stats["expenses"] += added
+            stats["duplicates"] += len(expenses) - added
+            expenses.clear()
+        if income:
+            added = len(insert_income_batch(income))
+            stats["income"] += added
+            stats["duplicates"] += len(income) - added
+            income.clear()
+        progress()
+
+    for row in rows:
+        stats["rows_read"] += 1
+        mapped = _map_row(row, index, prof)
+        if mapped is None:
+            stats["skipped"] += 1
+            continue
+        kind, values = mapped
+        (expenses if kind == "expense" else income).append(values)
+        if len(expenses) + len(income) >= batch_size:
+            flush()
+    flush()
+    stats["fraction"] = 1.0
+    progress()
+    return stats
+
+
+# --- Background imports with pollable progress ---
+# Finished import statuses are forgotten after IMPORT_TTL_HOURS, or sooner
+# once more than MAX_KEPT_IMPORTS have finished
+IMPORT_TTL_HOURS = float(os.getenv("IMPORT_TTL_HOURS", "24"))
+MAX_KEPT_IMPORTS = int(os.getenv("MAX_KEPT_IMPORTS", "200"))
+_imports = {}
+_imports_lock = threading.Lock()
+
+
+def start_import(path, profile="default", sheet=None, cleanup=False):
+    """Register an import and return (import_id, runner); call runner() in a worker thread."""
+    import_id = uuid.uuid4().hex[:12]
+    with _imports_lock:
+        prune_finished(_imports, lambda i: i["status"] in ("done", "failed"),
+                       ttl_hours=IMPORT_TTL_HOURS, max_kept=MAX_KEPT_IMPORTS)
+        _imports[import_id] = {"id": import_id, "status": "queued", "profile": profile,
+                               "created": time.monotonic()}
+
+    def update(stats):
+        with _imports_lock:
+            _imports[import_id].update(stats)
+
+    def runner():
+        update({"status": "running"})
+        try:
+            result = import_statement(path, profile, sheet, on_progress=update)
+            update({**result, "status": "done"})
+        except Exception as e:
+            update({"status": "failed", "error": str(e)})
+        finally:
+            if cleanup:
+                os.remove(path)
+
+    return import_id, runner
+
+
+def get_import_status(import_id):
+    with _imports_lock:
+        status = _imports.get(import_id)
+        return {k: v for k, v in status.items() if k != "created"} if status else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a CSV/XLSX bank statement")
+    parser.add_argument("path")
+    parser.add_argument("--profile", default="default")
+    parser.add_argument("--sheet", default=None)
+    args = parser.parse_args()
+
+    def report(stats):
+        print(f"\r{stats['fraction'] * 100:5.1f}%  rows={stats['rows_read']}  "
+              f"expenses={stats['expenses']}  income={stats['income']}  "
+              f"duplicates={stats['duplicates']}  skipped={stats['skipped']}", end="")
+
+    result = import_statement(args.path, args.profile, args.sheet, on_progress=report)
+    print()
+    print(json.dumps(result))
@@ -0,0 +1,257 @@
+# tools/transaction_search.py
+"""Full-text search over expense/income notes using the FTS5 indexes.
+
+Results are ranked with bm25 (or ordered by date) and paged with an opaque
+keyset cursor, so page N costs the same as page 1. Archived years are
+searched through their own FTS index when the date range reaches into them;
+bm25 statistics are per partition, so ranks across years are approximate.
+`parse_natural_query` turns copilot phrasing such as "show all Uber rides in
+March" into a search.
+
+Benchmark on a synthetic ledger:
+    python -m tools.transaction_search --bench 1000000
+"""
+import base64
+import json
+import re
+from datetime import date, timedelta
+
+from utils.db_utils import get_connection, LEDGER_LABEL_COLUMNS
+from tools.archive_manager import attach_archives
+
+SEARCH_ORDERS = ("rank", "date")
+MAX_PAGE_SIZE = 200
+
+_TOKEN = re.compile(r"[^\W_]+\*?", re.UNICODE)
+
+
+def to_fts_query(text, any_term=False, prefix_all=False):
+    """Quote each word so user input can't inject FTS syntax; a trailing * keeps prefix matching."""
+    terms = []
+    for token in _TOKEN.findall(text or ""):
+        word = token.rstrip("*")
+        prefix = token.endswith("*") or prefix_all
+        terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return (" OR " if any_term else " AND ").join(terms)
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def search_transactions(q, kind=None, start=None, end=None, category=None, limit=20, cursor=None,
+                        order="rank", any_term=False, prefix=False):
+    """Search notes and category/source text; returns {"results", "next_cursor"}."""
+    match = to_fts_query(q, any_term=any_term, prefix_all=prefix)
+    if not match:
+        raise ValueError("Empty search query")
+    if order not in SEARCH_ORDERS:
+        raise ValueError(f"order must be one of {list(SEARCH_ORDERS)}")
+    kinds = [kind] if kind else list(LEDGER_LABEL_COLUMNS)
+    if any(k not in LEDGER_LABEL_COLUMNS for k in kinds):
+        raise ValueError(f"Unknown ledger '{kind}'")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if order == "rank":
+        sort_key, direction, comparison = ("score", "kind", "id"), "ASC", ">"
+    else:
+        sort_key, direction, comparison = ("date", "kind", "id"), "DESC", "<"
+
+    conn = get_connection()
+    try:
+        schemas = ["main"] + attach_archives(conn, start, end)
+        parts, params = [], []
+        for k in kinds:
+            label = LEDGER_LABEL_COLUMNS[k]
+            where = [f"{k}_fts MATCH ?"]
+            filters = [match]
+            if start:
+                where.append("t.date >= ?")
+                filters.append(start[:10])
+            if end:
+                where.append("t.date < date(?, '+1 day')")
+                filters.append(end[:10])
+            if category:
+                where.append(f"t.{label} = ? COLLATE NOCASE")
+                filters.append(category)
+            for schema in schemas:
+                # Archives written before they carried a text index are skipped until re-archived
+                if schema != "main" and conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = ?",
+                                                     (f"{k}_fts",)).fetchone() is None:
+                    continue
+                parts.append(f"""
+                    SELECT '{k}' AS kind, t.id, t.date, t.{label} AS label, t.notes, t.amount,
+                           bm25({k}_fts) AS score
+                    FROM {schema}.{k}_fts JOIN {schema}.{k} t ON t.id = {schema}.{k}_fts.rowid
+                    WHERE {' AND '.join(where)}
+                """)
+                params += filters
+
+        keyset = ""
+        if cursor:
+            last = _decode_cursor(cursor)
+            keyset = f"WHERE ({', '.join(sort_key)}) {comparison} (?, ?, ?)"
+            params += last
+        order_by = ", ".join(f"{c} {direction}" for c in sort_key)
+
+        rows = conn.execute(f"""
+            SELECT * FROM ({' UNION ALL '.join(parts)})
+            {keyset}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
+    finally:
+        conn.close()
+
+    results = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = results[-1]
+        next_cursor = _encode_cursor([last[c] for c in sort_key])
+    for r in results:
+        r["score"] = round(-r["score"], 6)   # bm25 is negative; higher is better
+    return {"query": match, "count": len(results), "results": results, "next_cursor": next_cursor}
+
+
+# --- Natural-language queries ---
+_MONTHS = {name: i for i, name in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july",
+     "august", "september", "october", "november", "december"], start=1)}
+_MONTHS.update({name[:3]: i for name, i in list(_MONTHS.items())})
+_MONTHS["sept"] = 9
+
+_STOP_WORDS = {
+    "show", "me", "all", "my", "find", "search", "list", "for", "in", "on", "at", "the", "of", "from",
+    "during", "with", "any", "every", "transactions", "transaction", "payments", "payment", "expenses",
+    "expense", "income", "spent", "spend", "spending", "did", "i", "what", "were", "was", "to", "this",
+    "last", "month", "year", "and",
+}
+
+SEARCH_TRIGGERS = ("show all", "show me all", "find ", "search ", "list all", "look up")
+
+
+def is_search_query(text):
+    q = text.lower().strip()
+    return q.startswith(SEARCH_TRIGGERS)
+
+
+def _month_range(year, month):
+    first = date(year, month, 1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def parse_natural_query(text, today=None):
+    """Split a copilot query into search terms plus a date range and ledger kind."""
+    today = today or date.today()
+    q = text.lower()
+    start = end = None
+    if "this month" in q:
+        start, end = _month_range(today.year, today.month)
+    elif "last month" in q:
+        prev = today.replace(day=1) - timedelta(days=1)
+        start, end = _month_range(prev.year, prev.month)
+    else:
+        m = re.search(r"\b(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?", q)
+        if m:
+            month = _MONTHS[m.group(1)]
+            # Without a year, the most recent such month
+            year = int(m.group(2)) if m.group(2) else (today.year if month <= today.month else today.year - 1)
+            start, end = _month_range(year, month)
+            q = q[:m.start()] + q[m.end():]
+
+    kind = "income" if re.search(r"\b(income|salary|credited)\b", q) else None
+    terms = []
+    for word in re.findall(r"[^\W\d_]+", q):
+        if word in _STOP_WORDS or word in _MONTHS:
+            continue
+        # Crude stemming so "rides" also matches "ride"
+        terms.append(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return {"q": " ".join(terms), "start": start, "end": end, "kind": kind}
+
+
+def search_natural(text, limit=20):
+    parsed = parse_natural_query(text)
+    if not parsed["q"]:
+        return {"message": "Tell me what to search for, e.g. 'show all Uber rides in March'.", **parsed}
+    result = search_transactions(parsed["q"], kind=parsed["kind"], start=parsed["start"], end=parsed["end"],
+                                 limit=limit, any_term=True, prefix=True)
+    result.update({"start": parsed["start"], "end": parsed["end"]})
+    return result
+
+
+# --- Benchmark ---
+def benchmark(n_rows=1_000_000, repeat=20):
+    import os
+    import random
+    import statistics
+    import tempfile
+    import time
+
+    import utils.db_utils as db
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "search-bench.db")
+    db.init_schema()
+    merchants = ["Uber trip", "Swiggy order", "Amazon purchase", "Netflix subscription", "Zomato dinner",
+                 "BigBasket groceries", "Ola ride", "Flipkart order", "Shell fuel", "Starbucks coffee"]
+    categories = ["Food", "Transport", "Shopping", "Bills", "Other"]
+    start_day = date(2020, 1, 1)
+    conn = db.get_connection()
+    t0 = time.perf_counter()
+    for lo in range(0, n_rows, 100_000):
+        conn.executemany(
+            "INSERT INTO expenses (date, category, notes, amount) VALUES (?, ?, ?, ?)",
+            ((
+                (start_day + timedelta(days=random.randrange(2000))).isoformat(),
+                random.choice(categories),
+                f"{random.choice(merchants)} #{random.randrange(100000)}",
+                round(random.uniform(10, 5000), 2),
+            ) for _ in range(lo, min(lo + 100_000, n_rows)))
+        )
+    conn.commit()
+    conn.close()
+    load_s = time.perf_counter() - t0
+
+    def timed(fn):
+        samples = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t) * 1000)
+        return round(statistics.median(samples), 2)
+
+    page1 = search_transactions("uber", kind="expenses")
+    cases = {
+        "match 'uber' (rank, page 1)": lambda: search_transactions("uber", kind="expenses"),
+        "match 'uber' (rank, page 2)": lambda: search_transactions("uber", kind="expenses", cursor=page1["next_cursor"]),
+        "match 'uber' (date order)": lambda: search_transactions("uber", kind="expenses", order="date"),
+        "prefix 'net*' + March 2023": lambda: search_transactions("net*", kind="expenses", start="2023-03-01", end="2023-03-31"),
+        "rare term 'starbucks coffee'": lambda: search_transactions("starbucks coffee", kind="expenses"),
+    }
+
+    def like_scan():
+        c = db.get_connection()
+        c.execute("SELECT * FROM expenses WHERE notes LIKE '%uber%' ORDER BY date DESC LIMIT 20").fetchall()
+        c.close()
+    cases["LIKE '%uber%' (baseline)"] = like_scan
+
+    return {"rows": n_rows, "load_s": round(load_s, 1), "median_ms": {name: timed(fn) for name, fn in cases.items()}}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search transaction notes")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--bench", type=int, default=None, help="benchmark on N synthetic rows")
+    args = parser.parse_args()
+    if args.bench:
+        print(json.dumps(benchmark(args.bench), indent=2))
+    else:
+        print(json.dumps(search_natural(args.query), indent=2, default=str))
@@ -0,0 +1,483 @@
+# tools/vector_index.py
+"""Semantic search over transaction descriptions.
+
+Each ledger has an append-only on-disk index next to the database:
+
+    db/vectors/expenses/ids.i64       row ids, ascending
+    db/vectors/expenses/vectors.f32   n x 384 unit vectors   (or vectors.i8 +
+    db/vectors/expenses/scales.f32    per-row scales when VECTOR_QUANTIZE=int8)
+
+Searches memory-map the matrix and take the top-k cosine scores with
+np.argpartition, scanning everything for small indexes and only the nearest
+k-means partitions (IVF) for large ones. New rows are embedded in
+batches by a background thread woken by the insert listener: it embeds every
+row with an id above the last indexed one, so the index only ever appends.
+Vectors of rows moved to an archive partition stay in the index, and their
+rows are read back from the archive file. int8 quantization cuts the
+matrix to a quarter of its float32 size.
+
+Every API worker runs its own embedding thread, so writes to an index
+directory (sync, append, train, clear) hold an exclusive flock on its
+write.lock file; the id and vector files of one index never interleave.
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks (Windows): single-process writes only
+    fcntl = None
+
+import numpy as np
+
+from utils import db_utils
+from utils.db_utils import get_connection, register_insert_listener, LEDGER_LABEL_COLUMNS
+from tools.archive_manager import archive_rows
+
+EMBEDDING_DIM = 384
+VECTOR_QUANTIZE = os.getenv("VECTOR_QUANTIZE", "float32").lower()
+SEMANTIC_INDEX_ON_INSERT = os.getenv("SEMANTIC_INDEX", "1").lower() not in ("0", "false", "no")
+EMBED_BATCH_SIZE = 256
+SEARCH_CHUNK_ROWS = 65536
+# Coarse (IVF) partitioning kicks in once an index has IVF_MIN_ROWS rows
+IVF_MIN_ROWS = int(os.getenv("VECTOR_IVF_MIN_ROWS", "50000"))
+IVF_LISTS = 256
+IVF_PROBES = int(os.getenv("VECTOR_IVF_PROBES", "12"))
+# Searches embed a backlog this small inline (one short model call); anything
+# larger is left to the background worker
+SYNC_ON_SEARCH_MAX = int(os.getenv("VECTOR_SYNC_ON_SEARCH_MAX", "32"))
+
+
+def _embed(texts):
+    # Imported lazily: loading MiniLM (or connecting to the shared service) is
+    # only needed once something is actually embedded
+    from tools.nlq_manager import embed_texts
+    return embed_texts(texts)
+
+
+class VectorIndex:
+    """Appendable, memory-mapped matrix of unit vectors keyed by row id.
+
+    Below IVF_MIN_ROWS a search scans every row. Once the index grows past it,
+    IVF_LISTS k-means centroids are trained from a sample and every row is
+    tagged with its nearest centroid; a search then scores only the rows of
+    the IVF_PROBES closest centroids (a few percent of the matrix).
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM, quantize=VECTOR_QUANTIZE):
+        if quantize not in ("float32", "int8"):
+            raise ValueError("VECTOR_QUANTIZE must be 'float32' or 'int8'")
+        self.directory = Path(directory)
+        self.dim = dim
+        self.quantize = quantize
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        self._cache = None   # (count, ids, matrix, scales, assign, lists)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.writing():
+            meta_path = self.directory / "meta.json"
+            if meta_path.exists():
+                meta = json.loads(meta_path.read_text())
+                if meta != self._meta():
+                    self.clear()   # layout changed (e.g. quantization switched): re-embed
+            meta_path.write_text(json.dumps(self._meta()))
+
+    @contextmanager
+    def writing(self):
+        """Exclusive write access across threads and processes (re-entrant within one thread)."""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                self._lock_file = open(self._path("write.lock"), "a")
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _meta(self):
+        return {"dim": self.dim, "quantize": self.quantize}
+
+    def _path(self, name):
+        return self.directory / name
+
+    @property
+    def _vectors_name(self):
+        return "vectors.i8" if self.quantize == "int8" else "vectors.f32"
+
+    def __len__(self):
+        # ids are written last, so they bound the rows that are complete
+        ids_path = self._path("ids.i64")
+        return os.path.getsize(ids_path) // 8 if ids_path.exists() else 0
+
+    @property
+    def last_id(self):
+        n = len(self)
+        if not n:
+            return 0
+        with open(self._path("ids.i64"), "rb") as f:
+            f.seek((n - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype="<i8")[0])
+
+    @property
+    def centroids(self):
+        path = self._path("centroids.f32")
+        return np.fromfile(path, dtype="<f4").reshape(-1, self.dim) if path.exists() else None
+
+    def nbytes(self):
+        return sum(os.path.getsize(p) for p in self.directory.iterdir() if p.suffix != ".json")
+
+    def _write(self, name, array):
+        with open(self._path(name), "ab") as f:
+            f.write(array.tobytes())
+
+    def append(self, ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype="<i8")
+        with self.writing():
+            centroids = self.centroids
+            if self.quantize == "int8":
+                scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12).astype("<f4")
+                self._write(self._vectors_name, np.round(vectors / scales[:, None] * 127).astype(np.int8))
+                self._write("scales.f32", (scales / 127).astype("<f4"))
+            else:
+                self._write(self._vectors_name, vectors.astype("<f4"))
+            if centroids is not None:
+                self._write("assign.i32", np.argmax(vectors @ centroids.T, axis=1).astype("<i4"))
+            self._write("ids.i64", ids)
+            self._cache = None
+            if centroids is None and len(self) >= IVF_MIN_ROWS:
+                self.train()
+
+    def train(self, n_lists=None, sample=20000, iterations=10):
+        """Fit the coarse k-means centroids and (re)assign every row to one."""
+        with self.writing():
+            n, _, matrix, scales, _, _ = self._arrays()
+            n_lists = n_lists or IVF_LISTS
+            if n < n_lists:
+                return
+            rng = np.random.default_rng(0)
+            rows = np.sort(rng.choice(n, size=min(sample, n), replace=False))
+            data = self._rows(matrix, scales, rows)
+            centroids = data[rng.choice(len(data), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                nearest = np.argmax(data @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = data[nearest == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+            # Written under temp names and swapped in, so a crash or a reader never sees a partial assignment
+            tmp_assign, tmp_centroids = self._path("assign.i32.tmp"), self._path("centroids.f32.tmp")
+            with open(tmp_assign, "wb") as f:
+                for lo in range(0, n, SEARCH_CHUNK_ROWS):
+                    block = self._rows(matrix, scales, slice(lo, lo + SEARCH_CHUNK_ROWS))
+                    f.write(np.argmax(block @ centroids.T, axis=1).astype("<i4").tobytes())
+            centroids.astype("<f4").tofile(tmp_centroids)
+            os.replace(tmp_assign, self._path("assign.i32"))
+            os.replace(tmp_centroids, self._path("centroids.f32"))
+            self._cache = None
+
+    def clear(self):
+        with self.writing():
+            for name in ("ids.i64", self._vectors_name, "scales.f32", "assign.i32", "centroids.f32"):
+                if self._path(name).exists():
+                    self._path(name).unlink()
+            self._cache = None
+
+    def _arrays(self):
+        with self._lock:
+            n = len(self)
+            if self._cache is None or self._cache[0] != n:
+                if not n:
+                    self._cache = (0, None, None, None, None, None)
+                else:
+                    ids = np.memmap(self._path("ids.i64"), dtype="<i8", mode="r", shape=(n,))
+                    dtype = np.int8 if self.quantize == "int8" else "<f4"
+                    matrix = np.memmap(self._path(self._vectors_name), dtype=dtype, mode="r", shape=(n, self.dim))
+                    scales = (np.memmap(self._path("scales.f32"), dtype="<f4", mode="r", shape=(n,))
+                              if self.quantize == "int8" else None)
+                    assign = lists = None
+                    if self._path("centroids.f32").exists():
+                        assign = np.fromfile(self._path("assign.i32"), dtype="<i4", count=n)
+                        # Row numbers grouped by centroid, plus each group's offsets
+                        order = np.argsort(assign, kind="stable")
+                        offsets = np.r_[0, np.cumsum(np.bincount(assign, minlength=IVF_LISTS))]
+                        lists = (order, offsets)
+                    self._cache = (n, ids, matrix, scales, assign, lists)
+            return self._cache
+
+    @staticmethod
+    def _rows(matrix, scales, rows):
+        block = np.asarray(matrix[rows], dtype=np.float32)
+        if scales is not None:
+            block *= np.asarray(scales[rows])[:, None]
+        return block
+
+    def search(self, query, k=10, exact=False):
+        """Top-k (ids, cosine scores) for a unit query vector, best first."""
+        n, ids, matrix, scales, _, lists = self._arrays()
+        if not n:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        if lists is not None and not exact:
+            order, offsets = lists
+            probes = np.argsort(-(self.centroids @ query))[:IVF_PROBES]
+            rows = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes]))
+            candidates = rows
+            scores = self._rows(matrix, scales, rows) @ query if len(rows) else np.empty(0, np.float32)
+        else:
+            candidates = None
+            scores = np.empty(n, dtype=np.float32)
+            for lo in range(0, n, SEARCH_CHUNK_ROWS):
+                block = self._rows(matrix, scales, slice(lo, lo + SEARCH_CHUNK_ROWS))
+                scores[lo:lo + len(block)] = block @ query
+        k = min(k, len(scores))
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = candidates[top] if candidates is not None else top
+        return np.asarray(ids[rows]), scores[top]
+
+
+# --- Per-ledger indexes ---
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_root():
+    return Path(db_utils.DB_PATH).parent / "vectors"
+
+
+def get_index(kind):
+    if kind not in LEDGER_LABEL_COLUMNS:
+        raise ValueError(f"Unknown ledger '{kind}'")
+    directory = _index_root() / kind
+    with _indexes_lock:
+        index = _indexes.get(kind)
+        if index is None or index.directory != directory:
+            index = _indexes[kind] = VectorIndex(directory)
+        return index
+
+
+def reset_indexes():
+    """Drop every index (e.g. after a snapshot restore replaced the rows); they re-embed on demand."""
+    with _indexes_lock:
+        _indexes.clear()
+    shutil.rmtree(_index_root(), ignore_errors=True)
+
+
+def _text(label, notes):
+    return f"{label or ''} {notes or ''}".strip()
+
+
+def pending_rows(kind):
+    conn = get_connection()
+    n = conn.execute(f"SELECT COUNT(*) FROM {kind} WHERE id > ?", (get_index(kind).last_id,)).fetchone()[0]
+    conn.close()
+    return n
+
+
+def sync_index(kind, batch_size=EMBED_BATCH_SIZE):
+    """Embed and append every row newer than the last indexed id; returns rows added."""
+    index = get_index(kind)
+    label = LEDGER_LABEL_COLUMNS[kind]
+    added = 0
+    # Another worker may have appended while this one waited: last_id is re-read per batch
+    with index.writing():
+        conn = get_connection()
+        try:
+            while True:
+                sql = f"SELECT id, {label}, notes FROM {kind} WHERE id > ? ORDER BY id LIMIT ?"
+                rows = conn.execute(sql, (index.last_id, batch_size)).fetchall()
+                # Rows archived before the worker reached them are embedded from their archive file
+                archived = list(archive_rows(conn, sql, (index.last_id, batch_size)))
+                if archived:
+                    rows = sorted([*rows, *archived], key=lambda r: r[0])[:batch_size]
+                if not rows:
+                    break
+                vectors = _embed([_text(r[1], r[2]) for r in rows])
+                index.append([r[0] for r in rows], vectors)
+                added += len(rows)
+        finally:
+            conn.close()
+    return added
+
+
+# --- Insert-time embedding ---
+_dirty = set()
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+_worker_errors = []
+
+
+def _embed_loop():
+    while True:
+        _wake.wait()
+        _wake.clear()
+        while _dirty:
+            kind = _dirty.pop()
+            try:
+                sync_index(kind)
+            except Exception as e:   # keep the worker alive; searches report the backlog
+                _worker_errors[:] = [f"{kind}: {e}"]
+
+
+def _on_insert(table, rows):
+    global _worker
+    if table not in LEDGER_LABEL_COLUMNS:
+        return
+    _dirty.add(table)
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_embed_loop, name="vector-index", daemon=True)
+            _worker.start()
+    _wake.set()
+
+
+if SEMANTIC_INDEX_ON_INSERT:
+    register_insert_listener(_on_insert)
+
+
+# --- Search ---
+def semantic_search(q, kind=None, k=10, start=None, end=None, category=None):
+    """Top-k transactions whose description is closest in meaning to `q`."""
+    if not q or not q.strip():
+        raise ValueError("Empty search query")
+    kinds = [kind] if kind else list(LEDGER_LABEL_COLUMNS)
+    if any(kd not in LEDGER_LABEL_COLUMNS for kd in kinds):
+        raise ValueError(f"Unknown ledger '{kind}'")
+    k = max(1, min(int(k), 100))
+    filtered = bool(start or end or category)
+    query = _embed([q])[0]
+
+    results, status = [], {}
+    conn = get_connection()
+    try:
+        for kd in kinds:
+            pending = pending_rows(kd)
+            if 0 < pending <= SYNC_ON_SEARCH_MAX:
+                sync_index(kd)
+                pending = 0
+            elif pending:
+                _on_insert(kd, [])   # let the worker catch up in the background
+            index = get_index(kd)
+            status[kd] = {"indexed": len(index), "pending": pending}
+
+            # Over-fetch when filtering, since filters apply after ranking
+            ids, scores = index.search(query, k * 10 if filtered else k)
+            if not len(ids):
+                continue
+            label = LEDGER_LABEL_COLUMNS[kd]
+            sql = f"SELECT id, date, {label} AS label, notes AS notes, amount FROM {kd} WHERE id IN ({{}})"
+            rows = {r["id"]: dict(r) for r in conn.execute(sql.format(",".join("?" * len(ids))), [int(i) for i in ids])}
+            if len(rows) < len(ids):
+                # The rest were moved to archive partitions (or deleted)
+                missing = [int(i) for i in ids if int(i) not in rows]
+                for r in archive_rows(conn, sql.format(",".join("?" * len(missing))), missing, start, end):
+                    rows[r[0]] = dict(zip(("id", "date", "label", "notes", "amount"), r))
+            for row_id, score in zip(ids.tolist(), scores.tolist()):
+                r = rows.get(row_id)
+                if r is None:
+                    continue
+                if start and r["date"][:10] < start[:10]:
+                    continue
+                if end and r["date"][:10] > end[:10]:
+                    continue
+                if category and str(r["label"]).lower() != category.lower():
+                    continue
+                results.append({"kind": kd, **r, "score": round(score, 4)})
+    finally:
+        conn.close()
+
+    results.sort(key=lambda r: r["score"], reverse=True)
+    response = {"query": q, "results": results[:k], "index": status}
+    if _worker_errors:
+        response["index_error"] = _worker_errors[0]
+    return response
+
+
+def index_stats():
+    stats = {}
+    for kind in LEDGER_LABEL_COLUMNS:
+        index = get_index(kind)
+        stats[kind] = {"rows": len(index), "bytes": index.nbytes(), "quantize": index.quantize,
+                       "pending": pending_rows(kind)}
+    return stats
+
+
+# --- Benchmark ---
+def benchmark(n_rows=300_000, k=10, queries=50):
+    """Latency, size and IVF recall on synthetic clustered unit vectors (no model needed).
+
+    Transaction text is highly repetitive (the same merchants over and over),
+    so the vectors are drawn around a few thousand "merchant" centres.
+    """
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((3000, EMBEDDING_DIM)).astype(np.float32)
+
+    def sample(n):
+        v = centres[rng.integers(len(centres), size=n)] + 0.6 * rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+    probes = sample(queries)
+    results = {}
+    for quantize in ("float32", "int8"):
+        index = VectorIndex(tempfile.mkdtemp(), quantize=quantize)
+        t0 = time.perf_counter()
+        for lo in range(0, n_rows, 50_000):
+            block = sample(min(50_000, n_rows - lo))
+            index.append(np.arange(lo + 1, lo + len(block) + 1), block)
+        build_s = time.perf_counter() - t0
+
+        timings = {"exact": [], "ivf": []}
+        recall = []
+        for q in probes:
+            t0 = time.perf_counter()
+            exact_ids, _ = index.search(q, k, exact=True)
+            timings["exact"].append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            ivf_ids, _ = index.search(q, k)
+            timings["ivf"].append((time.perf_counter() - t0) * 1000)
+            recall.append(len(set(exact_ids.tolist()) & set(ivf_ids.tolist())) / k)
+        results[quantize] = {
+            "rows": n_rows,
+            "mb": round(index.nbytes() / 2 ** 20, 1),
+            "build_s": round(build_s, 1),
+            "exact_median_ms": round(float(np.median(timings["exact"])), 2),
+            "ivf_median_ms": round(float(np.median(timings["ivf"])), 2),
+            f"ivf_recall_at_{k}": round(float(np.mean(recall)), 3),
+        }
+        shutil.rmtree(index.directory, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Semantic transaction index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench")
+    bench.add_argument("--rows", type=int, default=300_000)
+    sub.add_parser("sync")
+    args = parser.parse_args()
+    if args.command == "bench":
+        print(json.dumps(benchmark(args.rows), indent=2))
+    else:
+        print(json.dumps({kind: sync_index(kind) for kind in LEDGER_LABEL_COLUMNS}))
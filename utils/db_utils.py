@@ -1,84 +1,451 @@
 import sqlite3
-import pandas as pd
+import hashlib
+import csv
+import os
+import re
+from datetime import date as _date, timedelta
 from pathlib import Path
 
 # DB_PATH = "/content/db/finance.db" # for Colab
 DB_PATH = Path(__file__).parent.parent / "db" / "finance.db"
+SEED_CSV_PATH = Path(__file__).parent.parent / "data" / "expenses.csv"
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# Bump when the table layout changes; stored in PRAGMA user_version
+SCHEMA_VERSION = 8
+
+# Currency every stored `amount` is expressed in. Rows entered in another
+# currency keep original_amount/currency and are converted at insert time, so
+# aggregates stay plain SUM(amount). The code is inlined into SQL, so only a
+# bare three-letter code is accepted.
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "INR").strip().upper()
+if not re.fullmatch(r"[A-Z]{3}", BASE_CURRENCY):
+    raise ValueError(f"BASE_CURRENCY must be a 3-letter currency code, got {BASE_CURRENCY!r}")
+
+# Column holding the "category" of each ledger table
+LEDGER_LABEL_COLUMNS = {"expenses": "category", "income": "source"}
+
+# Callbacks run after rows are committed, used to keep in-memory indexes current.
+# Each listener is called as fn(table, rows) with rows as a list of dicts. The
+# write has already succeeded, so a failing listener is logged and skipped
+# rather than stopping the others or failing the caller.
+_insert_listeners = []
+
+def register_insert_listener(fn):
+    _insert_listeners.append(fn)
+
+def notify_insert(table, rows):
+    for fn in _insert_listeners:
+        try:
+            fn(table, rows)
+        except Exception as e:
+            print(f"Insert listener {fn.__module__}.{fn.__name__} failed for {table}: {e!r}")
+
+def rows_as_columns(cursor, rows):
+    """Parallel-array form of a result set: {"columns": [...], "data": [[col0...], [col1...]]}.
+
+    Avoids building one dict per row, and the keys are sent once instead of
+    on every row.
+    """
+    columns = [d[0] for d in cursor.description]
+    data = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+    return {"columns": columns, "rows": len(rows), "data": data}
+
+def get_connection(check_same_thread=True):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
+# -------------------
+# Deduplication
+# -------------------
+def content_hash(date, amount, label, notes="", currency=None):
+    """Normalized hash of a transaction used by the unique content_hash index.
+
+    `amount` is the amount as entered; the currency only takes part for
+    non-base currencies so existing hashes stay valid.
+    """
+    parts = [
+        str(date).strip()[:10],
+        f"{float(amount):.2f}",
+        str(label or "").strip().lower(),
+        " ".join(str(notes or "").lower().split()),
+    ]
+    if currency and currency.upper() != BASE_CURRENCY:
+        parts.append(currency.upper())
+    key = "|".join(parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def ensure_content_hash(conn, table, label_column):
+    """Add the content_hash column + unique index to `table` and backfill missing hashes."""
+    columns = {r[1].lower() for r in conn.execute(f"PRAGMA table_info({table})")}
+    if "content_hash" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN content_hash TEXT")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_content_hash ON {table}(content_hash)")
+
+    notes_column = "notes" if "notes" in columns else ("description" if "description" in columns else "''")
+    # Hash the amount as entered, not its base-currency conversion
+    if "original_amount" in columns:
+        amount_column, currency_column = "COALESCE(original_amount, amount)", "currency"
+    else:
+        amount_column, currency_column = "amount", "NULL"
+    cursor = conn.execute(
+        f"SELECT rowid, date, {amount_column}, {label_column}, {notes_column}, {currency_column} FROM {table}"
+        " WHERE content_hash IS NULL"
+    )
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        # OR IGNORE leaves later copies of pre-existing duplicates with a NULL hash
+        conn.executemany(
+            f"UPDATE OR IGNORE {table} SET content_hash = ? WHERE rowid = ?",
+            [(content_hash(r[1], r[2] or 0, r[3], r[4], r[5]), r[0]) for r in rows]
+        )
+
+# Rows whose hash moved to an archive partition (tools/archive_manager.py) are duplicates too
+_NOT_ARCHIVED = " WHERE NOT EXISTS (SELECT 1 FROM archived_hashes WHERE kind = '{kind}' AND content_hash = ?)"
+
+# -------------------
+# Currencies
+# -------------------
+# Rates and conversion live in tools/fx_manager.py; every ledger table carries
+# the entered currency and amount next to the base-currency amount.
+def ensure_currency_columns(conn, table):
+    """Add currency/original_amount/fx_rate to a ledger table; existing rows are base currency."""
+    columns = {r[1].lower() for r in conn.execute(f"PRAGMA table_info({table})")}
+    if "currency" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}'")
+    if "original_amount" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN original_amount REAL")
+    if "fx_rate" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN fx_rate REAL NOT NULL DEFAULT 1")
+    conn.execute(f"UPDATE {table} SET original_amount = amount WHERE original_amount IS NULL")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_currency ON {table}(currency, date) WHERE currency != '{BASE_CURRENCY}'")
+
+def _check_date(value):
+    """Reject dates that do not start with a real YYYY-MM-DD day before they reach the ledgers."""
+    try:
+        _date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}; expected YYYY-MM-DD") from None
+
+# -------------------
+# Schema / startup
+# -------------------
+def init_schema():
+    """Create or migrate every table. Returns True if a migration ran.
+
+    A matching PRAGMA user_version makes this a single read, so it is cheap to
+    call from every worker on startup. BEGIN IMMEDIATE serializes workers that
+    race to migrate the same file.
+    """
+    from tools.anomaly_detector import init_category_stats
+    from tools.archive_manager import init_archive_tables
+    from tools.budget_manager import init_budget_status
+    from tools.fx_manager import init_fx_rates
+
+    Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS expenses (
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        conn.close()
+        return False
+    conn.isolation_level = None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            conn.execute("COMMIT")
+            return False
+        conn.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT)")
+        init_fx_rates(conn)
+        init_db(conn)
+        init_income_table(conn)
+        init_budget_table(conn)
+        init_daily_ledger(conn)
+        init_category_stats(conn)
+        init_budget_status(conn)
+        init_recurring_groups(conn)
+        init_transaction_search(conn)
+        init_archive_tables(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def get_meta(key, default=None):
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    conn.close()
+    return row["value"] if row else default
+
+def set_meta(key, value):
+    conn = get_connection()
+    conn.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)", (key, str(value)))
+    conn.commit()
+    conn.close()
+
+def _migrate_legacy_expenses(conn):
+    """Older builds let pandas replace `expenses` with the raw CSV layout (no id/notes); rebuild it."""
+    columns = {r[1].lower() for r in conn.execute("PRAGMA table_info(expenses)")}
+    if not columns or "id" in columns:
+        return
+    conn.execute("ALTER TABLE expenses RENAME TO expenses_legacy")
+    _create_expenses_table(conn)
+    notes = "notes" if "notes" in columns else ("description" if "description" in columns else "''")
+    conn.execute(f"""
+        INSERT INTO expenses (date, category, notes, amount)
+        SELECT date, category, {notes}, amount FROM expenses_legacy
+    """)
+    conn.execute("DROP TABLE expenses_legacy")
+
+def _create_expenses_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS expenses (
                    id INTEGER PRIMARY KEY AUTOINCREMENT,
                    date TEXT NOT NULL,
                    category TEXT NOT NULL,
                    NOTES TEXT,
                    amount REAL NOT NULL
                    )''')
-    
-    conn.commit()
-    conn.close()
 
-def insert_expense(category, amount, date, notes=""):
+def init_db(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    _migrate_legacy_expenses(conn)
+    _create_expenses_table(conn)
+    ensure_content_hash(conn, "expenses", "category")
+    ensure_currency_columns(conn, "expenses")
+    if own:
+        conn.commit()
+        conn.close()
+
+def insert_expense(category, amount, date, notes="", currency=None):
+    """Insert one expense; returns its id, or None if it was a duplicate."""
+    inserted = insert_expenses_batch([(category, amount, date, notes, currency)])
+    return inserted[0]["id"] if inserted else None
+
+def insert_expenses_batch(rows):
+    """Insert (category, amount, date, notes[, currency]) tuples in one transaction; returns the inserted rows.
+
+    Amounts in another currency are converted with fx_rate and stored in the
+    base currency. Rows whose content hash already exists are skipped, so the
+    number of duplicates is len(rows) - len(returned rows). Rows flagged as unusual for
+    their category carry an "anomaly" entry (see anomaly_detector.apply_category_stats)
+    and rows that push a budget past an alert threshold carry "budget_alerts".
+    """
+    from tools.anomaly_detector import apply_category_stats
+    from tools.budget_manager import apply_budget_windows
+    from tools.fx_manager import to_base
+
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO expenses (category, amount, date, notes) VALUES (?, ?, ?, ?)",
-        (category, amount, date, notes)
-    )
-    conn.commit()
-    conn.close()
+    inserted, rates = [], {}
+    try:
+        for category, amount, date, notes, *currency in rows:
+            _check_date(date)
+            base, rate, cur = to_base(conn, rates, amount, date, currency[0] if currency else None)
+            digest = content_hash(date, amount, category, notes, cur)
+            cursor.execute(
+                "INSERT INTO expenses (category, amount, date, notes, currency, original_amount, fx_rate, content_hash)"
+                " SELECT ?, ?, ?, ?, ?, ?, ?, ?" + _NOT_ARCHIVED.format(kind="expenses") +
+                " ON CONFLICT(content_hash) DO NOTHING",
+                (category, base, date, notes, cur, amount, rate, digest, digest)
+            )
+            if cursor.rowcount == 1:
+                inserted.append({"id": cursor.lastrowid, "date": date, "category": category, "amount": base,
+                                 "notes": notes, "currency": cur, "original_amount": amount})
+        # Budget windows read the ledger as it was before this batch
+        apply_budget_windows(conn, inserted)
+        apply_daily_ledger(conn, "expenses", inserted)
+        apply_category_stats(conn, inserted)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if inserted:
+        notify_insert("expenses", inserted)
+    return inserted
+
+def fetch_expenses(limit=50, as_columns=False):
+    from tools.archive_manager import recent_rows
 
-def fetch_expenses(limit=50):
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM expenses ORDER BY date DESC LIMIT ?", (limit,))
-    rows = cursor.fetchall()
+    if as_columns:
+        conn.row_factory = None
+    cursor, rows = recent_rows(conn, "expenses", "*", limit)
     conn.close()
+    if as_columns:
+        return rows_as_columns(cursor, rows)
     return [dict(r) for r in rows]
 
-def load_mock_data():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_csv("data/expenses.csv")
-    df.to_sql("expenses", conn, if_exists="replace", index=False)
-    conn.close()
+def load_mock_data(force=False, path=None):
+    """Append the seed CSV through the deduplicating insert path.
+
+    Runs only when forced or when the file's checksum differs from the one
+    recorded by the last load, so restarts never touch existing data.
+    """
+    path = Path(path or SEED_CSV_PATH)
+    if not path.exists():
+        return {"status": "skipped", "reason": "seed file not found"}
+    checksum = hashlib.sha256(path.read_bytes()).hexdigest()
+    if not force and get_meta("seed_checksum") == checksum:
+        return {"status": "skipped", "reason": "seed data unchanged"}
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [
+            (r["category"], float(r["amount"]), r["date"], r.get("description") or r.get("notes") or "")
+            for r in csv.DictReader(f)
+        ]
+    inserted = insert_expenses_batch(rows)
+    set_meta("seed_checksum", checksum)
+    return {"status": "loaded", "rows": len(rows), "inserted": len(inserted), "duplicates": len(rows) - len(inserted)}
 
 def get_top_categories(limit=5):
+    # All-time totals are the last prefix sum of each category series, which
+    # also covers archived years
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         """
-        SELECT category, SUM(amount) as total
-        FROM expenses
-        GROUP BY category
+        SELECT category, ROUND(cumulative, 2) as total
+        FROM daily_ledger d
+        WHERE kind = 'expenses' AND category != ?
+          AND day = (SELECT MAX(day) FROM daily_ledger WHERE kind = 'expenses' AND category = d.category)
         ORDER BY total DESC
         LIMIT ?
-        """, (limit,)
+        """, (LEDGER_ALL, limit)
     )
     rows = cursor.fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
-def get_expense_trends():
+# Trend buckets over daily_ledger days; each is labelled with its first day
+TREND_RESOLUTIONS = {
+    "day": "day",
+    "week": "date(day, 'weekday 0', '-6 days')",   # Monday starting the week
+    "month": "substr(day, 1, 7) || '-01'",
+}
+# Default cap on points per series; longer series are downsampled with LTTB (0 = no cap)
+TRENDS_MAX_POINTS = int(os.getenv("TRENDS_MAX_POINTS", "1000"))
+
+def _bucket_bounds(resolution, start, end):
+    """Widen start/end to whole week/month buckets, so no bucket is labelled with a day it does not cover."""
+    try:
+        first = _date.fromisoformat(start[:10]) if start else None
+        last = _date.fromisoformat(end[:10]) if end else None
+    except ValueError:
+        raise ValueError("start and end must be dates (YYYY-MM-DD)") from None
+    if resolution == "week":
+        if first:
+            first -= timedelta(days=first.weekday())
+        if last:
+            last += timedelta(days=6 - last.weekday())
+    elif resolution == "month":
+        if first:
+            first = first.replace(day=1)
+        if last:
+            last = (last.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return (first.isoformat() if first else None), (last.isoformat() if last else None)
+
+def _lttb(rows, threshold):
+    """Largest-Triangle-Three-Buckets: keep `threshold` rows of a (date, ..., total) series.
+
+    The first and last rows always stay; from every bucket in between, the
+    row forming the largest triangle with the previously kept row and the
+    next bucket's average survives, so peaks and dips are preserved.
+    """
+    n = len(rows)
+    if threshold >= n:
+        return rows
+    xs = [_date.fromisoformat(r[0]).toordinal() for r in rows]
+    ys = [r[-1] for r in rows]
+    every = (n - 2) / (threshold - 2)
+    kept, a = [rows[0]], 0
+    for i in range(threshold - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nxt = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[hi:nxt]) / (nxt - hi)
+        avg_y = sum(ys[hi:nxt]) / (nxt - hi)
+        best = max(range(lo, hi), key=lambda j: abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a])))
+        kept.append(rows[best])
+        a = best
+    kept.append(rows[-1])
+    return kept
+
+def get_expense_trends(as_columns=False, resolution="day", start=None, end=None, category=None,
+                       by_category=False, max_points=None):
+    """Expense totals per day/week/month from daily_ledger, optionally per category.
+
+    Each series is capped at `max_points` (TRENDS_MAX_POINTS by default) with
+    LTTB, so the payload stays bounded however long the history is. For week
+    and month buckets, start/end are widened to whole buckets so the first and
+    last totals are never partial.
+    """
+    if resolution not in TREND_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {list(TREND_RESOLUTIONS)}")
+    max_points = TRENDS_MAX_POINTS if max_points is None else max_points
+    if max_points and max_points < 3:
+        raise ValueError("max_points must be at least 3 (or 0 for no limit)")
+    if category and by_category:
+        raise ValueError("category and by_category cannot be combined")
+    start, end = _bucket_bounds(resolution, start, end)
+    where, params = ["kind = 'expenses'"], []
+    if category:
+        where.append("category = ? COLLATE NOCASE")
+        params.append(category)
+    elif by_category:
+        where.append("category != ?")
+        params.append(LEDGER_ALL)
+    else:
+        where.append("category = ?")
+        params.append(LEDGER_ALL)
+    if start:
+        where.append("day >= ?")
+        params.append(start)
+    if end:
+        where.append("day <= ?")
+        params.append(end)
+    series = "category, " if by_category else ""
+
     conn = get_connection()
+    if as_columns:
+        conn.row_factory = None
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT date, SUM(amount) as total
-        FROM expenses
-        GROUP BY date
-        ORDER BY date ASC
-    """)
+    cursor.execute(f"""
+        SELECT {TREND_RESOLUTIONS[resolution]} as date, {series}ROUND(SUM(amount), 2) as total
+        FROM daily_ledger
+        WHERE {' AND '.join(where)}
+        GROUP BY {series}1
+        ORDER BY {series}1
+    """, params)
     rows = cursor.fetchall()
     conn.close()
+    if max_points:
+        if by_category:
+            grouped = {}
+            for r in rows:
+                grouped.setdefault(r[1], []).append(r)
+            rows = sorted((r for g in grouped.values() for r in _lttb(g, max_points)), key=lambda r: (r[0], r[1]))
+        else:
+            rows = _lttb(rows, max_points)
+    elif by_category:
+        rows.sort(key=lambda r: (r[0], r[1]))
+    if as_columns:
+        return rows_as_columns(cursor, rows)
     return [dict(r) for r in rows]
 
-def init_income_table():
-    conn = get_connection()
+def init_income_table(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -90,31 +457,67 @@ def init_income_table():
         notes TEXT
     )
     """)
+    ensure_content_hash(conn, "income", "source")
+    ensure_currency_columns(conn, "income")
 
-    conn.commit()
-    conn.close()
+    if own:
+        conn.commit()
+        conn.close()
+
+def insert_income(source, amount, date, notes="", currency=None):
+    """Insert one income entry; returns its id, or None if it was a duplicate."""
+    inserted = insert_income_batch([(source, amount, date, notes, currency)])
+    return inserted[0]["id"] if inserted else None
+
+def insert_income_batch(rows):
+    """Insert (source, amount, date, notes[, currency]) tuples in one transaction, skipping duplicates."""
+    from tools.fx_manager import to_base
 
-def insert_income(source, amount, date, notes=""):
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO income (source, amount, date, notes) VALUES (?, ?, ?, ?)",
-        (source, amount, date, notes)
-    )
-    conn.commit()
-    conn.close()
+    inserted, rates = [], {}
+    try:
+        for source, amount, date, notes, *currency in rows:
+            _check_date(date)
+            base, rate, cur = to_base(conn, rates, amount, date, currency[0] if currency else None)
+            digest = content_hash(date, amount, source, notes, cur)
+            cursor.execute(
+                "INSERT INTO income (source, amount, date, notes, currency, original_amount, fx_rate, content_hash)"
+                " SELECT ?, ?, ?, ?, ?, ?, ?, ?" + _NOT_ARCHIVED.format(kind="income") +
+                " ON CONFLICT(content_hash) DO NOTHING",
+                (source, base, date, notes, cur, amount, rate, digest, digest)
+            )
+            if cursor.rowcount == 1:
+                inserted.append({"id": cursor.lastrowid, "date": date, "source": source, "amount": base,
+                                 "notes": notes, "currency": cur, "original_amount": amount})
+        apply_daily_ledger(conn, "income", inserted)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if inserted:
+        notify_insert("income", inserted)
+    return inserted
+
+def fetch_income(limit=50, as_columns=False):
+    from tools.archive_manager import recent_rows
 
-def fetch_income(limit=50):
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM income ORDER BY date DESC LIMIT ?", (limit,))
-    rows = cursor.fetchall()
+    if as_columns:
+        conn.row_factory = None
+    cursor, rows = recent_rows(conn, "income", "*", limit)
     conn.close()
+    if as_columns:
+        return rows_as_columns(cursor, rows)
     return [dict(r) for r in rows]
 
 
-def init_budget_table():
-    conn = get_connection()
+def init_budget_table(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -127,19 +530,25 @@ def init_budget_table():
     )
     """)
 
-    conn.commit()
-    conn.close()
+    if own:
+        conn.commit()
+        conn.close()
 
 
 def insert_budget(category, limit_amount, period, start_date):
+    from tools.budget_manager import refresh_budget_status
+
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         "INSERT INTO budgets (category, limit_amount, period, start_date) VALUES (?, ?, ?, ?)",
         (category, limit_amount, period, start_date)
     )
+    budget_id = cursor.lastrowid
+    refresh_budget_status(conn, budget_id)
     conn.commit()
     conn.close()
+    return budget_id
 
 
 def fetch_budgets():
@@ -149,3 +558,180 @@ def fetch_budgets():
     rows = cursor.fetchall()
     conn.close()
     return [dict(r) for r in rows]
+
+
+# -------------------
+# Daily prefix-sum ledger
+# -------------------
+# One row per (kind, category, day) with that day's amount and the running
+# total up to and including it. category = LEDGER_ALL holds the all-category
+# series. Any range total is then two indexed lookups (see tools/prefix_ledger.py).
+LEDGER_ALL = "*"
+
+def init_daily_ledger(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS daily_ledger (
+        kind TEXT NOT NULL,        -- 'expenses' or 'income'
+        category TEXT NOT NULL,    -- category / source, or '*' for all
+        day TEXT NOT NULL,         -- YYYY-MM-DD
+        amount REAL NOT NULL,
+        cumulative REAL NOT NULL,
+        PRIMARY KEY (kind, category, day)
+    )
+    """)
+    if conn.execute("SELECT 1 FROM daily_ledger LIMIT 1").fetchone() is None:
+        rebuild_daily_ledger(conn)
+    if own:
+        conn.commit()
+        conn.close()
+
+def rebuild_daily_ledger(conn, kinds=None):
+    """Recompute the prefix sums from the raw ledgers (archived years included) with window functions."""
+    from tools.archive_manager import archive_rows
+
+    for kind in kinds or LEDGER_LABEL_COLUMNS:
+        label = LEDGER_LABEL_COLUMNS[kind]
+        days = f"SELECT {label} AS category, substr(date, 1, 10) AS day, SUM(amount) AS amount FROM {kind} GROUP BY category, day"
+        archived = list(archive_rows(conn, days))
+        if archived:
+            # Archives are read on their own connections (no ATTACH inside the caller's transaction)
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS ledger_days (category TEXT, day TEXT, amount REAL)")
+            conn.execute("DELETE FROM temp.ledger_days")
+            conn.execute(f"INSERT INTO temp.ledger_days {days}")
+            conn.executemany("INSERT INTO temp.ledger_days VALUES (?, ?, ?)", archived)
+            days = "SELECT category, day, SUM(amount) AS amount FROM temp.ledger_days GROUP BY category, day"
+        conn.execute("DELETE FROM daily_ledger WHERE kind = ?", (kind,))
+        conn.execute(f"""
+            INSERT INTO daily_ledger (kind, category, day, amount, cumulative)
+            SELECT ?, category, day, amount,
+                   SUM(amount) OVER (PARTITION BY category ORDER BY day)
+            FROM ({days})
+        """, (kind,))
+        conn.execute(f"""
+            INSERT INTO daily_ledger (kind, category, day, amount, cumulative)
+            SELECT ?, ?, day, amount, SUM(amount) OVER (ORDER BY day)
+            FROM (SELECT day, SUM(amount) AS amount FROM ({days}) GROUP BY day)
+        """, (kind, LEDGER_ALL))
+
+def apply_daily_ledger(conn, kind, rows):
+    """Fold newly inserted rows into the prefix sums inside the caller's transaction.
+
+    Rows are first aggregated per (category, day), so a batch costs one upsert
+    plus one range update per distinct key; backdated days shift the running
+    totals of every later day in that series.
+    """
+    label = LEDGER_LABEL_COLUMNS[kind]
+    deltas = {}
+    for r in rows:
+        day = str(r["date"])[:10]
+        amount = float(r["amount"] or 0)
+        for category in (r[label], LEDGER_ALL):
+            deltas[(category, day)] = deltas.get((category, day), 0.0) + amount
+    for (category, day), amount in deltas.items():
+        conn.execute("""
+            INSERT OR IGNORE INTO daily_ledger (kind, category, day, amount, cumulative)
+            VALUES (?, ?, ?, 0, COALESCE((
+                SELECT cumulative FROM daily_ledger
+                WHERE kind = ? AND category = ? AND day < ?
+                ORDER BY day DESC LIMIT 1), 0))
+        """, (kind, category, day, kind, category, day))
+        conn.execute("""
+            UPDATE daily_ledger
+            SET amount = amount + CASE WHEN day = ? THEN ? ELSE 0 END,
+                cumulative = cumulative + ?
+            WHERE kind = ? AND category = ? AND day >= ?
+        """, (day, amount, amount, kind, category, day))
+
+
+def ledger_range_total(conn, kind, start=None, end=None, category=None):
+    """Total of `kind` between two inclusive ISO dates from two prefix-sum lookups."""
+    if start and end and start[:10] > end[:10]:
+        return 0
+    category = category or LEDGER_ALL
+    upper = conn.execute("""
+        SELECT cumulative FROM daily_ledger
+        WHERE kind = ? AND category = ? AND day <= ?
+        ORDER BY day DESC LIMIT 1
+    """, (kind, category, end[:10] if end else "9999-12-31")).fetchone()
+    lower = conn.execute("""
+        SELECT cumulative FROM daily_ledger
+        WHERE kind = ? AND category = ? AND day < ?
+        ORDER BY day DESC LIMIT 1
+    """, (kind, category, start[:10])).fetchone() if start else None
+    return round((upper[0] if upper else 0) - (lower[0] if lower else 0), 2)
+
+# -------------------
+# Recurring payment groups
+# -------------------
+# One row per (normalized merchant, amount band) with running interval
+# statistics; maintained by tools/recurring_detector.py.
+def init_recurring_groups(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS recurring_groups (
+        key TEXT PRIMARY KEY,          -- merchant|amount band
+        merchant TEXT NOT NULL,
+        category TEXT,
+        amount_band INTEGER NOT NULL,
+        n INTEGER NOT NULL,            -- occurrences
+        amount_mean REAL NOT NULL,
+        first_date TEXT NOT NULL,
+        last_date TEXT NOT NULL,
+        interval_n INTEGER NOT NULL DEFAULT 0,
+        interval_mean REAL NOT NULL DEFAULT 0,
+        interval_m2 REAL NOT NULL DEFAULT 0,
+        dirty INTEGER NOT NULL DEFAULT 0   -- set when a backdated row arrives
+    )
+    """)
+    if own:
+        conn.commit()
+        conn.close()
+
+# -------------------
+# Full-text search
+# -------------------
+# External-content FTS5 indexes over the ledger text, kept in sync by
+# triggers so every write path (inserts, snapshot restores, re-rating) is
+# covered. Prefix indexes on 2/3 characters make `ube*` queries cheap.
+# Archive partitions carry the same index over their own rows.
+FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+def init_transaction_search(conn=None):
+    own = conn is None
+    if own:
+        conn = get_connection()
+    for table, label in LEDGER_LABEL_COLUMNS.items():
+        fts = f"{table}_fts"
+        created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone() is None
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                notes, {label},
+                content='{table}', content_rowid='id', {FTS_OPTIONS}
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, notes, {label}) VALUES (new.id, new.notes, new.{label});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, notes, {label}) VALUES ('delete', old.id, old.notes, old.{label});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF notes, {label} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, notes, {label}) VALUES ('delete', old.id, old.notes, old.{label});
+                INSERT INTO {fts} (rowid, notes, {label}) VALUES (new.id, new.notes, new.{label});
+            END
+        """)
+        if created:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    if own:
+        conn.commit()
+        conn.close()